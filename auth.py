@@ -3,19 +3,19 @@ from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from typing import Optional
 from datetime import datetime, timedelta
-from database import SessionLocal
+from sqlalchemy import true
+from sqlalchemy.ext.asyncio import AsyncSession
+import models
+from database import get_db
+from request_timing import timed_phase
 from crud import get_user_by_username
-import os
-from dotenv import load_dotenv
-from passlib.context import CryptContext
-
-load_dotenv()
-
-# Создаём контекст для хеширования паролей
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from principal_cache import get_cached_claims, cache_claims, get_cached_principal, cache_principal
+from settings import settings
+# Единый контекст хеширования паролей живёт в password_service
+from password_service import verify_and_update
 
 # Конфигурация JWT
-SECRET_KEY = os.getenv("SECRET_KEY", "default_secret_key")
+SECRET_KEY = settings.secret_key
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
@@ -38,6 +38,18 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+async def verify_password_and_rehash(db, user, plain_password: str) -> bool:
+    """
+    Проверяет пароль пользователя. Если хеш дешевле текущей стоимости bcrypt,
+    прозрачно сохраняет новый хеш с текущей стоимостью.
+    """
+    valid, new_hash = await verify_and_update(plain_password, user.hashed_password)
+    if valid and new_hash:
+        user.hashed_password = new_hash
+        await db.commit()
+        print(f"Пароль пользователя id={user.id} перехеширован с новой стоимостью bcrypt")
+    return valid
+
 # Вспомогательная функция для получения токена из разных источников
 async def get_token_from_request(
     request: Request, 
@@ -77,7 +89,13 @@ async def get_token_from_request(
     print("Токен не найден")
     return None
 
-async def get_current_user(request: Request, token: Optional[str] = Depends(get_token_from_request)):
+# db — та же сессия, что получит обработчик запроса (см. database.get_db)
+@timed_phase("auth")
+async def get_current_user(
+    request: Request,
+    token: Optional[str] = Depends(get_token_from_request),
+    db: AsyncSession = Depends(get_db)
+):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Не удалось проверить учетные данные",
@@ -105,49 +123,67 @@ async def get_current_user(request: Request, token: Optional[str] = Depends(get_
             )
             return temp_user
     
-    try:
-        print(f"Попытка декодирования токена: {token[:10]}...")
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        print(f"Токен декодирован успешно. Содержимое: {payload}")
-        username: str = payload.get("sub")
-        user_id: int = payload.get("id")
-        user_role: str = payload.get("role")
-        print(f"Извлеченные данные: username={username}, id={user_id}, role={user_role}")
-        
-        if username is None:
-            print("Ошибка: отсутствует поле 'sub' в токене")
+    # Сначала ищем уже декодированные claims в кеше по хешу токена
+    payload = get_cached_claims(token)
+    if payload is None:
+        try:
+            print(f"Попытка декодирования токена: {token[:10]}...")
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+            print(f"Токен декодирован успешно. Содержимое: {payload}")
+        except JWTError as e:
+            print(f"Ошибка при декодировании JWT: {e}")
             raise credentials_exception
-            
-        token_data = TokenData(username=username, user_id=user_id)
-    except JWTError as e:
-        print(f"Ошибка при декодировании JWT: {e}")
+        cache_claims(token, payload)
+
+    username: str = payload.get("sub")
+    user_id: int = payload.get("id")
+    user_role: str = payload.get("role")
+    print(f"Извлеченные данные: username={username}, id={user_id}, role={user_role}")
+
+    if username is None:
+        print("Ошибка: отсутствует поле 'sub' в токене")
         raise credentials_exception
+
+    token_data = TokenData(username=username, user_id=user_id)
+
+    # Пользователь из кеша: снимок полей, по которому создаём отдельный объект на каждый запрос.
+    # Если имя в токене не совпадает с закешированным, идём в БД, как и раньше
+    cached_user = get_cached_principal(token_data.user_id)
+    if cached_user is not None and cached_user["username"] == token_data.username:
+        from models import User
+        return User(**cached_user)
     
-    db = SessionLocal()
-    try:
-        user = get_user_by_username(db, username=token_data.username)
-        if user is None:
-            print(f"Пользователь с username={token_data.username} не найден в БД")
-            
-            # Особый случай для суперадмина
-            if "superadmin" in token_data.username:
-                print("Создание объекта пользователя для суперадмина")
-                from models import User
-                return User(
-                    id=user_id or -1,
-                    username=username,
-                    email=username,
-                    role="superadmin"
-                )
-            
-            raise credentials_exception
+    user = await get_user_by_username(db, username=token_data.username)
+    if user is None:
+        print(f"Пользователь с username={token_data.username} не найден в БД")
+        
+        # Особый случай для суперадмина
+        if "superadmin" in token_data.username:
+            print("Создание объекта пользователя для суперадмина")
+            from models import User
+            return User(
+                id=user_id or -1,
+                username=username,
+                email=username,
+                role="superadmin"
+            )
         
-        print(f"Пользователь найден: id={user.id}, role={user.role}")
-        return user
-    finally:
-        db.close()
+        raise credentials_exception
+    
+    print(f"Пользователь найден: id={user.id}, role={user.role}")
+    cache_principal(user)
+    return user
 
 # Вспомогательная функция для проверки прав доступа к контактам других пользователей
+def contact_access_filter(user):
+    """
+    Те же правила, что в check_contact_access, в виде условия для SQL-запроса по контактам:
+    выборка списком сразу ограничивается доступными контактами, без фильтрации в Python.
+    """
+    if user.role in ("superadmin", "admin"):
+        return true()
+    return models.Contact.user_id == user.id
+
 def check_contact_access(user, contact_user_id):
     """
     Проверяет, имеет ли пользователь доступ к контакту другого пользователя
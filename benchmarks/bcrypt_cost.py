@@ -0,0 +1,30 @@
+"""
+Таблица стоимости bcrypt на текущем CPU.
+
+Запуск из корня проекта:
+    python -m benchmarks.bcrypt_cost [--min 8] [--max 14] [--target-ms 250]
+"""
+import argparse
+import password_service
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Замер времени bcrypt для разных стоимостей")
+    parser.add_argument("--min", type=int, default=password_service.BCRYPT_MIN_ROUNDS)
+    parser.add_argument("--max", type=int, default=password_service.BCRYPT_MAX_ROUNDS)
+    parser.add_argument("--target-ms", type=float, default=password_service.BCRYPT_TARGET_MS)
+    args = parser.parse_args()
+
+    table = password_service.benchmark(args.min, args.max)
+    print(f"{'rounds':>6}  {'ms':>9}  budget {args.target_ms:.0f} ms")
+    chosen = None
+    for rounds, ms in table:
+        fits = ms <= args.target_ms
+        if fits:
+            chosen = rounds
+        print(f"{rounds:>6}  {ms:>9.1f}  {'ok' if fits else '-'}")
+    print(f"Выбранная стоимость: {chosen if chosen is not None else args.min}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Память и скорость экспорта контактов: потоковый contacts_io.export_contacts против
+выборки всего списка сразу (как GET /contacts/?limit=N).
+
+Создаётся тестовый пользователь с N контактами (по 2 телефона, generate_series),
+затем для каждого варианта — один проход без трассировки (время) и один под
+tracemalloc (пик памяти Python). Тело ответа только считается, не накапливается.
+В конце тестовый пользователь и его контакты удаляются.
+Данные коммитятся (экспорт читает своей сессией), поэтому запускать только на dev/staging базе.
+
+    python -m benchmarks.contact_export
+    python -m benchmarks.contact_export --contacts 20000
+"""
+import argparse
+import asyncio
+import time
+import tracemalloc
+
+import orjson
+from sqlalchemy import select, text
+
+import contacts_io
+import crud
+import models
+from database import AsyncSessionLocal, engine
+from serialization import dump_contacts
+
+SEED_USER = "bench_export_user"
+
+SEED_SQL = [
+    """
+    INSERT INTO contacts (user_id, first_name, last_name, email, birthday, extra_info)
+    SELECT :user_id, 'Name' || (g % 997), 'Last' || g, 'export' || g || '@example.com',
+           DATE '1970-01-01' + (g * 37 % 20000), CASE WHEN g % 3 = 0 THEN 'note' END
+    FROM generate_series(1, :contacts) AS g
+    """,
+    """
+    INSERT INTO phone_numbers (contact_id, number, normalized_number, label)
+    SELECT c.id, '+38050' || lpad((c.id * 10 + n)::text, 7, '0'), '38050' || lpad((c.id * 10 + n)::text, 7, '0'),
+           CASE n WHEN 1 THEN 'mobile' ELSE 'work' END
+    FROM contacts c CROSS JOIN generate_series(1, 2) AS n
+    WHERE c.user_id = :user_id
+    """,
+    "ANALYZE contacts",
+    "ANALYZE phone_numbers",
+]
+
+CLEANUP_SQL = [
+    "DELETE FROM phone_numbers WHERE contact_id IN (SELECT id FROM contacts WHERE user_id = :user_id)",
+    "DELETE FROM contacts WHERE user_id = :user_id",
+    "DELETE FROM users WHERE id = :user_id",
+]
+
+
+async def load_all(user_id: int) -> int:
+    """Как GET /contacts/?limit=N: все ORM-объекты со связями, затем JSON целиком."""
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(models.Contact).options(*crud.contact_relationships())
+            .where(models.Contact.user_id == user_id)
+            .order_by(models.Contact.first_name, models.Contact.id)
+        )
+        return len(orjson.dumps(dump_contacts(result.scalars().all())))
+
+
+async def stream(user_id: int, fmt: str) -> int:
+    size = 0
+    async for chunk in contacts_io.export_contacts(AsyncSessionLocal, [models.Contact.user_id == user_id], fmt):
+        size += len(chunk)
+    return size
+
+
+async def measure(coro_factory) -> tuple:
+    """(секунд, байт ответа, пик памяти в МБ)."""
+    start = time.perf_counter()
+    size = await coro_factory()
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    await coro_factory()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, size, peak / 2 ** 20
+
+
+async def run(user_id: int) -> list:
+    """(вариант, секунд, байт, пик МБ) — всё в одном event loop, с общим пулом соединений."""
+    variants = [("всё сразу: ORM + JSON", lambda: load_all(user_id))]
+    variants += [(f"export {fmt}", lambda fmt=fmt: stream(user_id, fmt)) for fmt in contacts_io.EXPORT_FORMATS]
+    return [(label, *await measure(factory)) for label, factory in variants]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Потоковый экспорт контактов против выборки целиком")
+    parser.add_argument("--contacts", type=int, default=100_000)
+    args = parser.parse_args()
+
+    with engine.begin() as connection:
+        # Остатки прерванного запуска
+        stale = connection.execute(text("SELECT id FROM users WHERE username = :name"), {"name": SEED_USER}).scalar()
+        if stale is not None:
+            for sql in CLEANUP_SQL:
+                connection.execute(text(sql), {"user_id": stale})
+        user_id = connection.execute(text(
+            "INSERT INTO users (username, email, hashed_password, role) "
+            "VALUES (:name, :name || '@example.com', 'x', 'user') RETURNING id"
+        ), {"name": SEED_USER}).scalar()
+    try:
+        with engine.begin() as connection:
+            for sql in SEED_SQL:
+                connection.execute(text(sql), {"user_id": user_id, "contacts": args.contacts})
+
+        results = asyncio.run(run(user_id))
+    finally:
+        with engine.begin() as connection:
+            for sql in CLEANUP_SQL:
+                connection.execute(text(sql), {"user_id": user_id})
+
+    print(f"{args.contacts} контактов, по 2 телефона")
+    print(f"  {'вариант':<26}{'с':>8}{'контактов/с':>14}{'МБ ответа':>12}{'пик МБ':>10}")
+    for label, elapsed, size, peak in results:
+        print(f"  {label:<26}{elapsed:>8.1f}{args.contacts / elapsed:>14,.0f}{size / 2 ** 20:>12.1f}{peak:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Скорость массового импорта контактов (contacts_io.import_contacts) против поштучного
+crud.create_contact, которым раньше пользовался POST /contacts/.
+
+Создаётся тестовый пользователь, в памяти генерируется CSV на N контактов (по 1–2 телефона),
+импорт выполняется так же, как в POST /contacts/import (пачки, одна транзакция). Затем
+поштучно создаётся --baseline контактов, и их время пересчитывается на N.
+В конце тестовый пользователь и его контакты удаляются.
+Данные коммитятся (так работает импорт), поэтому запускать только на dev/staging базе.
+
+    python -m benchmarks.contact_import
+    python -m benchmarks.contact_import --contacts 20000 --baseline 100
+"""
+import argparse
+import asyncio
+import csv
+import io
+import time
+from datetime import date, timedelta
+
+from sqlalchemy import text
+
+import contacts_io
+import crud
+import schemas
+from database import AsyncSessionLocal, engine
+
+SEED_USER = "bench_import_user"
+
+CLEANUP_SQL = [
+    "DELETE FROM phone_numbers WHERE contact_id IN (SELECT id FROM contacts WHERE user_id = :user_id)",
+    "DELETE FROM contacts WHERE user_id = :user_id",
+    "DELETE FROM users WHERE id = :user_id",
+]
+
+
+def make_csv(count: int) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(contacts_io.CSV_COLUMNS)
+    for i in range(1, count + 1):
+        phones = f"mobile:+38050{i:07d}" + (f"; work:+1555{i:07d}" if i % 2 else "")
+        writer.writerow([f"Name{i % 997}", f"Last{i}", f"import{i}@example.com",
+                         (date(1970, 1, 1) + timedelta(days=i * 37 % 20000)).isoformat(),
+                         "note" if i % 3 == 0 else "", phones])
+    return buffer.getvalue().encode()
+
+
+async def run(data: bytes, baseline: int, user_id: int) -> tuple:
+    """(отчёт импорта, секунд на импорт, секунд на baseline контактов поштучно)."""
+    async with AsyncSessionLocal() as db:
+        start = time.perf_counter()
+        report = await contacts_io.import_contacts(db, io.BytesIO(data), "csv", user_id)
+        imported = time.perf_counter() - start
+
+    async with AsyncSessionLocal() as db:
+        # Статистика после импорта, как её обновил бы autovacuum, — иначе поштучные
+        # вставки идут по планам для пустых таблиц
+        await db.execute(text("ANALYZE contacts"))
+        await db.execute(text("ANALYZE phone_numbers"))
+        start = time.perf_counter()
+        for i in range(baseline):
+            await crud.create_contact(db, user_id, schemas.ContactCreate(
+                user_id=user_id, first_name=f"Base{i}", last_name="Line", email=f"base{i}@example.com",
+                birthday=date(1980, 1, 1), phone_numbers=[{"number": f"+38067{i:07d}", "label": "mobile"}],
+            ))
+        one_by_one = time.perf_counter() - start
+    return report, imported, one_by_one
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Массовый импорт контактов против поштучного создания")
+    parser.add_argument("--contacts", type=int, default=100_000)
+    parser.add_argument("--baseline", type=int, default=200, help="сколько контактов создать поштучно")
+    args = parser.parse_args()
+
+    with engine.begin() as connection:
+        # Остатки прерванного запуска
+        stale = connection.execute(text("SELECT id FROM users WHERE username = :name"), {"name": SEED_USER}).scalar()
+        if stale is not None:
+            for sql in CLEANUP_SQL:
+                connection.execute(text(sql), {"user_id": stale})
+        user_id = connection.execute(text(
+            "INSERT INTO users (username, email, hashed_password, role) "
+            "VALUES (:name, :name || '@example.com', 'x', 'user') RETURNING id"
+        ), {"name": SEED_USER}).scalar()
+    try:
+        report, imported, baseline = asyncio.run(run(make_csv(args.contacts), args.baseline, user_id))
+
+        with engine.connect() as connection:
+            phones, indexed = connection.execute(text(
+                "SELECT count(p.id), count(*) FILTER (WHERE c.search_vector @@ to_tsquery('simple', p.normalized_number)) "
+                "FROM contacts c JOIN phone_numbers p ON p.contact_id = c.id WHERE c.user_id = :user_id"
+            ), {"user_id": user_id}).one()
+    finally:
+        with engine.begin() as connection:
+            for sql in CLEANUP_SQL:
+                connection.execute(text(sql), {"user_id": user_id})
+
+    print(f"Импорт CSV: {report['imported']} контактов ({report['failed']} отклонено), {phones} телефонов "
+          f"(в search_vector: {indexed}) за {imported:.1f} с — {args.contacts / imported:,.0f} контактов/с")
+    per_contact = baseline / args.baseline
+    print(f"Поштучно crud.create_contact: {args.baseline} за {baseline:.1f} с — "
+          f"{per_contact * 1000:.1f} мс на контакт, {args.contacts} контактов ≈ {per_contact * args.contacts / 60:.0f} мин")
+
+
+if __name__ == "__main__":
+    main()
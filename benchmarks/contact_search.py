@@ -0,0 +1,179 @@
+"""
+Задержка поиска контактов с индексами поиска и без них.
+
+В одной транзакции засевается N контактов (по умолчанию 1 млн) одного тестового
+пользователя, выполняется ANALYZE, затем запросы поиска из приложения замеряются дважды:
+  - поиск подстроки (crud.contact_search_filter): страница read_contacts и подсчёт совпадений;
+  - полнотекстовый поиск (crud.fulltext_search_query): страница /contacts/fulltext.
+Режимы:
+  - "с индексами" — как есть (триграммные индексы нужны миграция 4 и pg_trgm,
+    GIN по search_vector — миграция 5);
+  - "без индексов" — индексы поиска удаляются внутри той же транзакции.
+В конце транзакция откатывается: контакты и индексы остаются как были.
+
+DROP INDEX держит эксклюзивную блокировку contacts до конца транзакции,
+поэтому запускать только на dev/staging базе.
+
+    python -m benchmarks.contact_search
+    python -m benchmarks.contact_search --contacts 200000 --repeat 5
+
+Полнотекстовый поиск должен укладываться в FULLTEXT_SEARCH_TIMEOUT_MS с запасом:
+в выводе отмечены запросы, медиана которых превышает половину этого предела.
+"""
+import argparse
+import statistics
+import time
+
+from sqlalchemy import func, select, text, true
+
+import crud
+import models
+from database import engine
+from migrations import TRIGRAM_INDEXES
+from settings import settings
+
+SEED_USER = "bench_search_user"
+
+# Имена и домены повторяются, как в реальной базе: частые подстроки дают тысячи совпадений
+SEED_SQL = """
+    INSERT INTO contacts (user_id, first_name, last_name, email, birthday)
+    SELECT :user_id,
+           (ARRAY['Alexander', 'Maria', 'Ivan', 'Olga', 'Dmitry', 'Anna', 'Sergey', 'Elena',
+                  'Nikolai', 'Tatiana', 'Pavel', 'Natalia', 'Mikhail', 'Irina', 'Andrey'])[g % 15 + 1],
+           'Surname' || md5(g::text),
+           'user' || g || '@' || (ARRAY['example.com', 'mail.test', 'corp.local', 'inbox.dev'])[g % 4 + 1],
+           DATE '1950-01-01' + (g % 25000)
+    FROM generate_series(1, :contacts) AS g
+"""
+
+# (описание, подстрока). None — редкая фамилия одной конкретной строки
+SEARCH_TERMS = [
+    ("частое имя", "olga"),
+    ("домен email", "corp.local"),
+    ("редкая фамилия", None),
+    ("нет совпадений", "zzqxw"),
+]
+
+FULLTEXT_TERMS = [
+    ("частое имя", "olga"),
+    ("имя и домен", "ivan inbox"),
+    ("префикс фамилии", None),
+    ("нет совпадений", "zzqxw"),
+]
+
+
+def page_query(term: str):
+    # Та же форма, что у read_contacts: фильтр поиска, сортировка по имени, первая страница
+    return (
+        select(models.Contact.__table__)
+        .where(crud.contact_search_filter(term))
+        .order_by(models.Contact.first_name, models.Contact.id)
+        .limit(100)
+    )
+
+
+def count_query(term: str):
+    return select(func.count()).select_from(models.Contact).where(crud.contact_search_filter(term))
+
+
+def fulltext_page_query(term: str):
+    # Суперадмин: без ограничения доступа, как самый тяжёлый случай
+    return crud.fulltext_search_query(term, true(), 0, 20)
+
+
+def measure(connection, query, repeat: int):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        connection.execute(query).fetchall()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def run_terms(connection, terms, repeat):
+    results = {}
+    for label, term in terms:
+        results[label] = (
+            measure(connection, page_query(term), repeat),
+            measure(connection, count_query(term), repeat),
+            connection.execute(count_query(term)).scalar(),
+        )
+    return results
+
+
+def run_fulltext(connection, terms, repeat):
+    return {label: measure(connection, fulltext_page_query(term), repeat) for label, term in terms}
+
+
+def search_indexes_present(connection) -> list:
+    names = [name for name, _, _ in TRIGRAM_INDEXES] + ["ix_contacts_search_vector"]
+    return connection.execute(
+        text("SELECT indexname FROM pg_indexes WHERE indexname = ANY(:names)"), {"names": names}
+    ).scalars().all()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Поиск контактов: индексы поиска против перебора")
+    parser.add_argument("--contacts", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=7, help="повторов каждого запроса (берётся медиана)")
+    args = parser.parse_args()
+
+    with engine.connect() as connection:
+        transaction = connection.begin()
+        try:
+            user_id = connection.execute(text(
+                "INSERT INTO users (username, email, hashed_password, role) "
+                "VALUES (:name, :name || '@example.com', 'x', 'user') RETURNING id"
+            ), {"name": SEED_USER}).scalar()
+            start = time.perf_counter()
+            connection.execute(text(SEED_SQL), {"user_id": user_id, "contacts": args.contacts})
+            connection.execute(text("ANALYZE contacts"))
+            print(f"Засеяно {args.contacts} контактов за {time.perf_counter() - start:.1f} с")
+
+            last_name = connection.execute(text(
+                "SELECT last_name FROM contacts WHERE user_id = :user_id LIMIT 1"
+            ), {"user_id": user_id}).scalar()
+            # Подстрока из середины md5 и префикс фамилии (полнотекстовый поиск ищет по началу слова)
+            terms = [(label, term or last_name[9:17]) for label, term in SEARCH_TERMS]
+            fulltext_terms = [(label, term or last_name[:11].lower()) for label, term in FULLTEXT_TERMS]
+
+            present = search_indexes_present(connection)
+            trigram = [name for name in present if name != "ix_contacts_search_vector"]
+            with_indexes = run_terms(connection, terms, args.repeat) if trigram else None
+            fulltext_with_index = run_fulltext(connection, fulltext_terms, args.repeat) \
+                if "ix_contacts_search_vector" in present else None
+            if not trigram:
+                print("Триграммных индексов нет (pg_trgm недоступен или миграция 4 не применена) — "
+                      "поиск подстроки замеряется только без индексов")
+
+            for name in present:
+                connection.execute(text(f"DROP INDEX {name}"))
+            connection.execute(text("ANALYZE contacts"))
+            without_indexes = run_terms(connection, terms, args.repeat)
+            fulltext_without_index = run_fulltext(connection, fulltext_terms, args.repeat)
+        finally:
+            transaction.rollback()
+
+    print(f"\nМедиана из {args.repeat} повторов, мс (страница 100 строк / подсчёт совпадений)")
+    print(f"  {'запрос':<28}{'совпадений':>12}{'без индексов':>24}{'с индексами':>24}")
+    for label, term in terms:
+        page_before, count_before, matches = without_indexes[label]
+        line = f"  {label + ' (' + term + ')':<28}{matches:>12}{page_before:>11.1f} /{count_before:>10.1f}"
+        if with_indexes:
+            page_after, count_after, _ = with_indexes[label]
+            line += f"{page_after:>11.1f} /{count_after:>10.1f}"
+        print(line)
+
+    budget = settings.fulltext_search_timeout_ms
+    print(f"\nПолнотекстовый поиск, страница 20 строк, мс (предел FULLTEXT_SEARCH_TIMEOUT_MS={budget})")
+    print(f"  {'запрос':<28}{'без индекса':>14}{'с индексом':>14}")
+    for label, term in fulltext_terms:
+        line = f"  {label + ' (' + term + ')':<28}{fulltext_without_index[label]:>14.1f}"
+        if fulltext_with_index:
+            after = fulltext_with_index[label]
+            line += f"{after:>14.1f}" + ("  <- больше половины предела" if after > budget / 2 else "")
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Пропускная способность GET /contacts/ при параллельных запросах.
+
+Скрипт бьёт в уже запущенный сервер, поэтому сравнение "до/после" делается так:
+поднять приложение на нужном коммите (uvicorn main:app) и прогнать одну и ту же команду.
+
+    python -m benchmarks.contacts_throughput --url http://localhost:8000 \
+        --username user --password pass --concurrency 50 --requests 2000
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+
+async def get_token(client: httpx.AsyncClient, username: str, password: str) -> str:
+    response = await client.post("/token", data={"username": username, "password": password})
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+
+async def worker(client, path, headers, queue, latencies, errors):
+    while True:
+        try:
+            queue.get_nowait()
+        except asyncio.QueueEmpty:
+            return
+        start = time.perf_counter()
+        try:
+            response = await client.get(path, headers=headers)
+            if response.status_code != 200:
+                errors.append(response.status_code)
+        except httpx.HTTPError as e:
+            errors.append(type(e).__name__)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+
+async def run(args):
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=60) as client:
+        token = await get_token(client, args.username, args.password)
+        headers = {"Authorization": f"Bearer {token}"}
+
+        # Прогрев: кеш авторизации и пул соединений
+        for _ in range(min(10, args.requests)):
+            await client.get(args.path, headers=headers)
+
+        queue = asyncio.Queue()
+        for _ in range(args.requests):
+            queue.put_nowait(None)
+        latencies, errors = [], []
+
+        start = time.perf_counter()
+        await asyncio.gather(*[
+            worker(client, args.path, headers, queue, latencies, errors)
+            for _ in range(args.concurrency)
+        ])
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    p = lambda q: latencies[min(len(latencies) - 1, int(len(latencies) * q))]
+    print(f"GET {args.path}: {args.requests} запросов, параллельно {args.concurrency}")
+    print(f"  время        {elapsed:.2f} с")
+    print(f"  throughput   {args.requests / elapsed:.1f} req/s")
+    print(f"  latency p50  {p(0.50):.1f} мс, p95 {p(0.95):.1f} мс, p99 {p(0.99):.1f} мс, "
+          f"mean {statistics.mean(latencies):.1f} мс")
+    print(f"  ошибки       {len(errors)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный замер GET /contacts/")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--path", default="/contacts/")
+    parser.add_argument("--username", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=2000)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
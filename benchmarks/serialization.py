@@ -0,0 +1,101 @@
+"""
+Время сериализации списка контактов в JSON: путь response_model против serialization.py.
+
+Контакты создаются в памяти как ORM-объекты (со связями, как после
+crud.contact_relationships), база не нужна. Сравниваются:
+  - «было»: schemas.Contact.model_validate на каждый контакт в эндпоинте, затем
+    повторная валидация и сериализация FastAPI по response_model и json.dumps
+    (так отдавали /contacts/grouped и /contacts/grouped/birthdays);
+  - response_model: ORM-объекты сразу в FastAPI (так отдавали /contacts/ и дни рождения);
+  - TypeAdapter: одна валидация кешированным TypeAdapter(List[Contact]) и dump_json;
+  - dump_contacts + orjson: serialization.dump_contacts и ORJSONResponse — текущий путь.
+
+    python -m benchmarks.serialization
+    python -m benchmarks.serialization --contacts 50000 --repeat 3
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from datetime import date, timedelta
+from typing import List
+
+from fastapi.routing import serialize_response
+from fastapi.responses import JSONResponse
+from fastapi.utils import create_model_field
+from pydantic import TypeAdapter
+
+import models
+import schemas
+from serialization import dump_contacts, json_response
+
+
+def make_contacts(count: int) -> list:
+    groups = [models.Group(id=g, name=f"group{g}") for g in range(1, 11)]
+    contacts = []
+    for i in range(1, count + 1):
+        contact = models.Contact(
+            id=i, user_id=i % 100 + 1, first_name=f"Name{i % 997}", last_name=f"Last{i}",
+            email=f"c{i}@example.com", birthday=date(1970, 1, 1) + timedelta(days=i * 37 % 20000),
+            extra_info="note" if i % 3 == 0 else None,
+        )
+        contact.phone_numbers = [
+            models.PhoneNumber(id=i * 2 + n, number=f"+38050{i:07d}", label="mobile") for n in range(2)
+        ]
+        contact.avatars = [models.Avatar(id=i, file_path=f"avatars/{i}.png", is_main=1, show=1)] if i % 3 == 0 else []
+        contact.photos = []
+        contact.groups = [groups[i % 10]]
+        contacts.append(contact)
+    return contacts
+
+
+def response_model_body(field, content) -> bytes:
+    # То же, что делает FastAPI для response_model: валидация, сериализация, JSONResponse
+    body = asyncio.run(serialize_response(field=field, response_content=content, is_coroutine=True))
+    return JSONResponse(body).body
+
+
+def measure(func, repeat: int) -> float:
+    func()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сериализация списка контактов в JSON")
+    parser.add_argument("--contacts", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=5, help="повторов каждого варианта (берётся медиана)")
+    args = parser.parse_args()
+
+    contacts = make_contacts(args.contacts)
+    field = create_model_field(name="Response", type_=List[schemas.Contact], mode="serialization")
+    adapter = TypeAdapter(List[schemas.Contact])
+
+    variants = [
+        ("было: model_validate + response_model", lambda: response_model_body(
+            field, [schemas.Contact.model_validate(c, from_attributes=True) for c in contacts])),
+        ("response_model", lambda: response_model_body(field, contacts)),
+        ("TypeAdapter (одна валидация)", lambda: adapter.dump_json(
+            adapter.validate_python(contacts, from_attributes=True))),
+        ("dump_contacts + orjson", lambda: json_response(dump_contacts(contacts)).body),
+    ]
+
+    # Все варианты должны отдавать один и тот же JSON
+    reference = json.loads(variants[0][1]())
+    for label, func in variants[1:]:
+        assert json.loads(func()) == reference, f"{label}: JSON отличается"
+
+    print(f"Медиана из {args.repeat} повторов, {args.contacts} контактов")
+    print(f"  {'вариант':<40}{'мс':>10}{'мс на 10k':>12}")
+    for label, func in variants:
+        elapsed = measure(func, args.repeat)
+        print(f"  {label:<40}{elapsed:>10.1f}{elapsed * 10_000 / args.contacts:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
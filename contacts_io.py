@@ -0,0 +1,307 @@
+"""
+Импорт контактов из CSV и vCard и потоковый экспорт в NDJSON, CSV и vCard.
+
+Загрузка FastAPI уже лежит во временном файле; он читается построчно генератором,
+строки проверяются теми же схемами, что и POST /contacts/ (schemas.ContactCreate,
+PhoneNumberCreate), и вставляются пачками по IMPORT_BATCH_SIZE через
+crud.bulk_create_contacts: id из последовательности одним запросом, затем
+многострочные INSERT контактов и их телефонов. Разбор и проверка пачки идут в пуле потоков,
+чтобы не держать event loop. Всё в одной транзакции; строки с ошибками пропускаются
+и попадают в отчёт.
+
+CSV — заголовок first_name,last_name,email,birthday,extra_info,phone_numbers
+(обязательны first_name, email, birthday; лишние колонки игнорируются).
+phone_numbers — номера через ";", с меткой — "mobile:+380501234567".
+vCard 3.0/4.0 — N (или FN), EMAIL, BDAY, TEL (TYPE — метка), NOTE -> extra_info.
+
+Экспорт читает контакты серверным курсором (AsyncSession.stream с yield_per) и отдаёт
+файл кусками по EXPORT_CHUNK_SIZE контактов: в памяти только текущая пачка, сколько бы
+контактов ни было. CSV и vCard пишутся в тех же форматах, что принимает импорт.
+
+Замер: python -m benchmarks.contact_import, python -m benchmarks.contact_export
+"""
+import csv
+import io
+import itertools
+import re
+from typing import AsyncIterator, Iterator, Optional
+
+import orjson
+from pydantic import ValidationError
+from sqlalchemy import select
+from starlette.concurrency import run_in_threadpool
+
+import crud
+import models
+import schemas
+from serialization import ContactFieldset, dump_contacts
+
+IMPORT_BATCH_SIZE = 2000
+# В отчёт попадают первые ошибки, дальше — только счётчик failed
+MAX_REPORTED_ERRORS = 1000
+
+FORMATS = ("csv", "vcard")
+CSV_COLUMNS = ("first_name", "last_name", "email", "birthday", "extra_info", "phone_numbers")
+CSV_REQUIRED_COLUMNS = ("first_name", "email", "birthday")
+
+# Метки телефонов vCard, которые не несут смысла для пользователя
+VCARD_IGNORED_TYPES = {"voice", "pref", "internet", "x400"}
+VCARD_LABELS = {"cell": "mobile"}
+
+EXPORT_FORMATS = ("ndjson", "csv", "vcard")
+EXPORT_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+    "vcard": "text/vcard; charset=utf-8",
+}
+EXPORT_EXTENSIONS = {"ndjson": "ndjson", "csv": "csv", "vcard": "vcf"}
+# Контактов в одной выборке курсора (yield_per) и в одном куске ответа
+EXPORT_CHUNK_SIZE = 1000
+
+
+class ImportFormatError(ValueError):
+    """Файл целиком не разбирается (формат, кодировка, заголовок) — ответ 400, а не отчёт по строкам."""
+
+
+def detect_format(fmt: Optional[str], filename: Optional[str], content_type: Optional[str]) -> str:
+    if fmt:
+        if fmt not in FORMATS:
+            raise ImportFormatError(f"Неизвестный формат {fmt}, допустимые: {', '.join(FORMATS)}")
+        return fmt
+    name = (filename or "").lower()
+    if name.endswith((".vcf", ".vcard")) or (content_type or "").startswith(("text/vcard", "text/x-vcard")):
+        return "vcard"
+    if name.endswith(".csv") or (content_type or "").startswith("text/csv"):
+        return "csv"
+    raise ImportFormatError("Не удалось определить формат по имени файла, укажите format=csv или format=vcard")
+
+
+def parse_phone_list(value: Optional[str]) -> list:
+    """'mobile:+380 50 123 45 67; +1 555 0100' -> [{number, label}, ...]."""
+    phones = []
+    for item in (value or "").split(";"):
+        item = item.strip()
+        if item:
+            label, _, number = item.rpartition(":")
+            phones.append({"number": number.strip(), "label": label.strip() or None})
+    return phones
+
+
+def read_csv(stream) -> Iterator[tuple]:
+    """(номер строки файла, данные контакта) для каждой записи CSV."""
+    reader = csv.DictReader(stream)
+    missing = [column for column in CSV_REQUIRED_COLUMNS if column not in (reader.fieldnames or ())]
+    if missing:
+        raise ImportFormatError(f"В заголовке CSV нет колонок: {', '.join(missing)}")
+    for record in reader:
+        data = {column: record.get(column) or None for column in CSV_COLUMNS[:-1]}
+        data["phone_numbers"] = parse_phone_list(record.get("phone_numbers"))
+        yield reader.line_num, data
+
+
+def _unfold(stream) -> Iterator[str]:
+    # Продолжение свойства начинается с пробела или табуляции (RFC 6350, 3.2)
+    current = None
+    for raw in stream:
+        line = raw.rstrip("\r\n")
+        if line[:1] in (" ", "\t") and current is not None:
+            current += line[1:]
+            continue
+        if current:
+            yield current
+        current = line
+    if current:
+        yield current
+
+
+def _unescape(value: str) -> str:
+    return re.sub(r"\\(.)", lambda m: "\n" if m.group(1) in "nN" else m.group(1), value)
+
+
+def _split_components(value: str) -> list:
+    # Компоненты N разделены неэкранированной ";"
+    return [_unescape(part).strip() for part in re.split(r"(?<!\\);", value)]
+
+
+def _vcard_label(params: list) -> Optional[str]:
+    types = []
+    for param in params:
+        key, _, value = param.partition("=")
+        # vCard 2.1: TEL;CELL:..., 3.0/4.0: TEL;TYPE=cell,voice:...
+        values = value if value else key
+        if value and key.upper() != "TYPE":
+            continue
+        types += [t.strip('"').lower() for t in values.split(",")]
+    for kind in types:
+        if kind and kind not in VCARD_IGNORED_TYPES:
+            return VCARD_LABELS.get(kind, kind)
+    return None
+
+
+def _vcard_birthday(value: str) -> str:
+    # 19900102 и 1990-01-02T00:00:00 -> 1990-01-02; без года (--0102) остаётся как есть и не пройдёт проверку
+    value = value.strip()
+    if re.fullmatch(r"\d{8}", value):
+        return f"{value[:4]}-{value[4:6]}-{value[6:]}"
+    return value[:10]
+
+
+def read_vcard(stream) -> Iterator[tuple]:
+    """(номер карточки, данные контакта) для каждой BEGIN:VCARD ... END:VCARD."""
+    card_number, card = 0, None
+    for line in _unfold(stream):
+        name_params, _, value = line.partition(":")
+        name, *params = name_params.split(";")
+        # Группа свойства (item1.TEL) не важна
+        name = name.rsplit(".", 1)[-1].upper()
+        if name == "BEGIN" and value.strip().upper() == "VCARD":
+            card_number += 1
+            card = {"first_name": None, "last_name": None, "email": None, "birthday": None,
+                    "extra_info": None, "phone_numbers": [], "fn": None}
+        elif card is None:
+            continue
+        elif name == "END":
+            full_name = card.pop("fn")
+            if not card["first_name"] and full_name:
+                first, _, last = full_name.partition(" ")
+                card["first_name"], card["last_name"] = first, last or card["last_name"]
+            yield card_number, card
+            card = None
+        elif name == "N":
+            components = _split_components(value) + ["", ""]
+            card["last_name"], card["first_name"] = components[0] or None, components[1] or None
+        elif name == "FN":
+            card["fn"] = _unescape(value).strip()
+        elif name == "EMAIL" and not card["email"]:
+            card["email"] = value.strip()
+        elif name == "BDAY":
+            card["birthday"] = _vcard_birthday(value)
+        elif name == "TEL":
+            number = value.strip()
+            if number.lower().startswith("tel:"):
+                number = number[4:]
+            card["phone_numbers"].append({"number": number, "label": _vcard_label(params)})
+        elif name == "NOTE":
+            card["extra_info"] = _unescape(value)
+
+
+def _error_message(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in item['loc'])}: {item['msg']}" for item in error.errors()
+    )
+
+
+def _next_batch(rows: Iterator[tuple], user_id: int, report: dict) -> Optional[list]:
+    """Следующие IMPORT_BATCH_SIZE строк: проверенные контакты; ошибки — в report. None — файл закончился."""
+    chunk = list(itertools.islice(rows, IMPORT_BATCH_SIZE))
+    if not chunk:
+        return None
+    contacts = []
+    for row, data in chunk:
+        try:
+            contacts.append(schemas.ContactCreate.model_validate({**data, "user_id": user_id}))
+        except ValidationError as e:
+            report["failed"] += 1
+            if len(report["errors"]) < MAX_REPORTED_ERRORS:
+                report["errors"].append({"row": row, "error": _error_message(e)})
+    return contacts
+
+
+async def import_contacts(db, fileobj, fmt: str, user_id: int) -> dict:
+    """
+    Импорт файла fileobj (бинарный, UTF-8) в контакты пользователя user_id.
+    Возвращает отчёт {imported, failed, errors: [{row, error}]}; коммит — здесь же, одним разом.
+    """
+    stream = io.TextIOWrapper(fileobj, encoding="utf-8-sig", newline="")
+    rows = read_csv(stream) if fmt == "csv" else read_vcard(stream)
+    report = {"imported": 0, "failed": 0, "errors": []}
+    try:
+        while (contacts := await run_in_threadpool(_next_batch, rows, user_id, report)) is not None:
+            report["imported"] += await crud.bulk_create_contacts(db, user_id, contacts)
+    except UnicodeDecodeError:
+        raise ImportFormatError("Файл должен быть в кодировке UTF-8")
+    finally:
+        # Не закрываем сам файл загрузки — им владеет FastAPI
+        stream.detach()
+    await db.commit()
+    return report
+
+
+def format_phone_list(phones) -> str:
+    """Обратное к parse_phone_list: 'mobile:+380501234567; +15550100'."""
+    return "; ".join(f"{pn.label}:{pn.number}" if pn.label else pn.number for pn in phones)
+
+
+def write_csv(contacts, header: bool = False) -> str:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(CSV_COLUMNS)
+    for contact in contacts:
+        writer.writerow([getattr(contact, column) for column in CSV_COLUMNS[:-1]]
+                        + [format_phone_list(contact.phone_numbers)])
+    return buffer.getvalue()
+
+
+def _escape(value: str) -> str:
+    # Обратное к _unescape; \r заменяется, иначе при чтении он разорвёт строку
+    value = value.replace("\\", "\\\\").replace("\r\n", "\n").replace("\r", "\n")
+    return value.replace("\n", "\\n").replace(",", "\\,").replace(";", "\\;")
+
+
+def write_vcard(contacts) -> str:
+    """Карточки vCard 3.0; строки не сворачиваются (RFC 6350 это только рекомендует)."""
+    lines = []
+    for contact in contacts:
+        first, last = contact.first_name or "", contact.last_name or ""
+        lines += ["BEGIN:VCARD", "VERSION:3.0", f"N:{_escape(last)};{_escape(first)};;;",
+                  f"FN:{_escape(' '.join(filter(None, (first, last))))}"]
+        if contact.email:
+            lines.append(f"EMAIL:{contact.email}")
+        if contact.birthday:
+            lines.append(f"BDAY:{contact.birthday.isoformat()}")
+        for pn in contact.phone_numbers:
+            # ; : , и кавычки в метке сломали бы разбор параметров
+            label = re.sub(r'[;:,"]+', " ", pn.label or "").strip()
+            lines.append(f"TEL;TYPE={label}:{pn.number}" if label else f"TEL:{pn.number}")
+        if contact.extra_info:
+            lines.append(f"NOTE:{_escape(contact.extra_info)}")
+        lines.append("END:VCARD")
+    return "".join(f"{line}\r\n" for line in lines)
+
+
+def write_ndjson(contacts, fieldset: ContactFieldset) -> bytes:
+    return b"".join(orjson.dumps(item) + b"\n" for item in dump_contacts(contacts, fieldset))
+
+
+async def export_contacts(session_factory, filters, fmt: str,
+                          fieldset: Optional[ContactFieldset] = None) -> AsyncIterator[bytes]:
+    """
+    Файл экспорта кусками для StreamingResponse. filters — условия на Contact (доступ
+    уже в них), порядок — по имени, как в списке контактов, по индексу без сортировки.
+    Сессия своя: зависимость get_db закрывается раньше, чем отдаётся тело ответа.
+    fieldset (fields=, include=) действует только для ndjson; CSV и vCard — колонки импорта.
+    """
+    if fmt == "ndjson":
+        fieldset = fieldset or ContactFieldset()
+        options = fieldset.load_options()
+    else:
+        options = crud.contact_load_options(crud.CONTACT_FIELDS, ("phone_numbers",))
+    query = (
+        select(models.Contact)
+        .options(*options)
+        .where(*filters)
+        .order_by(models.Contact.first_name, models.Contact.id)
+        .execution_options(yield_per=EXPORT_CHUNK_SIZE)
+    )
+    if fmt == "csv":
+        yield write_csv((), header=True).encode()
+    async with session_factory() as db:
+        result = await db.stream(query)
+        async for contacts in result.scalars().partitions():
+            if fmt == "ndjson":
+                yield write_ndjson(contacts, fieldset)
+            elif fmt == "csv":
+                yield write_csv(contacts).encode()
+            else:
+                yield write_vcard(contacts).encode()
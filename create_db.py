@@ -1,19 +1,16 @@
 import psycopg2
-import os
-from dotenv import load_dotenv
 import re
 import logging
+from settings import settings
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-load_dotenv()
-
 # Получаем параметры подключения к базе данных
 def get_db_params():
     # Первый приоритет: DATABASE_URL (например, от Render.com)
-    database_url = os.getenv("DATABASE_URL")
+    database_url = settings.database_url
     
     if database_url:
         # Для совместимости, если URL начинается с 'postgres://',
@@ -42,11 +39,11 @@ def get_db_params():
             }
     
     # Второй приоритет: отдельные переменные окружения
-    db_name = os.getenv('DB_NAME')
-    db_user = os.getenv('DB_USER')
-    db_password = os.getenv('DB_PASSWORD')
-    db_host = os.getenv('DB_HOST', 'postgres')  # По умолчанию используем 'postgres' для Docker
-    db_port = os.getenv('DB_PORT', '5432')
+    db_name = settings.db_name
+    db_user = settings.db_user
+    db_password = settings.db_password
+    db_host = settings.db_host or 'postgres'  # По умолчанию используем 'postgres' для Docker
+    db_port = settings.db_port
     
     return {
         'host': db_host,
@@ -1,53 +1,121 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import or_, and_, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import Integer, or_, any_, case, func, literal, select, delete, text, update
+from sqlalchemy.dialects.postgresql import ARRAY
 from datetime import date, timedelta
+import re
 import models, schemas
 from sqlalchemy.exc import IntegrityError
+from principal_cache import invalidate_user
+from utils_phone import normalize_phone_number
 
 # USERS CRUD
 
-def get_user_by_username(db: Session, username: str):
-    return db.query(models.User).filter(models.User.username == username).first()
+async def get_user_by_username(db: AsyncSession, username: str):
+    result = await db.execute(select(models.User).where(models.User.username == username))
+    return result.scalars().first()
 
-def get_user_by_id(db: Session, user_id: int):
-    return db.query(models.User).filter(models.User.id == user_id).first()
+async def get_user_by_id(db: AsyncSession, user_id: int):
+    result = await db.execute(select(models.User).where(models.User.id == user_id))
+    return result.scalars().first()
 
-def update_user_role(db: Session, user_id: int, role: str):
+async def update_user_role(db: AsyncSession, user_id: int, role: str):
     """Обновляет роль пользователя."""
-    db_user = db.query(models.User).filter(models.User.id == user_id).first()
+    db_user = await get_user_by_id(db, user_id)
     if not db_user:
         return None
-    
+
     # Проверка валидности роли
     if role not in ['user', 'admin', 'superadmin']:
         raise ValueError("Invalid role. Must be 'user', 'admin' or 'superadmin'")
-    
+
     db_user.role = role
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
+    # Роль изменилась — закешированный пользователь больше не актуален
+    invalidate_user(user_id)
     return db_user
 
 # CONTACTS CRUD
 
-from sqlalchemy.orm import joinedload
+from sqlalchemy.orm import load_only, selectinload
+
+# Поля и связи schemas.Contact, которые можно выбрать параметрами fields= и include=
+# (id отдаётся всегда)
+CONTACT_FIELDS = ("first_name", "last_name", "email", "birthday", "extra_info")
+CONTACT_RELATIONSHIPS = ("phone_numbers", "avatars", "photos", "groups")
+
+# Связи контакта, которые отдаёт schemas.Contact. В async-сессии ленивая загрузка
+# невозможна, поэтому все запросы, отдающие контакты (списки и один контакт), грузят
+# их заранее — отдельным запросом на связь для всей выборки (WHERE contact_id IN ...)
+def contact_relationships(include=CONTACT_RELATIONSHIPS):
+    return tuple(selectinload(getattr(models.Contact, name)) for name in include)
+
+def contact_load_options(fields=CONTACT_FIELDS, include=CONTACT_RELATIONSHIPS, required=()):
+    """
+    Загрузка только запрошенных колонок (load_only) и связей (без лишних selectinload).
+    required — колонки, нужные самому эндпоинту, даже если их нет в ответе (курсор, группировка).
+    """
+    columns = dict.fromkeys(("id", *fields, *required))
+    return (load_only(*(getattr(models.Contact, name) for name in columns)), *contact_relationships(include))
+
+# Дни рождения сравниваются по Contact.birthday_md (MMDD) — по нему есть индексы
 
-def get_contact(db: Session, contact_id: int):
+def month_day(d: date) -> int:
+    return d.month * 100 + d.day
+
+def birthday_window(start: date, days: int):
+    """Условие «день рождения с start по start + days включительно» с переходом через Новый год."""
+    if days >= 365:
+        return models.Contact.birthday_md.isnot(None)
+    start_md = month_day(start)
+    end_md = month_day(start + timedelta(days=days))
+    if start_md <= end_md:
+        return models.Contact.birthday_md.between(start_md, end_md)
+    # Окно захватывает 31 декабря: два диапазона по индексу (BitmapOr)
+    return or_(models.Contact.birthday_md >= start_md, models.Contact.birthday_md <= end_md)
+
+def in_birthday_window(birthday_md, start: date, days: int) -> bool:
+    """То же условие, что birthday_window, для уже загруженного Contact.birthday_md."""
+    if birthday_md is None:
+        return False
+    if days >= 365:
+        return True
+    start_md = month_day(start)
+    end_md = month_day(start + timedelta(days=days))
+    if start_md <= end_md:
+        return start_md <= birthday_md <= end_md
+    return birthday_md >= start_md or birthday_md <= end_md
+
+def birthday_order(start: date):
+    """Ближайшие первыми: сначала оставшиеся в этом году, затем с начала следующего."""
     return (
-        db.query(models.Contact)
-        .options(
-            joinedload(models.Contact.phone_numbers),
-            joinedload(models.Contact.avatars),
-            joinedload(models.Contact.photos),
-            joinedload(models.Contact.groups),
-        )
-        .filter(models.Contact.id == contact_id)
-        .first()
+        case((models.Contact.birthday_md < month_day(start), 1), else_=0),
+        models.Contact.birthday_md,
+        models.Contact.id,
+    )
+
+async def get_contact(db: AsyncSession, contact_id: int):
+    # Те же selectinload, что и у списков: четыре joinedload давали декартово
+    # произведение телефонов, аватаров, фото и групп в одном результате
+    result = await db.execute(
+        select(models.Contact)
+        .options(*contact_relationships())
+        .where(models.Contact.id == contact_id)
+        # Перечитываем связи, даже если объект уже есть в сессии (аналог db.refresh)
+        .execution_options(populate_existing=True)
     )
+    return result.scalars().first()
 
-def get_contacts(db: Session, user_id: int, skip: int = 0, limit: int = 100):
-    return db.query(models.Contact).filter(models.Contact.user_id == user_id).offset(skip).limit(limit).all()
+async def get_contacts(db: AsyncSession, user_id: int, skip: int = 0, limit: int = 100):
+    result = await db.execute(
+        select(models.Contact)
+        .options(*contact_relationships())
+        .where(models.Contact.user_id == user_id)
+        .offset(skip).limit(limit)
+    )
+    return result.scalars().all()
 
-def create_contact(db: Session, user_id: int, contact: schemas.ContactCreate):
+async def create_contact(db: AsyncSession, user_id: int, contact: schemas.ContactCreate):
     db_contact = models.Contact(
         user_id=user_id,
         first_name=contact.first_name,
@@ -57,102 +125,335 @@ def create_contact(db: Session, user_id: int, contact: schemas.ContactCreate):
         extra_info=contact.extra_info
     )
     # Add groups
+    groups = []
     if getattr(contact, 'group_ids', None):
-        groups = db.query(models.Group).filter(models.Group.id.in_(contact.group_ids)).all()
-        db_contact.groups = groups
+        result = await db.execute(select(models.Group).where(models.Group.id.in_(contact.group_ids)))
+        groups = result.scalars().all()
+    db_contact.groups = groups
     db.add(db_contact)
     try:
-        db.flush()  # get db_contact.id
+        await db.flush()  # get db_contact.id
     except IntegrityError as e:
-        db.rollback()
+        await db.rollback()
         raise ValueError(f"Email already exists: {contact.email}")
     # Add phone numbers
     for pn in getattr(contact, 'phone_numbers', []):
-        db_pn = models.PhoneNumber(number=pn.number, label=pn.label, contact_id=db_contact.id)
+        db_pn = models.PhoneNumber(number=pn.number, normalized_number=normalize_phone_number(pn.number),
+                                   label=pn.label, contact_id=db_contact.id)
         db.add(db_pn)
-    db.commit()
-    db.refresh(db_contact)
-    return db_contact
+    await db.commit()
+    return await get_contact(db, db_contact.id)
 
-def update_contact(db: Session, contact_id: int, contact: schemas.ContactUpdate):
-    db_contact = db.query(models.Contact).filter(models.Contact.id == contact_id).first()
+# Пачка строк одним INSERT: столбцы передаются массивами и разворачиваются unnest() —
+# запрос маленький и один на пачку, поэтому statement-level триггер search_vector
+# на phone_numbers срабатывает один раз, а не на каждую строку
+BULK_INSERT_CONTACTS_SQL = text("""
+    INSERT INTO contacts (id, user_id, first_name, last_name, email, birthday, extra_info)
+    SELECT c.id, CAST(:user_id AS integer), c.first_name, c.last_name, c.email, c.birthday, c.extra_info
+    FROM unnest(CAST(:ids AS integer[]), CAST(:first_names AS text[]), CAST(:last_names AS text[]),
+                CAST(:emails AS text[]), CAST(:birthdays AS date[]), CAST(:extra_infos AS text[]))
+         AS c(id, first_name, last_name, email, birthday, extra_info)
+""")
+BULK_INSERT_PHONES_SQL = text("""
+    INSERT INTO phone_numbers (contact_id, number, normalized_number, label)
+    SELECT * FROM unnest(CAST(:contact_ids AS integer[]), CAST(:numbers AS text[]),
+                         CAST(:normalized_numbers AS text[]), CAST(:labels AS text[]))
+""")
+
+async def bulk_create_contacts(db: AsyncSession, user_id: int, contacts):
+    """
+    Пакетное создание проверенных контактов (schemas.ContactCreate) без ORM-объектов.
+    id берутся заранее из последовательности одним запросом — по ним телефоны привязываются
+    к контактам без поштучного INSERT ... RETURNING. Коммит — на вызывающем.
+    Возвращает число созданных контактов.
+    """
+    if not contacts:
+        return 0
+    contact_ids = (await db.execute(
+        select(func.nextval(func.pg_get_serial_sequence("contacts", "id")))
+        .select_from(func.generate_series(1, len(contacts)))
+    )).scalars().all()
+    await db.execute(BULK_INSERT_CONTACTS_SQL, {
+        "user_id": user_id,
+        "ids": contact_ids,
+        "first_names": [c.first_name for c in contacts],
+        "last_names": [c.last_name for c in contacts],
+        "emails": [c.email for c in contacts],
+        "birthdays": [c.birthday for c in contacts],
+        "extra_infos": [c.extra_info for c in contacts],
+    })
+    phones = [(contact_id, pn) for contact_id, c in zip(contact_ids, contacts) for pn in c.phone_numbers]
+    if phones:
+        await db.execute(BULK_INSERT_PHONES_SQL, {
+            "contact_ids": [contact_id for contact_id, _ in phones],
+            "numbers": [pn.number for _, pn in phones],
+            "normalized_numbers": [normalize_phone_number(pn.number) for _, pn in phones],
+            "labels": [pn.label for _, pn in phones],
+        })
+    return len(contact_ids)
+
+async def update_contact(db: AsyncSession, contact_id: int, contact: schemas.ContactUpdate):
+    # Грузим контакт вместе со связями: присваивание groups требует загруженной коллекции
+    db_contact = await get_contact(db, contact_id)
     if not db_contact:
         return None
-    for field, value in contact.dict(exclude_unset=True).items():
+    for field, value in contact.model_dump(exclude_unset=True).items():
         if field == "phone_numbers" and value is not None:
-            db.query(models.PhoneNumber).filter(models.PhoneNumber.contact_id == contact_id).delete()
+            await db.execute(delete(models.PhoneNumber).where(models.PhoneNumber.contact_id == contact_id))
             for pn in value:
                 # Исправление: поддержка dict и схемы
                 if isinstance(pn, dict):
                     pn = schemas.PhoneNumberCreate(**pn)
-                db_pn = models.PhoneNumber(number=pn.number, label=pn.label, contact_id=contact_id)
+                db_pn = models.PhoneNumber(number=pn.number, normalized_number=normalize_phone_number(pn.number),
+                                           label=pn.label, contact_id=contact_id)
                 db.add(db_pn)
         elif field == "group_ids" and value is not None:
-            groups = db.query(models.Group).filter(models.Group.id.in_(value)).all()
-            db_contact.groups = groups
+            result = await db.execute(select(models.Group).where(models.Group.id.in_(value)))
+            db_contact.groups = result.scalars().all()
         else:
             setattr(db_contact, field, value)
-    db.commit()
-    db.refresh(db_contact)
-    return db_contact
+    await db.commit()
+    return await get_contact(db, contact_id)
 
-def delete_contact(db: Session, contact_id: int):
-    db_contact = db.query(models.Contact).filter(models.Contact.id == contact_id).first()
+async def delete_contact(db: AsyncSession, contact_id: int):
+    # Связи нужны загруженными: каскадное удаление в async не может грузить их лениво
+    db_contact = await get_contact(db, contact_id)
     if not db_contact:
         return None
-    db.delete(db_contact)
-    db.commit()
+    await db.delete(db_contact)
+    await db.commit()
     return db_contact
 
-def search_contacts(db: Session, query: str):
-    query = f"%{query}%"
-    return db.query(models.Contact).filter(
-        or_(models.Contact.first_name.ilike(query),
-            models.Contact.last_name.ilike(query),
-            models.Contact.email.ilike(query))
-    ).all()
+# Пакетные операции (/contacts/batch/...). Выбранные id получаются одним запросом с фильтром
+# доступа и блокируются, дальше каждое действие — один оператор по массиву id. Коммит — один
 
-def contacts_with_upcoming_birthdays(db: Session):
-    today = date.today()
-    in_seven_days = today + timedelta(days=7)
-    # Check only month and day, ignore year
-    return db.query(models.Contact).filter(
-        or_(
-            and_(func.extract('month', models.Contact.birthday) == today.month,
-                 func.extract('day', models.Contact.birthday) >= today.day),
-            and_(func.extract('month', models.Contact.birthday) == in_seven_days.month,
-                 func.extract('day', models.Contact.birthday) <= in_seven_days.day)
+BATCH_ADD_GROUPS_SQL = text("""
+    INSERT INTO contact_group (contact_id, group_id)
+    SELECT c.id, g.id
+    FROM unnest(CAST(:contact_ids AS integer[])) AS c(id)
+    JOIN groups g ON g.id = ANY(CAST(:group_ids AS integer[]))
+    ON CONFLICT DO NOTHING
+""")
+
+def _any_id(ids):
+    # = ANY(массив): один параметр вместо IN с тысячами
+    return any_(literal(ids, ARRAY(Integer)))
+
+async def batch_contact_ids(db: AsyncSession, selection: schemas.ContactBatchFilter, access_filter) -> list:
+    """
+    id контактов по selection (ids и/или фильтр), доступных по access_filter, под FOR UPDATE.
+    Порядок по id — параллельные пакеты блокируют строки в одном порядке и не взаимоблокируются.
+    """
+    query = select(models.Contact.id).where(access_filter)
+    if selection.ids is not None:
+        query = query.where(models.Contact.id == _any_id(selection.ids))
+    if selection.search:
+        query = query.where(contact_search_filter(selection.search))
+    if selection.user_id is not None:
+        query = query.where(models.Contact.user_id == selection.user_id)
+    if selection.group_id is not None:
+        query = query.where(models.Contact.id.in_(
+            select(models.contact_group.c.contact_id).where(models.contact_group.c.group_id == selection.group_id)
+        ))
+    result = await db.execute(query.order_by(models.Contact.id).with_for_update())
+    return result.scalars().all()
+
+def _batch_result(selection: schemas.ContactBatchFilter, contact_ids: list) -> dict:
+    missing = sorted(set(selection.ids) - set(contact_ids)) if selection.ids is not None else []
+    return {"matched": len(contact_ids), "missing_ids": missing}
+
+async def batch_delete_contacts(db: AsyncSession, selection: schemas.ContactBatchFilter, access_filter) -> dict:
+    """Удаление выбранных контактов вместе с телефонами, аватарами, фото и членством в группах."""
+    contact_ids = await batch_contact_ids(db, selection, access_filter)
+    report = _batch_result(selection, contact_ids)
+    if contact_ids:
+        ids = _any_id(contact_ids)
+        # Внешние ключи без ON DELETE CASCADE: сначала зависимые строки
+        for model in (models.PhoneNumber, models.Avatar, models.Photo):
+            await db.execute(delete(model).where(model.contact_id == ids), execution_options={"synchronize_session": False})
+        await db.execute(delete(models.contact_group).where(models.contact_group.c.contact_id == ids))
+        result = await db.execute(delete(models.Contact).where(models.Contact.id == ids),
+                                  execution_options={"synchronize_session": False})
+        report["deleted"] = result.rowcount
+    await db.commit()
+    return report
+
+async def batch_update_contacts(db: AsyncSession, batch: schemas.ContactBatchUpdate, access_filter) -> dict:
+    """
+    Поля из batch.patch — всем выбранным контактам одним UPDATE; группы add_group_ids
+    добавляются (несуществующие пропускаются, как в create_contact), remove_group_ids снимаются.
+    """
+    contact_ids = await batch_contact_ids(db, batch, access_filter)
+    report = _batch_result(batch, contact_ids)
+    if contact_ids:
+        ids = _any_id(contact_ids)
+        values = batch.patch.model_dump(exclude_unset=True) if batch.patch else {}
+        if values:
+            result = await db.execute(update(models.Contact).where(models.Contact.id == ids).values(**values),
+                                      execution_options={"synchronize_session": False})
+            report["updated"] = result.rowcount
+        if batch.add_group_ids:
+            result = await db.execute(BATCH_ADD_GROUPS_SQL, {"contact_ids": contact_ids, "group_ids": batch.add_group_ids})
+            report["groups_added"] = result.rowcount
+        if batch.remove_group_ids:
+            result = await db.execute(delete(models.contact_group).where(
+                models.contact_group.c.contact_id == ids,
+                models.contact_group.c.group_id.in_(batch.remove_group_ids),
+            ))
+            report["groups_removed"] = result.rowcount
+    await db.commit()
+    return report
+
+async def top_contacts_per_user(db: AsyncSession, user_ids, per_user: int, order_by, *filters, options=None):
+    """
+    Первые per_user контактов каждого пользователя одним запросом: row_number() с
+    разбиением по user_id в порядке order_by. Возвращает {user_id: [Contact, ...]}.
+    options — опции загрузки (по умолчанию все связи); user_id должен в них загружаться.
+    """
+    grouped = {user_id: [] for user_id in user_ids}
+    if not user_ids:
+        return grouped
+    row_number = func.row_number().over(partition_by=models.Contact.user_id, order_by=order_by).label("row_number")
+    ranked = (
+        select(models.Contact.id, row_number)
+        .where(models.Contact.user_id.in_(user_ids), *filters)
+        .subquery()
+    )
+    result = await db.execute(
+        select(models.Contact)
+        .options(*(contact_relationships() if options is None else options))
+        .join(ranked, ranked.c.id == models.Contact.id)
+        .where(ranked.c.row_number <= per_user)
+        .order_by(models.Contact.user_id, ranked.c.row_number)
+    )
+    for contact in result.scalars():
+        grouped[contact.user_id].append(contact)
+    return grouped
+
+def escape_like(value: str) -> str:
+    """Экранирует спецсимволы LIKE, чтобы % и _ в запросе искались буквально."""
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def contact_search_filter(term: str):
+    """
+    Подстрока в имени, фамилии или email без учёта регистра. ILIKE '%...%' по каждому
+    столбцу использует свой триграммный GIN-индекс (миграция 4), условия объединяются BitmapOr.
+    Без pg_trgm тот же запрос выполняется перебором таблицы.
+    """
+    pattern = f"%{escape_like(term)}%"
+    return or_(
+        models.Contact.first_name.ilike(pattern, escape="\\"),
+        models.Contact.last_name.ilike(pattern, escape="\\"),
+        models.Contact.email.ilike(pattern, escape="\\"),
+    )
+
+def fulltext_query(text_query: str):
+    """
+    tsquery из строки пользователя: каждое слово — префикс, все слова обязательны
+    ("ivan pet" -> 'ivan:* & pet:*'). Слова разбиваются так же, как при сборке
+    contacts.search_vector, поэтому спецсимволы tsquery в запрос не попадают. None — слов нет.
+    """
+    words = re.findall(r"[^\W_]+", text_query.lower())
+    if not words:
+        return None
+    return func.to_tsquery("simple", " & ".join(f"{word}:*" for word in words))
+
+def fulltext_search_query(text_query: str, access_filter, skip: int = 0, limit: int = 20):
+    """SELECT (Contact, rank) по релевантности (ts_rank_cd) с пагинацией; None — искать нечего."""
+    tsquery = fulltext_query(text_query)
+    if tsquery is None:
+        return None
+    rank = func.ts_rank_cd(models.Contact.search_vector, tsquery)
+    return (
+        select(models.Contact, rank.label("rank"))
+        .where(models.Contact.search_vector.op("@@")(tsquery), access_filter)
+        .order_by(rank.desc(), models.Contact.id)
+        .offset(skip).limit(limit)
+    )
+
+async def fulltext_search_contacts(db: AsyncSession, text_query: str, access_filter, skip: int = 0, limit: int = 20):
+    """Полнотекстовый поиск контактов. Возвращает [(Contact, rank)]."""
+    query = fulltext_search_query(text_query, access_filter, skip, limit)
+    if query is None:
+        return []
+    result = await db.execute(query.options(*contact_relationships()))
+    return result.all()
+
+async def find_contacts_by_phone(db: AsyncSession, number: str, access_filter):
+    """
+    Обратный поиск по номеру: один запрос по индексу normalized_number.
+    Возвращает строки (id, user_id, first_name, last_name, email, number, label) без связей контакта.
+    """
+    result = await db.execute(
+        select(
+            models.Contact.id, models.Contact.user_id, models.Contact.first_name,
+            models.Contact.last_name, models.Contact.email,
+            models.PhoneNumber.number, models.PhoneNumber.label,
         )
-    ).all()
+        .join(models.PhoneNumber, models.PhoneNumber.contact_id == models.Contact.id)
+        .where(models.PhoneNumber.normalized_number == normalize_phone_number(number), access_filter)
+        .order_by(models.Contact.id)
+    )
+    return result.all()
+
+async def search_contacts(db: AsyncSession, query: str, access_filter, skip: int = 0, limit: int = 100):
+    # Доступ (auth.contact_access_filter) и страница — в самом запросе: чужие контакты не читаются
+    result = await db.execute(
+        select(models.Contact)
+        .options(*contact_relationships())
+        .where(contact_search_filter(query), access_filter)
+        .order_by(models.Contact.first_name, models.Contact.id)
+        .offset(skip).limit(limit)
+    )
+    return result.scalars().all()
+
+async def contacts_with_upcoming_birthdays(db: AsyncSession, access_filter, skip: int = 0, limit: int = 100,
+                                           options=None):
+    today = date.today()
+    # Только месяц и день, год рождения не важен
+    result = await db.execute(
+        select(models.Contact)
+        .options(*(contact_relationships() if options is None else options))
+        .where(birthday_window(today, 7), access_filter)
+        .order_by(*birthday_order(today))
+        .offset(skip).limit(limit)
+    )
+    return result.scalars().all()
 
 # GROUPS CRUD
 
-def get_groups(db: Session):
-    return db.query(models.Group).all()
+async def get_groups(db: AsyncSession):
+    result = await db.execute(select(models.Group))
+    return result.scalars().all()
 
-def get_group(db: Session, group_id: int):
-    return db.query(models.Group).filter(models.Group.id == group_id).first()
+async def get_group(db: AsyncSession, group_id: int):
+    result = await db.execute(select(models.Group).where(models.Group.id == group_id))
+    return result.scalars().first()
 
-def create_group(db: Session, group: schemas.GroupCreate):
+async def create_group(db: AsyncSession, group: schemas.GroupCreate):
     db_group = models.Group(name=group.name)
     db.add(db_group)
-    db.commit()
-    db.refresh(db_group)
+    await db.commit()
+    await db.refresh(db_group)
     return db_group
 
-def update_group(db: Session, group_id: int, group: schemas.GroupCreate):
-    db_group = db.query(models.Group).filter(models.Group.id == group_id).first()
+async def update_group(db: AsyncSession, group_id: int, group: schemas.GroupCreate):
+    db_group = await get_group(db, group_id)
     if not db_group:
         return None
     db_group.name = group.name
-    db.commit()
-    db.refresh(db_group)
+    await db.commit()
+    await db.refresh(db_group)
     return db_group
 
-def delete_group(db: Session, group_id: int):
-    db_group = db.query(models.Group).filter(models.Group.id == group_id).first()
+async def delete_group(db: AsyncSession, group_id: int):
+    # Связь contacts нужна загруженной, чтобы удалить строки из contact_group
+    result = await db.execute(
+        select(models.Group).options(selectinload(models.Group.contacts)).where(models.Group.id == group_id)
+    )
+    db_group = result.scalars().first()
     if not db_group:
         return None
-    db.delete(db_group)
-    db.commit()
+    await db.delete(db_group)
+    await db.commit()
     return db_group
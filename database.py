@@ -1,8 +1,17 @@
+from fastapi import Request
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-import os
-from dotenv import load_dotenv
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool, NullPool
+from uuid import uuid4
+from db_metrics import instrumented, sync_pool_metrics, async_pool_metrics, replica_sync_pool_metrics, replica_async_pool_metrics
+import time
+from settings import settings, is_render_environment, is_docker_environment
+from request_timing import track_queries
+from principal_cache import get_cached_claims, reads_primary
+from jose import JWTError, jwt
 import logging
 import sys
 
@@ -10,38 +19,10 @@ import sys
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-load_dotenv()
-
-# Проверка, запущено ли приложение на Render.com
-def is_render_environment():
-    return os.environ.get('RENDER') == 'true' or os.environ.get('RENDER_EXTERNAL_HOSTNAME') is not None
-
-# Проверка, запущено ли приложение в Docker
-def is_docker_environment():
-    # Несколько способов определения Docker-контейнера
-    # 1. Проверяем наличие файла /.dockerenv, который есть в Docker контейнерах
-    docker_env = os.path.exists("/.dockerenv")
-    
-    # 2. Проверяем переменную окружения, которую можем сами установить в Dockerfile или docker-compose
-    docker_env_var = os.environ.get('DOCKER_ENV') == 'true'
-    
-    # 3. Проверяем, является ли hostname контейнерным ID (обычно короткий хеш)
-    try:
-        with open('/proc/self/cgroup', 'r') as f:
-            docker_cgroup = any('docker' in line for line in f)
-    except:
-        docker_cgroup = False
-    
-    # 4. Проверяем наличие переменной окружения DB_HOST=db (типичная для docker-compose)
-    docker_db_host = os.environ.get('DB_HOST') == 'db'
-    
-    # Используем один из этих методов
-    return docker_env or docker_env_var or docker_cgroup or docker_db_host
-
 # Получаем URL для подключения к базе данных
 def get_database_url():
     # Первый приоритет: прямой URL из переменной окружения DATABASE_URL
-    database_url = os.environ.get("DATABASE_URL")
+    database_url = settings.database_url
     
     # Если приложение запущено в Docker
     if is_docker_environment():
@@ -53,11 +34,11 @@ def get_database_url():
             logger.info("Используется указанный DATABASE_URL для Docker")
         else:
             # Иначе собираем URL из отдельных параметров или используем дефолт
-            db_name = os.getenv("DB_NAME", "contacts_db")
-            db_user = os.getenv("DB_USER", "postgres")
-            db_password = os.getenv("DB_PASSWORD", "postgres")
-            db_host = os.getenv("DB_HOST", "db")
-            db_port = os.getenv("DB_PORT", "5432")
+            db_name = settings.db_name or "contacts_db"
+            db_user = settings.db_user or "postgres"
+            db_password = settings.db_password or "postgres"
+            db_host = settings.db_host or "db"
+            db_port = settings.db_port
             
             database_url = f"postgresql://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}"
             logger.info(f"Используется сконструированный URL базы данных для Docker")
@@ -66,9 +47,9 @@ def get_database_url():
     elif is_render_environment():
         if not database_url:
             # Проверяем, есть ли база данных внутри Render.com
-            if os.environ.get("RENDER_DATABASE_URL"):
+            if settings.render_database_url:
                 logger.info("Найдена переменная RENDER_DATABASE_URL, используем её")
-                database_url = os.environ.get("RENDER_DATABASE_URL")
+                database_url = settings.render_database_url
             else:
                 logger.error("DATABASE_URL не задан в переменных окружения на Render.com")
                 logger.error("Приложение не может работать без подключения к базе данных")
@@ -78,11 +59,11 @@ def get_database_url():
     else:
         # Если URL не задан, собираем из отдельных параметров
         if not database_url:
-            db_name = os.getenv("DB_NAME")
-            db_user = os.getenv("DB_USER")
-            db_password = os.getenv("DB_PASSWORD")
-            db_host = os.getenv("DB_HOST", "localhost")
-            db_port = os.getenv("DB_PORT", "5432")
+            db_name = settings.db_name
+            db_user = settings.db_user
+            db_password = settings.db_password
+            db_host = settings.db_host or "localhost"
+            db_port = settings.db_port
             
             if db_name and db_user and db_password:
                 database_url = f"postgresql://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}"
@@ -122,23 +103,47 @@ if DATABASE_URL is None:
 # Вывод информации об окружении
 if is_render_environment():
     logger.info("Приложение запущено на платформе Render.com")
-    logger.info("RENDER_EXTERNAL_HOSTNAME: " + str(os.environ.get('RENDER_EXTERNAL_HOSTNAME')))
+    logger.info("RENDER_EXTERNAL_HOSTNAME: " + str(settings.render_external_hostname))
 elif is_docker_environment():
     logger.info("Приложение запущено в Docker контейнере")
     # Выводим информацию о параметрах подключения к БД
-    logger.info(f"DB_HOST: {os.getenv('DB_HOST', 'db')}")
-    logger.info(f"DB_PORT: {os.getenv('DB_PORT', '5432')}")
-    logger.info(f"DB_NAME: {os.getenv('DB_NAME', 'contacts_db')}")
+    logger.info(f"DB_HOST: {settings.db_host or 'db'}")
+    logger.info(f"DB_PORT: {settings.db_port}")
+    logger.info(f"DB_NAME: {settings.db_name or 'contacts_db'}")
 else:
     logger.info("Приложение запущено в режиме локальной разработки")
 
+# Настройки пула соединений
+DB_POOL_SIZE = settings.db_pool_size
+DB_MAX_OVERFLOW = settings.db_max_overflow
+DB_POOL_TIMEOUT = settings.db_pool_timeout
+DB_POOL_RECYCLE = settings.db_pool_recycle
+# Пинг перед каждой выдачей соединения. При отключении разорванные соединения
+# отсекаются по pool_recycle и пересоздаются после первой ошибки
+DB_POOL_PRE_PING = settings.db_pool_pre_ping
+# Режим для PgBouncer (transaction pooling): пул держит PgBouncer, у нас NullPool,
+# и никаких серверных prepared statements
+DB_PGBOUNCER = settings.db_pgbouncer
+
+def pool_options(queue_pool_cls, metrics):
+    if DB_PGBOUNCER:
+        return {"poolclass": instrumented(NullPool, metrics)}
+    return {
+        "poolclass": instrumented(queue_pool_cls, metrics),
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+logger.info(f"Пул БД: size={DB_POOL_SIZE}, max_overflow={DB_MAX_OVERFLOW}, timeout={DB_POOL_TIMEOUT}, "
+            f"recycle={DB_POOL_RECYCLE}, pre_ping={DB_POOL_PRE_PING}, pgbouncer={DB_PGBOUNCER}")
+
 # Создаем движок базы данных с подробной отладочной информацией
 engine = create_engine(
     DATABASE_URL,
-    pool_size=5,
-    max_overflow=10,
-    pool_recycle=3600,
-    pool_pre_ping=True,  # Важно: проверяет соединение перед использованием
+    **pool_options(QueuePool, sync_pool_metrics),
     # echo=(is_render_environment() or is_docker_environment())  # Включаем подробные логи SQL в продакшен режиме для отладки
     echo=False #  Выключаем вывод SQL-запросов для уменьшения шума в логах
 )
@@ -146,13 +151,130 @@ engine = create_engine(
 # Создаем фабрику сессий
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# URL для асинхронного драйвера asyncpg на основе того же DATABASE_URL
+def get_async_database_url(database_url):
+    if not database_url:
+        return None
+    url = make_url(database_url).set(drivername="postgresql+asyncpg")
+    # asyncpg не понимает libpq-параметр sslmode (его передаёт Render), у него это ssl
+    query = dict(url.query)
+    if "sslmode" in query:
+        query["ssl"] = query.pop("sslmode")
+        url = url.set(query=query)
+    return url
+
+ASYNC_DATABASE_URL = get_async_database_url(DATABASE_URL)
+
+# Для PgBouncer отключаем кеш prepared statements asyncpg и даём им уникальные имена
+ASYNC_CONNECT_ARGS = {
+    "statement_cache_size": 0,
+    "prepared_statement_cache_size": 0,
+    "prepared_statement_name_func": lambda: f"__asyncpg_{uuid4()}__",
+} if DB_PGBOUNCER else {}
+
+# Асинхронный движок: запросы из async-обработчиков не блокируют event loop
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    **pool_options(AsyncAdaptedQueuePool, async_pool_metrics),
+    connect_args=ASYNC_CONNECT_ARGS,
+    echo=False
+)
+
+# Фабрика асинхронных сессий. expire_on_commit=False — объекты остаются доступными
+# после commit без повторной ленивой загрузки (в async она невозможна)
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+# Реплика только для чтения (необязательно). Без REPLICA_DATABASE_URL всё идёт в основную БД
+REPLICA_DATABASE_URL = settings.replica_database_url
+if REPLICA_DATABASE_URL and REPLICA_DATABASE_URL.startswith("postgres://"):
+    REPLICA_DATABASE_URL = REPLICA_DATABASE_URL.replace("postgres://", "postgresql://", 1)
+# Сколько секунд после записи клиент читает из основной БД (read-your-writes при лаге реплики)
+DB_REPLICA_STICKY_SECONDS = settings.db_replica_sticky_seconds
+PRIMARY_STICKY_COOKIE = "db_primary_until"
+READ_ONLY_METHODS = ("GET", "HEAD")
+
+if REPLICA_DATABASE_URL:
+    logger.info("Чтение GET-запросов направляется на реплику (REPLICA_DATABASE_URL)")
+    replica_engine = create_engine(
+        REPLICA_DATABASE_URL,
+        **pool_options(QueuePool, replica_sync_pool_metrics),
+        echo=False
+    )
+    replica_async_engine = create_async_engine(
+        get_async_database_url(REPLICA_DATABASE_URL),
+        **pool_options(AsyncAdaptedQueuePool, replica_async_pool_metrics),
+        connect_args=ASYNC_CONNECT_ARGS,
+        echo=False
+    )
+else:
+    replica_engine = engine
+    replica_async_engine = async_engine
+
+ReplicaSyncSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=replica_engine)
+ReplicaSessionLocal = async_sessionmaker(replica_async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+# Счётчики SQL-запросов и времени в БД для Server-Timing (см. request_timing.py)
+for _engine in (engine, async_engine.sync_engine, replica_engine, replica_async_engine.sync_engine):
+    track_queries(_engine)
+
 # Класс для моделей SQLAlchemy
 Base = declarative_base()
 
-# Функция для получения соединения с БД в виде зависимости FastAPI
-def get_db():
+# Синхронная сессия в виде зависимости FastAPI (служебные эндпоинты /db)
+def get_sync_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+def request_user_id(request: Request):
+    """
+    id пользователя из токена запроса (заголовок Authorization или cookie access_token).
+    Только для выбора БД: подпись не проверяется, доступ проверяет auth.get_current_user.
+    """
+    token = request.headers.get("Authorization", "")
+    token = token[7:] if token.startswith("Bearer ") else request.cookies.get("access_token", "")
+    if token.startswith("Bearer "):
+        token = token[7:]
+    if not token:
+        return None
+    payload = get_cached_claims(token)
+    if payload is None:
+        try:
+            payload = jwt.get_unverified_claims(token)
+        except JWTError:
+            return None
+    user_id = payload.get("id")
+    return user_id if isinstance(user_id, int) else None
+
+def use_replica(request: Request) -> bool:
+    """
+    Читающий запрос идёт на реплику, если она настроена и клиент недавно ничего не записывал.
+    Окно после записи ведётся по пользователю из токена (principal_cache.primary_reads, ставится
+    в main.py после POST/PUT/PATCH/DELETE) и дополнительно по cookie db_primary_until — для
+    браузера до входа и запросов без токена.
+    """
+    if not REPLICA_DATABASE_URL or request.method not in READ_ONLY_METHODS:
+        return False
+    if reads_primary(request_user_id(request)):
+        return False
+    try:
+        primary_until = float(request.cookies.get(PRIMARY_STICKY_COOKIE, 0))
+    except ValueError:
+        primary_until = 0
+    return primary_until <= time.time()
+
+def request_session_factory(request: Request):
+    """Фабрика сессий для запроса: реплика или основная БД по use_replica."""
+    replica = use_replica(request)
+    request.state.db_route = "replica" if replica else "primary"
+    return ReplicaSessionLocal if replica else AsyncSessionLocal
+
+# Единая сессия на запрос. FastAPI кеширует зависимость в пределах запроса, поэтому
+# get_current_user, обработчик и crud получают один и тот же объект AsyncSession.
+# Соединение из пула сессия берёт только при первом запросе к БД, так что запросы,
+# которые в БД не ходят (например, с пользователем из кеша), соединение не занимают
+async def get_db(request: Request):
+    async with request_session_factory(request)() as db:
+        yield db
@@ -0,0 +1,110 @@
+import threading
+import time
+from collections import deque
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+
+# Сколько последних замеров checkout хранить для перцентилей
+SAMPLES_MAXLEN = 2048
+
+
+class PoolMetrics:
+    """
+    Метрики выдачи соединений из пула: сколько раз брали соединение,
+    сколько ждали свободного, латентность checkout (p50/p95/p99).
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._samples = deque(maxlen=SAMPLES_MAXLEN)
+        self.checkouts = 0
+        self.waits = 0
+        self.timeouts = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+
+    def observe(self, seconds: float, waited: bool):
+        with self._lock:
+            self._samples.append(seconds)
+            self.checkouts += 1
+            if waited:
+                self.waits += 1
+                self.wait_time_total += seconds
+                self.wait_time_max = max(self.wait_time_max, seconds)
+
+    def observe_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def snapshot(self, pool=None):
+        with self._lock:
+            samples = sorted(self._samples)
+            data = {
+                "checkouts": self.checkouts,
+                "waits": self.waits,
+                "timeouts": self.timeouts,
+                "wait_time_total_ms": round(self.wait_time_total * 1000, 2),
+                "wait_time_max_ms": round(self.wait_time_max * 1000, 2),
+                "checkout_ms": {
+                    "p50": _percentile_ms(samples, 0.50),
+                    "p95": _percentile_ms(samples, 0.95),
+                    "p99": _percentile_ms(samples, 0.99),
+                    "samples": len(samples),
+                },
+            }
+        if pool is not None:
+            data["pool"] = pool_status(pool)
+        return data
+
+
+def _percentile_ms(samples, q):
+    if not samples:
+        return None
+    return round(samples[min(len(samples) - 1, int(len(samples) * q))] * 1000, 3)
+
+
+def pool_status(pool):
+    """Текущее состояние пула: занятые, свободные и overflow-соединения."""
+    if isinstance(pool, QueuePool):
+        return {
+            "class": type(pool).__name__,
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": max(pool.overflow(), 0),
+            "max_overflow": pool._max_overflow,
+            "timeout": pool.timeout(),
+        }
+    # NullPool (режим PgBouncer) не держит соединений — показываем только класс
+    return {"class": type(pool).__name__, "status": pool.status()}
+
+
+def instrumented(pool_cls, metrics: PoolMetrics):
+    """
+    Подкласс пула, который замеряет каждую выдачу соединения.
+    Ожиданием считается checkout, когда свободных соединений и места под overflow не было.
+    """
+
+    class InstrumentedPool(pool_cls):
+        def _do_get(self):
+            waited = False
+            if isinstance(self, QueuePool):
+                waited = self.checkedin() == 0 and self._max_overflow > -1 and self.overflow() >= self._max_overflow
+            start = time.perf_counter()
+            try:
+                connection = super()._do_get()
+            except PoolTimeoutError:
+                metrics.observe_timeout()
+                raise
+            metrics.observe(time.perf_counter() - start, waited)
+            return connection
+
+    InstrumentedPool.__name__ = f"Instrumented{pool_cls.__name__}"
+    return InstrumentedPool
+
+
+sync_pool_metrics = PoolMetrics("sync")
+async_pool_metrics = PoolMetrics("async")
+replica_sync_pool_metrics = PoolMetrics("replica_sync")
+replica_async_pool_metrics = PoolMetrics("replica_async")
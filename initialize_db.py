@@ -1,10 +1,9 @@
-from database import engine
-from models import Base
+from migrations import upgrade
 
 def initialize_database():
     print("Initializing database schema...")
-    Base.metadata.create_all(bind=engine)
-    print("Database schema initialized successfully!")
+    applied = upgrade()
+    print(f"Database schema initialized successfully! Applied migrations: {applied or 'none'}")
 
 if __name__ == "__main__":
     initialize_database()
\ No newline at end of file
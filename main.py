@@ -1,3 +1,8 @@
+import time
+# Время импорта модулей приложения — часть времени запуска воркера, пишется в лог старта.
+# Подробная разбивка по модулям: python scripts/profile_startup.py
+IMPORT_START = time.perf_counter()
+
 from fastapi import FastAPI, Request, HTTPException, Form, Depends, status, Cookie, Body, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware import Middleware
@@ -12,93 +17,41 @@ from jose import JWTError, jwt
 import secrets
 import uuid
 import logging
-import time
-import sqlalchemy.exc
 from pydantic import EmailStr
-import psycopg2
-import re
 
 # Добавляем импорт роутера users
-from routers import contacts, groups, db_utils, email_verification, users
-from database import SessionLocal, engine, Base, is_render_environment, is_docker_environment
+from routers import contacts, groups, db_utils, email_verification, users, metrics
+from database import AsyncSessionLocal, get_db
+from database import REPLICA_DATABASE_URL, DB_REPLICA_STICKY_SECONDS, PRIMARY_STICKY_COOKIE, READ_ONLY_METHODS, request_user_id
+from principal_cache import mark_primary_reads
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from crud import get_user_by_username, update_user_role, get_user_by_id
 import models
-import os
-from dotenv import load_dotenv
+from settings import settings
 # Импортируем функции из auth.py
-from auth import pwd_context, create_access_token, ACCESS_TOKEN_EXPIRE_MINUTES, SECRET_KEY, ALGORITHM
+from auth import create_access_token, verify_password_and_rehash, ACCESS_TOKEN_EXPIRE_MINUTES, SECRET_KEY, ALGORITHM
+# Асинхронная проверка паролей в ограниченном пуле
+from password_service import PasswordServiceBusy, calibrate_async
+# Версионированные миграции схемы
+from migrations import ensure_schema
 # Добавляем импорт нашей новой функции отправки email
 from utils_email_verif import send_verification_email, send_password_reset_email
 # Импортируем функции для rate limiting
 from rate_limiter import init_limiter
+# Учёт SQL-запросов и Server-Timing
+from request_timing import TimedRoute, request_timing_middleware
 
-load_dotenv()
+IMPORT_TIME = time.perf_counter() - IMPORT_START
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Функция для создания базы данных, если она не существует
-def ensure_database_exists():
-    # Получаем данные подключения из переменных окружения
-    database_url = os.getenv("DATABASE_URL")
-    
-    if database_url:
-        # Исправляем URL для совместимости с SQLAlchemy
-        if database_url.startswith("postgres://"):
-            database_url = database_url.replace("postgres://", "postgresql://", 1)
-        
-        # Извлекаем параметры из строки подключения
-        pattern = r"postgresql://(?P<user>[^:]+):(?P<password>[^@]+)@(?P<host>[^:/]+)(?::(?P<port>\d+))?/(?P<dbname>[^?]+)"
-        match = re.search(pattern, database_url)
-        
-        if match:
-            host = match.group("host")
-            user = match.group("user") 
-            password = match.group("password")
-            db_name = match.group("dbname")
-            port = match.group("port") or "5432"
-            
-            logger.info(f"Проверка существования базы данных '{db_name}' на сервере {host}...")
-            
-            try:
-                # Подключаемся к postgres для проверки и создания базы
-                conn = psycopg2.connect(
-                    dbname='postgres',
-                    user=user,
-                    password=password,
-                    host=host,
-                    port=port,
-                    connect_timeout=10
-                )
-                conn.autocommit = True
-                cur = conn.cursor()
-                
-                # Проверяем существование базы данных
-                cur.execute("SELECT 1 FROM pg_database WHERE datname = %s", (db_name,))
-                exists = cur.fetchone()
-                
-                if not exists:
-                    logger.info(f"База данных '{db_name}' не существует. Создаю...")
-                    cur.execute(f"CREATE DATABASE {db_name}")
-                    logger.info(f"База данных '{db_name}' успешно создана!")
-                else:
-                    logger.info(f"База данных '{db_name}' уже существует.")
-                
-                cur.close()
-                conn.close()
-                return True
-            except Exception as e:
-                logger.error(f"Ошибка при проверке/создании базы данных: {str(e)}")
-                # В Docker контейнере PostgreSQL может быть недоступен сразу после запуска
-                # поэтому продолжаем выполнение, даже если сейчас не удалось создать БД
-                return False
-    else:
-        logger.warning("DATABASE_URL не задан в переменных окружения")
-        return False
-
 # Инициализация приложения
 app = FastAPI(title="Contacts API")
+# Маршруты main.py отмечают фазу serialize для Server-Timing
+app.router.route_class = TimedRoute
 
 # Настройка CORS
 app.add_middleware(
@@ -107,8 +60,33 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Курсор следующей страницы списков должен быть доступен JS на фронтенде
+    expose_headers=["X-Next-Cursor"],
 )
 
+# Server-Timing (db, auth, serialize) и число SQL-запросов в X-DB-Queries для каждого ответа
+app.middleware("http")(request_timing_middleware)
+
+# Маршрутизация чтения на реплику: после успешной записи GET-запросы того же пользователя
+# (по токену) DB_REPLICA_STICKY_SECONDS секунд идут в основную БД (read-your-writes).
+# Cookie — дополнительно, для браузера. Заголовок X-DB-Route показывает, куда ушёл запрос
+@app.middleware("http")
+async def db_route_middleware(request: Request, call_next):
+    response = await call_next(request)
+    db_route = getattr(request.state, "db_route", None)
+    if db_route:
+        response.headers["X-DB-Route"] = db_route
+    if REPLICA_DATABASE_URL and request.method not in READ_ONLY_METHODS and response.status_code < 400:
+        mark_primary_reads(request_user_id(request))
+        response.set_cookie(
+            key=PRIMARY_STICKY_COOKIE,
+            value=f"{time.time() + DB_REPLICA_STICKY_SECONDS:.3f}",
+            max_age=max(1, int(DB_REPLICA_STICKY_SECONDS + 1)),
+            httponly=True,
+            path="/"
+        )
+    return response
+
 # Подключаем роутеры
 app.include_router(contacts.router, prefix="/contacts")
 app.include_router(groups.router, prefix="/groups")
@@ -118,61 +96,53 @@ app.include_router(users.router)
 # Изменяем маршрут для email_verification, убирая префикс /verify,
 # чтобы /auth/register был доступен
 app.include_router(email_verification.router)
+# Служебные метрики (кеш аутентификации и т.п.)
+app.include_router(metrics.router)
+
+# Пул хеширования паролей переполнен — отвечаем 503 вместо того, чтобы копить очередь
+@app.exception_handler(PasswordServiceBusy)
+async def password_service_busy_handler(request: Request, exc: PasswordServiceBusy):
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": str(exc)},
+        headers={"Retry-After": "1"},
+    )
 
 # Создаем таблицы базы данных при запуске приложения
 @app.on_event("startup")
 async def startup_db_and_tables():
     logger.info("Инициализация приложения...")
     
-    # Добавляем задержку при запуске на Render.com или в Docker,
-    # чтобы дать БД время инициализироваться
-    if is_render_environment() or is_docker_environment():
-        logger.info("Обнаружено окружение Render.com или Docker, ожидаем инициализацию внешних сервисов...")
-        time.sleep(5)  # Даем время для инициализации внешних сервисов
-    
-    # Сначала проверяем существование базы данных и создаем её при необходимости
-    logger.info("Проверка наличия базы данных...")
-    database_created = ensure_database_exists()
-    
-    if database_created:
-        logger.info("База данных доступна. Продолжаем инициализацию...")
-    else:
-        logger.warning("Не удалось создать базу данных сейчас. Попытаемся создать таблицы позже...")
-    
-    # Пытаемся установить соединение с базой данных с повторными попытками
-    max_retries = 10 if (is_render_environment() or is_docker_environment()) else 5
-    retry_delay = 3  # Секунды между попытками
-    
-    for attempt in range(max_retries):
-        try:
-            # Пытаемся создать таблицы в базе данных
-            Base.metadata.create_all(bind=engine)
-            logger.info(f"Таблицы базы данных успешно созданы (попытка {attempt+1})")
-            break
-        except sqlalchemy.exc.OperationalError as e:
-            logger.error(f"Ошибка подключения к базе данных (попытка {attempt+1}/{max_retries}): {e}")
-            if attempt < max_retries - 1:
-                logger.info(f"Повторная попытка через {retry_delay} секунд...")
-                time.sleep(retry_delay)
-                # Попробуем создать БД снова
-                if attempt == max_retries // 2:
-                    ensure_database_exists()
-            else:
-                logger.error("Все попытки подключения к базе данных исчерпаны")
-                logger.error("Приложение продолжит работу, но функции, требующие базу данных, будут недоступны")
-                # Не завершаем приложение, позволяя ему продолжить работать с ограниченной функциональностью
-        except Exception as e:
-            logger.error(f"Непредвиденная ошибка при инициализации базы данных: {e}")
-            break
-    
+    startup_start = time.perf_counter()
+    timings = {}
+
+    # Схема БД: сверяем версию, DDL выполняется только если схема отстала.
+    # Ожидание БД — с экспоненциальной задержкой, не блокируя event loop
+    phase_start = time.perf_counter()
+    try:
+        await ensure_schema()
+    except Exception as e:
+        logger.error(f"Непредвиденная ошибка при инициализации базы данных: {e}")
+    timings["schema"] = time.perf_counter() - phase_start
+
+    # Стоимость bcrypt: сохранённая в app_settings или подобранная под бюджет задержки
+    # (после схемы — таблица app_settings создаётся миграцией)
+    phase_start = time.perf_counter()
+    try:
+        await calibrate_async()
+    except Exception as e:
+        logger.error(f"Ошибка при калибровке bcrypt: {e}")
+    timings["bcrypt"] = time.perf_counter() - phase_start
+
     # Пытаемся создать супер-админа
+    phase_start = time.perf_counter()
     try:
         # Создаем супер-админа, если он не существует
-        db = SessionLocal()
+        db = AsyncSessionLocal()
         try:
-            superadmin_username = os.getenv("SUPERADMIN_USERNAME")
-            superadmin_password = os.getenv("SUPERADMIN_PASSWORD")
-            superadmin_email = os.getenv("SUPER_ADMIN_EMAIL", superadmin_username)
+            superadmin_username = settings.superadmin_username
+            superadmin_password = settings.superadmin_password
+            superadmin_email = settings.super_admin_email or superadmin_username
             
             # Если email не содержит @, добавляем домен по умолчанию
             if superadmin_email and '@' not in superadmin_email:
@@ -180,12 +150,12 @@ async def startup_db_and_tables():
             
             if superadmin_username and superadmin_password:
                 # Проверяем, существует ли уже супер-админ
-                existing_admin = get_user_by_username(db, superadmin_username)
+                existing_admin = await get_user_by_username(db, superadmin_username)
                 
                 if not existing_admin:
                     logger.info(f"Создаем учетную запись супер-админа: {superadmin_username}")
                     # Создаем запись супер-админа в базе данных
-                    hashed_password = models.User.get_password_hash(superadmin_password)
+                    hashed_password = await models.User.get_password_hash(superadmin_password)
                     superadmin = models.User(
                         username=superadmin_username,
                         email=superadmin_email,
@@ -194,27 +164,35 @@ async def startup_db_and_tables():
                         is_verified=True  # Супер-админ не требует верификации
                     )
                     db.add(superadmin)
-                    db.commit()
+                    await db.commit()
                     logger.info("Учетная запись супер-админа успешно создана")
                 else:
                     logger.info("Учетная запись супер-админа уже существует")
         except Exception as e:
             logger.error(f"Ошибка при создании супер-админа: {e}")
         finally:
-            db.close()
+            await db.close()
             
     except Exception as e:
         logger.error(f"Ошибка при работе с базой данных: {e}")
     
+    timings["superadmin"] = time.perf_counter() - phase_start
+
     # Инициализация rate limiter
+    phase_start = time.perf_counter()
     try:
         await init_limiter()
     except Exception as e:
         logger.error(f"Ошибка при инициализации rate limiter: {e}")
         logger.info("Приложение продолжит работу без ограничения запросов (rate limiting)")
+    timings["rate_limiter"] = time.perf_counter() - phase_start
+
+    details = ", ".join(f"{name} {seconds * 1000:.0f} мс" for name, seconds in timings.items())
+    logger.info(f"Старт приложения занял {time.perf_counter() - startup_start:.2f} с ({details}); "
+                f"импорт модулей {IMPORT_TIME * 1000:.0f} мс")
 
 # Настройка сессий
-app.add_middleware(SessionMiddleware, secret_key=os.getenv("SECRET_KEY", "default_secret_key"))
+app.add_middleware(SessionMiddleware, secret_key=settings.secret_key)
 
 # Настройка шаблонов
 app.mount("/static", StaticFiles(directory="static"), name="static")
@@ -257,94 +235,91 @@ async def login(request: Request):
     )
 
 @app.post("/login")
-async def login_post(request: Request, username: str = Form(...), password: str = Form(...)):
-    db = SessionLocal()
-    try:
-        # Проверяем, является ли ввод email или username
-        if '@' in username:
-            # Поиск по email
-            user = db.query(models.User).filter(models.User.email == username).first()
-        else:
-            # Поиск по username
-            user = get_user_by_username(db, username)
+async def login_post(request: Request, username: str = Form(...), password: str = Form(...),
+                     db: AsyncSession = Depends(get_db)):
+    # Проверяем, является ли ввод email или username
+    if '@' in username:
+        # Поиск по email
+        user = (await db.execute(select(models.User).where(models.User.email == username))).scalars().first()
+    else:
+        # Поиск по username
+        user = await get_user_by_username(db, username)
+    
+    # Проверка для суперадмина
+    if username == settings.superadmin_username and password == settings.superadmin_password:
+        # Проверяем, существует ли суперадмин в базе данных
+        superadmin_user = await get_user_by_username(db, username)
         
-        # Проверка для суперадмина
-        if username == os.getenv("SUPERADMIN_USERNAME") and password == os.getenv("SUPERADMIN_PASSWORD"):
-            # Проверяем, существует ли суперадмин в базе данных
-            superadmin_user = get_user_by_username(db, username)
-            
-            # Генерируем уникальный ID для суперадмина если он не найден в БД
-            superadmin_id = superadmin_user.id if superadmin_user else -1
-            
-            # Сохраняем данные суперадмина в сессии с валидным ID
-            request.session["user"] = {
-                "id": superadmin_id,  # Используем -1 как специальный ID для суперадмина, если нет в БД
-                "username": username,
-                "email": username,  # Добавляем email для суперадмина
-                "role": "superadmin"
-            }
-            
-            # Создаем JWT-токен для API-запросов суперадмина
-            access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-            access_token = create_access_token(
-                data={"sub": username, "id": superadmin_id, "role": "superadmin", "email": username}, 
-                expires_delta=access_token_expires
-            )
-            
-            # Удаляем домен из email для URL
-            clean_username = clean_username_for_url(username)
-            response = RedirectResponse(url=f"/{clean_username}_superadmin/", status_code=303)
-            
-            # Устанавливаем cookie с токеном для суперадмина
-            response.set_cookie(
-                key="access_token",
-                value=f"Bearer {access_token}",
-                httponly=True,
-                max_age=1800,  # 30 минут в секундах
-                path="/"  # Важно - токен будет доступен для всех путей
-            )
-            
-            return response
+        # Генерируем уникальный ID для суперадмина если он не найден в БД
+        superadmin_id = superadmin_user.id if superadmin_user else -1
         
-        # Проверка для обычных пользователей
-        elif user and pwd_context.verify(password, user.hashed_password):
-            # Проверка, подтвержден ли email
-            if not user.is_verified:
-                return templates.TemplateResponse("login.html", {"request": request, "error": "Пожалуйста, подтвердите ваш email перед входом"})
-            
-            # Сохраняем данные пользователя в сессии
-            request.session["user"] = {
-                "id": user.id,
-                "username": user.username,
-                "email": user.email,  # Добавляем email пользователя
-                "role": user.role or "user"  # Используем роль из БД или по умолчанию "user"
-            }
-            
-            # Создаем JWT-токен для API-запросов
-            access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-            access_token = create_access_token(
-                data={"sub": user.username, "id": user.id, "role": user.role or "user", "email": user.email}, 
-                expires_delta=access_token_expires
-            )
-            
-            # Удаляем домен из email для URL если username это email
-            clean_username = clean_username_for_url(user.username)
-            response = RedirectResponse(url=f"/{clean_username}_{user.role or 'user'}/", status_code=303)
-            
-            # Устанавливаем cookie с токеном (исправлено)
-            response.set_cookie(
-                key="access_token",
-                value=f"Bearer {access_token}",
-                httponly=True,
-                max_age=1800,  # 30 минут в секундах
-                path="/"  # Важно - токен будет доступен для всех путей
-            )
-            
-            return response
-        else:
-            return templates.TemplateResponse("login.html", {"request": request, "error": "Неверное имя пользователя или пароль"})
-    finally:
-        db.close()
+        # Сохраняем данные суперадмина в сессии с валидным ID
+        request.session["user"] = {
+            "id": superadmin_id,  # Используем -1 как специальный ID для суперадмина, если нет в БД
+            "username": username,
+            "email": username,  # Добавляем email для суперадмина
+            "role": "superadmin"
+        }
+        
+        # Создаем JWT-токен для API-запросов суперадмина
+        access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+        access_token = create_access_token(
+            data={"sub": username, "id": superadmin_id, "role": "superadmin", "email": username}, 
+            expires_delta=access_token_expires
+        )
+        
+        # Удаляем домен из email для URL
+        clean_username = clean_username_for_url(username)
+        response = RedirectResponse(url=f"/{clean_username}_superadmin/", status_code=303)
+        
+        # Устанавливаем cookie с токеном для суперадмина
+        response.set_cookie(
+            key="access_token",
+            value=f"Bearer {access_token}",
+            httponly=True,
+            max_age=1800,  # 30 минут в секундах
+            path="/"  # Важно - токен будет доступен для всех путей
+        )
+        
+        return response
+    
+    # Проверка для обычных пользователей
+    elif user and await verify_password_and_rehash(db, user, password):
+        # Проверка, подтвержден ли email
+        if not user.is_verified:
+            return templates.TemplateResponse("login.html", {"request": request, "error": "Пожалуйста, подтвердите ваш email перед входом"})
+        
+        # Сохраняем данные пользователя в сессии
+        request.session["user"] = {
+            "id": user.id,
+            "username": user.username,
+            "email": user.email,  # Добавляем email пользователя
+            "role": user.role or "user"  # Используем роль из БД или по умолчанию "user"
+        }
+        
+        # Создаем JWT-токен для API-запросов
+        access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+        access_token = create_access_token(
+            data={"sub": user.username, "id": user.id, "role": user.role or "user", "email": user.email}, 
+            expires_delta=access_token_expires
+        )
+        
+        # Удаляем домен из email для URL если username это email
+        clean_username = clean_username_for_url(user.username)
+        response = RedirectResponse(url=f"/{clean_username}_{user.role or 'user'}/", status_code=303)
+        
+        # Устанавливаем cookie с токеном (исправлено)
+        response.set_cookie(
+            key="access_token",
+            value=f"Bearer {access_token}",
+            httponly=True,
+            max_age=1800,  # 30 минут в секундах
+            path="/"  # Важно - токен будет доступен для всех путей
+        )
+        
+        return response
+    else:
+        return templates.TemplateResponse("login.html", {"request": request, "error": "Неверное имя пользователя или пароль"})
 
 @app.get("/signup", response_class=HTMLResponse)
 def signup_get(request: Request):
@@ -398,24 +373,20 @@ def logout(request: Request):
     return response
 
 @app.post("/token")
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
-    db = SessionLocal()
-    try:
-        user = get_user_by_username(db, form_data.username)
-        if not user or not pwd_context.verify(form_data.password, user.hashed_password):
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Неверное имя пользователя или пароль",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
-        access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-        access_token = create_access_token(
-            data={"sub": user.username, "id": user.id, "role": user.role}, 
-            expires_delta=access_token_expires
+async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
+    user = await get_user_by_username(db, form_data.username)
+    if not user or not await verify_password_and_rehash(db, user, form_data.password):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Неверное имя пользователя или пароль",
+            headers={"WWW-Authenticate": "Bearer"},
         )
-        return {"access_token": access_token, "token_type": "bearer"}
-    finally:
-        db.close()
+    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    access_token = create_access_token(
+        data={"sub": user.username, "id": user.id, "role": user.role}, 
+        expires_delta=access_token_expires
+    )
+    return {"access_token": access_token, "token_type": "bearer"}
 
 # Эндпоинт для проверки статуса авторизации
 @app.get("/auth/status")
@@ -448,7 +419,8 @@ async def change_user_role(
     user_id: int, 
     role_data: dict = Body(...),
     request: Request = None,
-    token: Optional[str] = Depends(get_token_from_cookie)
+    token: Optional[str] = Depends(get_token_from_cookie),
+    db: AsyncSession = Depends(get_db)
 ):
     # Проверяем, авторизован ли пользователь и имеет ли права
     if not request.session.get("user") or request.session["user"].get("role") not in ["admin", "superadmin"]:
@@ -481,54 +453,51 @@ async def change_user_role(
         )
     
     # Проверяем, что пользователь не пытается изменить роль суперадмина
-    db = SessionLocal()
-    try:
-        user_to_change = get_user_by_id(db, user_id)
-        if not user_to_change:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail=f"Пользователь с ID {user_id} не найден",
-            )
-        
-        # Логирование для отладки
-        print(f"Пользователь для изменения: id={user_to_change.id}, роль={user_to_change.role}")
-        
-        # Запрещаем менять роль суперадмина
-        if user_to_change.role == "superadmin":
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="Невозможно изменить роль суперадмина",
-            )
-        
-        # Обновляем роль пользователя
-        updated_user = update_user_role(db, user_id, new_role)
-        print(f"Роль пользователя успешно изменена на: {new_role}")
-        
-        return {
-            "status": "success", 
-            "message": f"Роль пользователя изменена на {new_role}",
-            "user_id": user_id,
-            "new_role": new_role
-        }
-    finally:
-        db.close()
+    user_to_change = await get_user_by_id(db, user_id)
+    if not user_to_change:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Пользователь с ID {user_id} не найден",
+        )
+    
+    # Логирование для отладки
+    print(f"Пользователь для изменения: id={user_to_change.id}, роль={user_to_change.role}")
+    
+    # Запрещаем менять роль суперадмина
+    if user_to_change.role == "superadmin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Невозможно изменить роль суперадмина",
+        )
+    
+    # Обновляем роль пользователя
+    updated_user = await update_user_role(db, user_id, new_role)
+    print(f"Роль пользователя успешно изменена на: {new_role}")
+    
+    return {
+        "status": "success", 
+        "message": f"Роль пользователя изменена на {new_role}",
+        "user_id": user_id,
+        "new_role": new_role
+    }
 
 # Эндпоинт для переключения между аккаунтами
 @app.get("/switch_account/{user_id}", response_class=RedirectResponse)
 async def switch_account(
     request: Request,
-    user_id: int
+    user_id: int,
+    db: AsyncSession = Depends(get_db)
 ):
     # Проверка на суперадмина (ID = -1)
     if user_id == -1:
         # Получаем данные суперадмина из переменных окружения
-        superadmin_username = os.getenv("SUPERADMIN_USERNAME")
+        superadmin_username = settings.superadmin_username
         
         if not superadmin_username:
             return RedirectResponse(url="/login", status_code=303)
         
         # Обеспечиваем валидный email с символом @
-        superadmin_email = os.getenv("SUPERADMIN_EMAIL", superadmin_username)
+        superadmin_email = settings.superadmin_email or superadmin_username
         if '@' not in superadmin_email:
             superadmin_email = 'superadmin@example.com'
         
@@ -568,49 +537,45 @@ async def switch_account(
         return response
     
     # Обычная обработка для других пользователей
-    db = SessionLocal()
-    try:
-        # Получаем пользователя по ID
-        user_to_switch = get_user_by_id(db, user_id)
-        if not user_to_switch:
-            return RedirectResponse(url="/login", status_code=303)
-        
-        # Сохраняем данные пользователя в сессии
-        request.session["user"] = {
-            "id": user_to_switch.id,
-            "username": user_to_switch.username,
-            "email": user_to_switch.email,
-            "role": user_to_switch.role or "user"
-        }
-        
-        # Создаем новый JWT-токен для API-запросов
-        access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-        access_token = create_access_token(
-            data={
-                "sub": user_to_switch.username, 
-                "id": user_to_switch.id, 
-                "role": user_to_switch.role or "user",
-                "email": user_to_switch.email
-            }, 
-            expires_delta=access_token_expires
-        )
-        
-        # Удаляем домен из email для URL если username это email
-        clean_username = clean_username_for_url(user_to_switch.username)
-        response = RedirectResponse(url=f"/{clean_username}_{user_to_switch.role or 'user'}/", status_code=303)
-        
-        # Устанавливаем cookie с токеном
-        response.set_cookie(
-            key="access_token",
-            value=f"Bearer {access_token}",
-            httponly=True,
-            max_age=1800,  # 30 минут в секундах
-            path="/"
-        )
-        
-        return response
-    finally:
-        db.close()
+    # Получаем пользователя по ID
+    user_to_switch = await get_user_by_id(db, user_id)
+    if not user_to_switch:
+        return RedirectResponse(url="/login", status_code=303)
+    
+    # Сохраняем данные пользователя в сессии
+    request.session["user"] = {
+        "id": user_to_switch.id,
+        "username": user_to_switch.username,
+        "email": user_to_switch.email,
+        "role": user_to_switch.role or "user"
+    }
+    
+    # Создаем новый JWT-токен для API-запросов
+    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    access_token = create_access_token(
+        data={
+            "sub": user_to_switch.username, 
+            "id": user_to_switch.id, 
+            "role": user_to_switch.role or "user",
+            "email": user_to_switch.email
+        }, 
+        expires_delta=access_token_expires
+    )
+    
+    # Удаляем домен из email для URL если username это email
+    clean_username = clean_username_for_url(user_to_switch.username)
+    response = RedirectResponse(url=f"/{clean_username}_{user_to_switch.role or 'user'}/", status_code=303)
+    
+    # Устанавливаем cookie с токеном
+    response.set_cookie(
+        key="access_token",
+        value=f"Bearer {access_token}",
+        httponly=True,
+        max_age=1800,  # 30 минут в секундах
+        path="/"
+    )
+    
+    return response
 
 # Добавляем маршруты для восстановления пароля
 @app.get("/forgot", response_class=HTMLResponse)
@@ -619,11 +584,11 @@ async def forgot_password_page(request: Request):
 
 
 @app.post("/forgot", response_class=HTMLResponse)
-async def forgot_password_submit(request: Request, background_tasks: BackgroundTasks, email: str = Form(...)):
-    db = SessionLocal()
+async def forgot_password_submit(request: Request, background_tasks: BackgroundTasks, email: str = Form(...),
+                                 db: AsyncSession = Depends(get_db)):
     try:
         # Проверяем, существует ли пользователь с таким email
-        user = db.query(models.User).filter(models.User.email == email).first()
+        user = (await db.execute(select(models.User).where(models.User.email == email))).scalars().first()
         if not user:
             return templates.TemplateResponse(
                 "password_reset/forgot.html", 
@@ -640,7 +605,9 @@ async def forgot_password_submit(request: Request, background_tasks: BackgroundT
         expires_at = datetime.utcnow() + timedelta(hours=24)
         
         # Проверяем, есть ли уже существующие записи для сброса пароля
-        existing_reset = db.query(models.PasswordReset).filter(models.PasswordReset.user_id == user.id).first()
+        existing_reset = (await db.execute(
+            select(models.PasswordReset).where(models.PasswordReset.user_id == user.id)
+        )).scalars().first()
         
         if existing_reset:
             # Если существует - обновляем
@@ -656,7 +623,7 @@ async def forgot_password_submit(request: Request, background_tasks: BackgroundT
             )
             db.add(password_reset)
         
-        db.commit()
+        await db.commit()
         
         # Генерируем URL для сброса пароля
         reset_url = f"{request.base_url}reset/{reset_token}"
@@ -689,33 +656,27 @@ async def forgot_password_submit(request: Request, background_tasks: BackgroundT
                 "error": "Произошла ошибка при обработке запроса. Пожалуйста, попробуйте позже."
             }
         )
-    finally:
-        db.close()
 
 
 @app.get("/reset/{reset_token}", response_class=HTMLResponse)
-async def reset_password_page(request: Request, reset_token: str):
-    db = SessionLocal()
-    try:
-        # Проверяем валидность токена
-        password_reset = db.query(models.PasswordReset).filter(
-            models.PasswordReset.token == reset_token,
-            models.PasswordReset.is_used == False,
-            models.PasswordReset.expires_at > datetime.utcnow()
-        ).first()
-        
-        if not password_reset:
-            return templates.TemplateResponse(
-                "password_reset/reset.html", 
-                {"request": request, "expired": True, "reset_token": reset_token}
-            )
-        
+async def reset_password_page(request: Request, reset_token: str, db: AsyncSession = Depends(get_db)):
+    # Проверяем валидность токена
+    password_reset = (await db.execute(select(models.PasswordReset).where(
+        models.PasswordReset.token == reset_token,
+        models.PasswordReset.is_used == False,
+        models.PasswordReset.expires_at > datetime.utcnow()
+    ))).scalars().first()
+    
+    if not password_reset:
         return templates.TemplateResponse(
             "password_reset/reset.html", 
-            {"request": request, "reset_token": reset_token}
+            {"request": request, "expired": True, "reset_token": reset_token}
         )
-    finally:
-        db.close()
+    
+    return templates.TemplateResponse(
+        "password_reset/reset.html", 
+        {"request": request, "reset_token": reset_token}
+    )
 
 
 @app.post("/reset/{reset_token}", response_class=HTMLResponse)
@@ -723,9 +684,9 @@ async def reset_password_submit(
     request: Request, 
     reset_token: str, 
     password: str = Form(...), 
-    confirm_password: str = Form(...)
+    confirm_password: str = Form(...),
+    db: AsyncSession = Depends(get_db)
 ):
-    db = SessionLocal()
     try:
         # Проверяем совпадение паролей
         if password != confirm_password:
@@ -750,11 +711,11 @@ async def reset_password_submit(
             )
         
         # Проверяем валидность токена
-        password_reset = db.query(models.PasswordReset).filter(
+        password_reset = (await db.execute(select(models.PasswordReset).where(
             models.PasswordReset.token == reset_token,
             models.PasswordReset.is_used == False,
             models.PasswordReset.expires_at > datetime.utcnow()
-        ).first()
+        ))).scalars().first()
         
         if not password_reset:
             return templates.TemplateResponse(
@@ -763,7 +724,7 @@ async def reset_password_submit(
             )
         
         # Получаем пользователя
-        user = db.query(models.User).filter(models.User.id == password_reset.user_id).first()
+        user = (await db.execute(select(models.User).where(models.User.id == password_reset.user_id))).scalars().first()
         if not user:
             return templates.TemplateResponse(
                 "password_reset/reset.html", 
@@ -775,12 +736,12 @@ async def reset_password_submit(
             )
         
         # Обновляем пароль и хешируем его
-        user.hashed_password = models.User.get_password_hash(password)
+        user.hashed_password = await models.User.get_password_hash(password)
         
         # Отмечаем токен как использованный
         password_reset.is_used = True
         
-        db.commit()
+        await db.commit()
         
         # Перенаправляем на страницу входа с сообщением об успешной смене пароля
         response = RedirectResponse(url="/login")
@@ -788,6 +749,9 @@ async def reset_password_submit(
         request.session["password_reset_success"] = True
         return response
         
+    except PasswordServiceBusy:
+        # Пул хеширования переполнен — 503 с Retry-After (password_service_busy_handler)
+        raise
     except Exception as e:
         print(f"Ошибка при сбросе пароля: {e}")
         return templates.TemplateResponse(
@@ -798,5 +762,3 @@ async def reset_password_submit(
                 "reset_token": reset_token
             }
         )
-    finally:
-        db.close()
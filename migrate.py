@@ -0,0 +1,59 @@
+"""
+Накатывает миграции схемы БД.
+
+    python migrate.py              # до последней версии
+    python migrate.py --target 3   # до указанной версии
+    python migrate.py --status     # текущая версия и применённые миграции
+    python migrate.py --trigram    # триграммные индексы поиска, если pg_trgm установили позже
+"""
+import argparse
+import logging
+import time
+from database import engine
+from migrations import (MIGRATIONS, upgrade, history, current_version, latest_version, ensure_database_exists,
+                        create_trigram_indexes)
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def print_status():
+    with engine.connect() as connection:
+        version = current_version(connection)
+    applied = {row["version"]: row for row in history()}
+    print(f"Версия схемы: {version} (последняя {latest_version()})")
+    for migration in MIGRATIONS:
+        row = applied.get(migration.version)
+        mark = f"применена {row['applied_at']:%Y-%m-%d %H:%M:%S}, {row['duration_ms']} мс" if row else "ожидает"
+        print(f"  {migration.version:>3}  {migration.description} — {mark}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Миграции схемы БД")
+    parser.add_argument("--target", type=int, default=None, help="накатить до этой версии включительно")
+    parser.add_argument("--status", action="store_true", help="показать состояние и выйти")
+    parser.add_argument("--trigram", action="store_true", help="создать триграммные индексы поиска и выйти")
+    args = parser.parse_args()
+
+    if args.status:
+        print_status()
+        return
+
+    if args.trigram:
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            if create_trigram_indexes(connection):
+                logger.info("Триграммные индексы созданы")
+        return
+
+    ensure_database_exists()
+    start = time.perf_counter()
+    applied = upgrade(target=args.target)
+    elapsed = time.perf_counter() - start
+    if applied:
+        logger.info(f"Применены миграции {applied} за {elapsed:.2f} с")
+    else:
+        logger.info("Схема актуальна, миграции не требуются")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,467 @@
+"""
+Версионированные миграции схемы БД.
+
+Текущая версия хранится в таблице schema_version. При старте приложение только
+сверяет версию (один лёгкий запрос) и не выполняет DDL, если схема актуальна.
+Накатить миграции вручную: python migrate.py
+"""
+import asyncio
+import logging
+import re
+import time
+import asyncpg
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from database import engine, async_engine, Base
+from settings import settings
+from utils_phone import NORMALIZE_PHONE_SQL
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_VERSION_TABLE = "schema_version"
+# Ключ advisory lock: несколько воркеров uvicorn и migrate.py не накатывают миграции одновременно
+MIGRATION_LOCK_ID = 720150001
+
+# Накатывать недостающие миграции при старте приложения (иначе только предупреждение в логе)
+MIGRATE_ON_STARTUP = settings.migrate_on_startup
+# Повторные попытки подключения при старте: экспоненциальная задержка от DB_CONNECT_BACKOFF
+# до DB_CONNECT_BACKOFF_MAX секунд. Хотя бы одна попытка делается всегда (DB_CONNECT_RETRIES=0 — как 1)
+DB_CONNECT_RETRIES = max(1, settings.db_connect_retries)
+DB_CONNECT_BACKOFF = settings.db_connect_backoff
+DB_CONNECT_BACKOFF_MAX = settings.db_connect_backoff_max
+
+
+class Migration:
+    """
+    Одна миграция схемы. upgrade получает sync Connection.
+    transactional=False — миграция выполняется в autocommit (нужно для
+    CREATE INDEX CONCURRENTLY и пакетных обновлений больших таблиц).
+    """
+
+    def __init__(self, version: int, description: str, upgrade, transactional: bool = True):
+        self.version = version
+        self.description = description
+        self.upgrade = upgrade
+        self.transactional = transactional
+
+
+def _baseline(connection):
+    # Таблицы, которые раньше создавались через create_all при каждом старте.
+    # На существующей базе ничего не меняет: create_all пропускает готовые таблицы
+    import models  # noqa: F401 — регистрирует модели в Base.metadata
+    Base.metadata.create_all(bind=connection)
+
+
+def create_index_concurrently(connection, name: str, table: str, columns: str, using: str = "btree"):
+    """
+    CREATE INDEX CONCURRENTLY не блокирует запись в таблицу, но выполняется только вне транзакции.
+    Если прошлая попытка оборвалась, остаётся невалидный индекс — его пересоздаём.
+    """
+    invalid = connection.execute(text(
+        "SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+        "WHERE c.relname = :name AND NOT i.indisvalid"
+    ), {"name": name}).scalar()
+    if invalid:
+        connection.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+    connection.execute(text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} USING {using} ({columns})"))
+
+
+# Индексы внешних ключей и сортировки списков контактов
+FOREIGN_KEY_INDEXES = [
+    ("ix_contacts_user_id_first_name_id", "contacts", "user_id, first_name, id"),
+    ("ix_contacts_first_name_id", "contacts", "first_name, id"),
+    ("ix_phone_numbers_contact_id", "phone_numbers", "contact_id"),
+    ("ix_avatars_contact_id", "avatars", "contact_id"),
+    ("ix_photos_contact_id", "photos", "contact_id"),
+    ("ix_contact_group_group_id_contact_id", "contact_group", "group_id, contact_id"),
+    ("ix_user_avatars_user_id", "user_avatars", "user_id"),
+    ("ix_avatar_request_messages_user_id", "avatar_request_messages", "user_id"),
+    ("ix_avatar_request_messages_avatar_id", "avatar_request_messages", "avatar_id"),
+    ("ix_password_resets_user_id", "password_resets", "user_id"),
+]
+
+
+def _foreign_key_indexes(connection):
+    for name, table, columns in FOREIGN_KEY_INDEXES:
+        create_index_concurrently(connection, name, table, columns)
+        connection.execute(text(f"ANALYZE {table}"))
+
+
+def _birthday_md(connection):
+    # Генерируемый столбец: PostgreSQL сам пересчитывает его при INSERT/UPDATE birthday.
+    # ADD COLUMN ... STORED переписывает таблицу под эксклюзивной блокировкой — на таблице
+    # контактов это секунды, зато без триггеров и ручного пакетного заполнения
+    connection.execute(text(
+        "ALTER TABLE contacts ADD COLUMN IF NOT EXISTS birthday_md SMALLINT "
+        "GENERATED ALWAYS AS ((EXTRACT(MONTH FROM birthday) * 100 + EXTRACT(DAY FROM birthday))::smallint) STORED"
+    ))
+    create_index_concurrently(connection, "ix_contacts_user_id_birthday_md", "contacts", "user_id, birthday_md")
+    create_index_concurrently(connection, "ix_contacts_birthday_md", "contacts", "birthday_md")
+    connection.execute(text("ANALYZE contacts"))
+
+
+# Поиск подстроки (ILIKE '%...%') по контактам: GIN-индексы pg_trgm
+TRIGRAM_INDEXES = [
+    ("ix_contacts_first_name_trgm", "contacts", "first_name gin_trgm_ops"),
+    ("ix_contacts_last_name_trgm", "contacts", "last_name gin_trgm_ops"),
+    ("ix_contacts_email_trgm", "contacts", "email gin_trgm_ops"),
+]
+
+
+def create_trigram_indexes(connection) -> bool:
+    """
+    Создаёт расширение pg_trgm и триграммные индексы. Если расширение недоступно
+    (нет пакета contrib или прав), поиск продолжает работать перебором — возвращает False.
+    """
+    try:
+        connection.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+    except DBAPIError as e:
+        logger.warning(f"Расширение pg_trgm недоступно, поиск контактов останется без индексов: {str(e.orig).splitlines()[0]}")
+        logger.warning("После установки расширения выполните: python migrate.py --trigram")
+        return False
+    for name, table, columns in TRIGRAM_INDEXES:
+        create_index_concurrently(connection, name, table, columns, using="gin")
+    connection.execute(text("ANALYZE contacts"))
+    return True
+
+
+# Полнотекстовый поиск: contacts.search_vector собирается из полей контакта и его телефонов.
+# Конфигурация 'simple' без стемминга: имена, email и номера на любом языке разбираются одинаково.
+# Email и номера дополнительно разбиваются на буквенно-цифровые куски, чтобы находились по частям
+FULLTEXT_SQL = [
+    r"""
+    CREATE OR REPLACE FUNCTION contacts_search_vector(
+        p_contact_id integer, p_first_name text, p_last_name text, p_email text, p_extra_info text
+    ) RETURNS tsvector AS $$
+        SELECT setweight(to_tsvector('simple', coalesce(p_first_name, '') || ' ' || coalesce(p_last_name, '')), 'A')
+            || setweight(to_tsvector('simple', regexp_replace(coalesce(p_email, ''), '[^[:alnum:]]+', ' ', 'g')), 'B')
+            || setweight(to_tsvector('simple', coalesce((
+                   SELECT string_agg(regexp_replace(number, '[^[:alnum:]]+', ' ', 'g') || ' '
+                                     || regexp_replace(number, '[^0-9]+', '', 'g'), ' ')
+                   FROM phone_numbers WHERE contact_id = p_contact_id
+               ), '')), 'B')
+            || setweight(to_tsvector('simple', coalesce(p_extra_info, '')), 'C')
+    $$ LANGUAGE sql STABLE
+    """,
+    """
+    CREATE OR REPLACE FUNCTION contacts_search_vector_trigger() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector := contacts_search_vector(NEW.id, NEW.first_name, NEW.last_name, NEW.email, NEW.extra_info);
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    "DROP TRIGGER IF EXISTS contacts_search_vector_update ON contacts",
+    """
+    CREATE TRIGGER contacts_search_vector_update
+        BEFORE INSERT OR UPDATE OF first_name, last_name, email, extra_info ON contacts
+        FOR EACH ROW EXECUTE FUNCTION contacts_search_vector_trigger()
+    """,
+    # Телефоны: триггеры на уровне оператора, чтобы пакетная вставка обновляла каждый контакт один раз
+    """
+    CREATE OR REPLACE FUNCTION phone_numbers_search_vector_trigger() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+            UPDATE contacts c SET search_vector = contacts_search_vector(c.id, c.first_name, c.last_name, c.email, c.extra_info)
+            WHERE c.id IN (SELECT contact_id FROM new_rows);
+        ELSIF TG_OP = 'DELETE' THEN
+            UPDATE contacts c SET search_vector = contacts_search_vector(c.id, c.first_name, c.last_name, c.email, c.extra_info)
+            WHERE c.id IN (SELECT contact_id FROM old_rows);
+        ELSE
+            UPDATE contacts c SET search_vector = contacts_search_vector(c.id, c.first_name, c.last_name, c.email, c.extra_info)
+            WHERE c.id IN (SELECT contact_id FROM new_rows UNION SELECT contact_id FROM old_rows);
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    "DROP TRIGGER IF EXISTS phone_numbers_search_vector_insert ON phone_numbers",
+    "DROP TRIGGER IF EXISTS phone_numbers_search_vector_update ON phone_numbers",
+    "DROP TRIGGER IF EXISTS phone_numbers_search_vector_delete ON phone_numbers",
+    """
+    CREATE TRIGGER phone_numbers_search_vector_insert AFTER INSERT ON phone_numbers
+        REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION phone_numbers_search_vector_trigger()
+    """,
+    """
+    CREATE TRIGGER phone_numbers_search_vector_update AFTER UPDATE ON phone_numbers
+        REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION phone_numbers_search_vector_trigger()
+    """,
+    """
+    CREATE TRIGGER phone_numbers_search_vector_delete AFTER DELETE ON phone_numbers
+        REFERENCING OLD TABLE AS old_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION phone_numbers_search_vector_trigger()
+    """,
+]
+
+# Новый контакт вектор получает без поиска телефонов: их вставляют только после контакта
+# (внешний ключ), и триггер phone_numbers дополнит вектор. С NULL вместо id подзапрос
+# по phone_numbers сворачивается при планировании. Иначе закешированный план с Seq Scan
+# (статистика снята, пока таблица была маленькой) делает массовый импорт квадратичным
+SEARCH_VECTOR_INSERT_SQL = """
+    CREATE OR REPLACE FUNCTION contacts_search_vector_trigger() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+            NEW.search_vector := contacts_search_vector(NULL, NEW.first_name, NEW.last_name, NEW.email, NEW.extra_info);
+        ELSE
+            NEW.search_vector := contacts_search_vector(NEW.id, NEW.first_name, NEW.last_name, NEW.email, NEW.extra_info);
+        END IF;
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+"""
+
+# Размер пакета при заполнении новых столбцов на существующих данных: короткие
+# транзакции не держат блокировки строк долго и не раздувают WAL одним оператором
+BACKFILL_BATCH_SIZE = 5000
+
+
+def backfill(connection, table: str, assignment: str, pending: str, batch_size: int = BACKFILL_BATCH_SIZE):
+    """UPDATE table SET assignment пакетами по batch_size строк, пока есть строки с условием pending."""
+    total = 0
+    while True:
+        updated = connection.execute(text(
+            f"UPDATE {table} SET {assignment} WHERE id IN "
+            f"(SELECT id FROM {table} WHERE {pending} ORDER BY id LIMIT :batch)"
+        ), {"batch": batch_size}).rowcount
+        total += updated
+        if updated < batch_size:
+            break
+    logger.info(f"{table}: заполнено строк {total}")
+    return total
+
+
+def _fulltext_search(connection):
+    connection.execute(text("ALTER TABLE contacts ADD COLUMN IF NOT EXISTS search_vector tsvector"))
+    # Сначала триггеры — записи, сделанные во время заполнения, тоже получат вектор
+    for sql in FULLTEXT_SQL:
+        connection.execute(text(sql))
+    backfill(
+        connection, "contacts",
+        "search_vector = contacts_search_vector(id, first_name, last_name, email, extra_info)",
+        "search_vector IS NULL",
+    )
+    create_index_concurrently(connection, "ix_contacts_search_vector", "contacts", "search_vector", using="gin")
+    connection.execute(text("ANALYZE contacts"))
+
+
+def _search_vector_on_insert(connection):
+    connection.execute(text(SEARCH_VECTOR_INSERT_SQL))
+
+
+def _normalized_phone_numbers(connection):
+    connection.execute(text("ALTER TABLE phone_numbers ADD COLUMN IF NOT EXISTS normalized_number VARCHAR"))
+    backfill(
+        connection, "phone_numbers",
+        f"normalized_number = {NORMALIZE_PHONE_SQL.format(column='number')}",
+        "normalized_number IS NULL",
+    )
+    create_index_concurrently(connection, "ix_phone_numbers_normalized_number", "phone_numbers", "normalized_number")
+    connection.execute(text("ANALYZE phone_numbers"))
+
+
+# Общие для всех воркеров значения, которые приложение выбирает само
+# (например, стоимость bcrypt из password_service.calibrate)
+APP_SETTINGS_SQL = """
+    CREATE TABLE IF NOT EXISTS app_settings (
+        key VARCHAR PRIMARY KEY,
+        value VARCHAR NOT NULL,
+        updated_at TIMESTAMP NOT NULL DEFAULT now()
+    )
+"""
+
+
+def _app_settings(connection):
+    connection.execute(text(APP_SETTINGS_SQL))
+
+
+MIGRATIONS = [
+    Migration(1, "Базовая схема: таблицы моделей", _baseline),
+    Migration(2, "Индексы внешних ключей и сортировки контактов", _foreign_key_indexes, transactional=False),
+    Migration(3, "Индексируемый столбец birthday_md для дней рождения", _birthday_md, transactional=False),
+    Migration(4, "Триграммные индексы для поиска контактов (pg_trgm)", create_trigram_indexes, transactional=False),
+    Migration(5, "Полнотекстовый поиск: contacts.search_vector, триггеры и GIN-индекс", _fulltext_search,
+              transactional=False),
+    Migration(6, "Нормализованные номера телефонов для поиска по номеру", _normalized_phone_numbers,
+              transactional=False),
+    Migration(7, "search_vector нового контакта без поиска его телефонов", _search_vector_on_insert),
+    Migration(8, "Таблица app_settings: общие настройки воркеров (стоимость bcrypt)", _app_settings),
+]
+
+
+def latest_version() -> int:
+    return MIGRATIONS[-1].version
+
+
+def current_version(connection) -> int:
+    """Версия схемы в базе; 0 — таблицы schema_version ещё нет."""
+    exists = connection.execute(text("SELECT to_regclass(:table)"), {"table": SCHEMA_VERSION_TABLE}).scalar()
+    if not exists:
+        return 0
+    return connection.execute(text(f"SELECT COALESCE(MAX(version), 0) FROM {SCHEMA_VERSION_TABLE}")).scalar()
+
+
+def _ensure_version_table(connection):
+    connection.execute(text(f"""
+        CREATE TABLE IF NOT EXISTS {SCHEMA_VERSION_TABLE} (
+            version INTEGER PRIMARY KEY,
+            description VARCHAR NOT NULL,
+            applied_at TIMESTAMP NOT NULL DEFAULT now(),
+            duration_ms INTEGER
+        )
+    """))
+
+
+def _record(connection, migration: Migration, duration_ms: int):
+    connection.execute(
+        text(f"INSERT INTO {SCHEMA_VERSION_TABLE} (version, description, duration_ms) VALUES (:v, :d, :ms)"),
+        {"v": migration.version, "d": migration.description, "ms": duration_ms},
+    )
+
+
+def upgrade(bind=engine, target: int = None):
+    """Накатывает недостающие миграции (до target включительно). Возвращает применённые версии."""
+    applied = []
+    with bind.connect() as connection:
+        connection.execute(text("SELECT pg_advisory_lock(:id)"), {"id": MIGRATION_LOCK_ID})
+        connection.commit()
+        try:
+            _ensure_version_table(connection)
+            # Версию читаем уже под блокировкой: другой процесс мог накатить миграции, пока мы ждали
+            version = current_version(connection)
+            connection.commit()
+            for migration in MIGRATIONS:
+                if migration.version <= version or (target is not None and migration.version > target):
+                    continue
+                logger.info(f"Миграция {migration.version}: {migration.description}...")
+                start = time.perf_counter()
+                if migration.transactional:
+                    migration.upgrade(connection)
+                else:
+                    with bind.connect().execution_options(isolation_level="AUTOCOMMIT") as autocommit:
+                        migration.upgrade(autocommit)
+                duration_ms = int((time.perf_counter() - start) * 1000)
+                _record(connection, migration, duration_ms)
+                connection.commit()
+                logger.info(f"Миграция {migration.version} применена за {duration_ms} мс")
+                applied.append(migration.version)
+        finally:
+            connection.rollback()
+            connection.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": MIGRATION_LOCK_ID})
+            connection.commit()
+    return applied
+
+
+def history(bind=engine):
+    """Применённые миграции из schema_version."""
+    with bind.connect() as connection:
+        if not current_version(connection):
+            return []
+        rows = connection.execute(text(
+            f"SELECT version, description, applied_at, duration_ms FROM {SCHEMA_VERSION_TABLE} ORDER BY version"
+        ))
+        return [dict(row._mapping) for row in rows]
+
+
+# Функция для создания базы данных, если она не существует
+def ensure_database_exists():
+    import psycopg2
+
+    # Данные подключения из настроек (DATABASE_URL)
+    database_url = settings.database_url
+
+    if database_url:
+        # Исправляем URL для совместимости с SQLAlchemy
+        if database_url.startswith("postgres://"):
+            database_url = database_url.replace("postgres://", "postgresql://", 1)
+
+        # Извлекаем параметры из строки подключения
+        pattern = r"postgresql://(?P<user>[^:]+):(?P<password>[^@]+)@(?P<host>[^:/]+)(?::(?P<port>\d+))?/(?P<dbname>[^?]+)"
+        match = re.search(pattern, database_url)
+
+        if match:
+            host = match.group("host")
+            user = match.group("user")
+            password = match.group("password")
+            db_name = match.group("dbname")
+            port = match.group("port") or "5432"
+
+            logger.info(f"Проверка существования базы данных '{db_name}' на сервере {host}...")
+
+            try:
+                # Подключаемся к postgres для проверки и создания базы
+                conn = psycopg2.connect(
+                    dbname='postgres',
+                    user=user,
+                    password=password,
+                    host=host,
+                    port=port,
+                    connect_timeout=10
+                )
+                conn.autocommit = True
+                cur = conn.cursor()
+
+                # Проверяем существование базы данных
+                cur.execute("SELECT 1 FROM pg_database WHERE datname = %s", (db_name,))
+                exists = cur.fetchone()
+
+                if not exists:
+                    logger.info(f"База данных '{db_name}' не существует. Создаю...")
+                    cur.execute(f"CREATE DATABASE {db_name}")
+                    logger.info(f"База данных '{db_name}' успешно создана!")
+                else:
+                    logger.info(f"База данных '{db_name}' уже существует.")
+
+                cur.close()
+                conn.close()
+                return True
+            except Exception as e:
+                logger.error(f"Ошибка при проверке/создании базы данных: {str(e)}")
+                return False
+    else:
+        logger.warning("DATABASE_URL не задан в переменных окружения")
+        return False
+
+
+async def get_current_version_async() -> int:
+    async with async_engine.connect() as connection:
+        return await connection.run_sync(current_version)
+
+
+async def ensure_schema():
+    """
+    Проверка схемы при старте приложения. Ждёт БД с экспоненциальной задержкой
+    (без блокировки event loop), сверяет версию и накатывает миграции, только если
+    схема отстала. Возвращает версию схемы или None, если БД так и не стала доступна.
+    """
+    delay = DB_CONNECT_BACKOFF
+    version = None
+    for attempt in range(1, DB_CONNECT_RETRIES + 1):
+        try:
+            version = await get_current_version_async()
+            break
+        # asyncpg отдаёт ошибки установки соединения (нет базы, сервер стартует) без обёртки SQLAlchemy
+        except (DBAPIError, OSError, asyncpg.PostgresError) as e:
+            logger.error(f"Ошибка подключения к базе данных (попытка {attempt}/{DB_CONNECT_RETRIES}): {e}")
+            if attempt == DB_CONNECT_RETRIES:
+                logger.error("Все попытки подключения к базе данных исчерпаны")
+                logger.error("Приложение продолжит работу, но функции, требующие базу данных, будут недоступны")
+                return None
+            # Базы может не быть вовсе (первый запуск) — пробуем создать её один раз
+            if attempt == 1:
+                await asyncio.to_thread(ensure_database_exists)
+            logger.info(f"Повторная попытка через {delay:.1f} с...")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, DB_CONNECT_BACKOFF_MAX)
+
+    if version >= latest_version():
+        logger.info(f"Схема БД актуальна (версия {version}), DDL не выполняется")
+        return version
+    if not MIGRATE_ON_STARTUP:
+        logger.warning(f"Схема БД устарела (версия {version}, последняя {latest_version()}). "
+                       f"Выполните: python migrate.py")
+        return version
+    applied = await asyncio.to_thread(upgrade)
+    logger.info(f"Применены миграции: {applied}")
+    return latest_version()
@@ -1,17 +1,17 @@
-from sqlalchemy import Column, Integer, String, Date, Text, ForeignKey, Table, DateTime, Boolean, func
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, SmallInteger, String, Date, Text, ForeignKey, Table, DateTime, Boolean, Index, Computed, func
+from sqlalchemy.orm import relationship, deferred
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from datetime import datetime
 from database import Base
-from passlib.context import CryptContext
-
-# Создаём контекст для хеширования паролей
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+import password_service
 
 # Association table for many-to-many Contact <-> Group
 contact_group = Table(
     'contact_group', Base.metadata,
     Column('contact_id', Integer, ForeignKey('contacts.id'), primary_key=True),
-    Column('group_id', Integer, ForeignKey('groups.id'), primary_key=True)
+    Column('group_id', Integer, ForeignKey('groups.id'), primary_key=True),
+    # Первичный ключ (contact_id, group_id) не помогает при поиске контактов группы
+    Index('ix_contact_group_group_id_contact_id', 'group_id', 'contact_id'),
 )
 
 class User(Base):
@@ -28,18 +28,18 @@ class User(Base):
     contacts = relationship('Contact', back_populates='user', cascade="all, delete-orphan")
     password_resets = relationship("PasswordReset", back_populates="user", cascade="all, delete-orphan")
     
-    # Методы для работы с паролем
+    # Методы для работы с паролем (bcrypt выполняется в пуле password_service)
     @staticmethod
-    def get_password_hash(password):
-        return pwd_context.hash(password)
+    async def get_password_hash(password):
+        return await password_service.hash_password(password)
         
-    def verify_password(self, plain_password):
-        return pwd_context.verify(plain_password, self.hashed_password)
+    async def verify_password(self, plain_password):
+        return await password_service.verify_password(plain_password, self.hashed_password)
 
 class UserAvatar(Base):
     __tablename__ = 'user_avatars'
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False, index=True)
     file_path = Column(String, nullable=False)
     cloudinary_public_id = Column(String, nullable=True)  # Добавляем поле для хранения public_id из Cloudinary
     is_approved = Column(Integer, default=0)  # 0 - not approved, 1 - approved
@@ -55,8 +55,8 @@ class UserAvatar(Base):
 class AvatarRequestMessage(Base):
     __tablename__ = 'avatar_request_messages'
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)  # кто отправил запрос
-    avatar_id = Column(Integer, ForeignKey('user_avatars.id'), nullable=False)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False, index=True)  # кто отправил запрос
+    avatar_id = Column(Integer, ForeignKey('user_avatars.id'), nullable=False, index=True)
     message = Column(Text, nullable=True)
     status = Column(String, default='pending')  # 'pending', 'approved', 'rejected'
     created_at = Column(DateTime, default=datetime.utcnow)
@@ -69,13 +69,34 @@ class AvatarRequestMessage(Base):
 
 class Contact(Base):
     __tablename__ = 'contacts'
+    __table_args__ = (
+        # Список контактов пользователя, отсортированный по имени (id — для стабильного порядка).
+        # Ведущий user_id покрывает и простой фильтр по владельцу
+        Index('ix_contacts_user_id_first_name_id', 'user_id', 'first_name', 'id'),
+        # Все контакты по имени (суперадмин без фильтра по пользователю)
+        Index('ix_contacts_first_name_id', 'first_name', 'id'),
+        # Дни рождения: диапазон по birthday_md у пользователя и по всем контактам
+        Index('ix_contacts_user_id_birthday_md', 'user_id', 'birthday_md'),
+        Index('ix_contacts_birthday_md', 'birthday_md'),
+        # Триграммные GIN-индексы для поиска по first_name, last_name и email создаёт миграция 4
+        # (migrations.TRIGRAM_INDEXES) и только при наличии pg_trgm, поэтому здесь их нет
+        Index('ix_contacts_search_vector', 'search_vector', postgresql_using='gin'),
+    )
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
     first_name = Column(String, nullable=False)
     last_name = Column(String)
     email = Column(String, nullable=False)
     birthday = Column(Date, nullable=False)
+    # Месяц и день рождения числом MMDD (1 марта -> 301). Вычисляет сама БД при вставке и обновлении,
+    # поэтому поиск ближайших дней рождения — диапазон по индексу, а не extract() по каждой строке
+    birthday_md = Column(SmallInteger, Computed(
+        "(EXTRACT(MONTH FROM birthday) * 100 + EXTRACT(DAY FROM birthday))::smallint", persisted=True
+    ))
     extra_info = Column(Text)
+    # Полнотекстовый вектор (имя, email, телефоны, extra_info). Заполняют триггеры БД из миграции 5;
+    # отложенная загрузка — в обычных выборках контактов он не нужен
+    search_vector = deferred(Column(TSVECTOR))
 
     user = relationship('User', back_populates='contacts')
     phone_numbers = relationship('PhoneNumber', back_populates='contact', cascade="all, delete-orphan")
@@ -86,8 +107,10 @@ class Contact(Base):
 class PhoneNumber(Base):
     __tablename__ = 'phone_numbers'
     id = Column(Integer, primary_key=True, index=True)
-    contact_id = Column(Integer, ForeignKey('contacts.id'))
+    contact_id = Column(Integer, ForeignKey('contacts.id'), index=True)
     number = Column(String, nullable=False)
+    # Только цифры (utils_phone.normalize_phone_number) — для поиска контакта по номеру
+    normalized_number = Column(String, index=True)
     label = Column(String, default="other")  # e.g., home, work, mobile
 
     contact = relationship('Contact', back_populates='phone_numbers')
@@ -101,7 +124,7 @@ class Group(Base):
 class Avatar(Base):
     __tablename__ = 'avatars'
     id = Column(Integer, primary_key=True, index=True)
-    contact_id = Column(Integer, ForeignKey('contacts.id'))
+    contact_id = Column(Integer, ForeignKey('contacts.id'), index=True)
     file_path = Column(String)  # путь к файлу аватарки контакта
     is_main = Column(Integer, default=0)  # 1 если основная, 0 иначе
     show = Column(Integer, default=1)  # 1 если показывать, 0 иначе
@@ -111,7 +134,7 @@ class Avatar(Base):
 class Photo(Base):
     __tablename__ = 'photos'
     id = Column(Integer, primary_key=True, index=True)
-    contact_id = Column(Integer, ForeignKey('contacts.id'))
+    contact_id = Column(Integer, ForeignKey('contacts.id'), index=True)
     file_path = Column(String)
     is_main = Column(Integer, default=0)
     show = Column(Integer, default=1)
@@ -123,7 +146,7 @@ class PasswordReset(Base):
     __tablename__ = "password_resets"
     
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
     token = Column(String, unique=True, nullable=False, index=True)
     created_at = Column(DateTime, server_default=func.now())
     expires_at = Column(DateTime, nullable=False)
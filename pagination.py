@@ -0,0 +1,45 @@
+"""
+Keyset-пагинация (курсоры) для списков.
+
+Курсор — непрозрачная строка base64url с ключом последней строки страницы
+(например, [first_name, id]) и направлением сортировки. Следующая страница
+берётся условием (first_name, id) > (..., ...) по индексу, поэтому время не
+растёт с номером страницы, а вставки между запросами не сдвигают страницы.
+"""
+import base64
+import binascii
+import json
+from fastapi import HTTPException, status
+from sqlalchemy import tuple_
+
+
+def encode_cursor(values: list, sort: str) -> str:
+    payload = json.dumps({"k": values, "s": sort}, ensure_ascii=False, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: str, types: tuple) -> list:
+    """
+    Ключ из курсора. types — ожидаемые типы значений ключа, например (str, int).
+    400, если курсор повреждён, не того формата или выдан для другой сортировки.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        values, cursor_sort = payload["k"], payload["s"]
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Некорректный курсор")
+    if not isinstance(values, list) or len(values) != len(types) or \
+            not all(isinstance(value, kind) for value, kind in zip(values, types)):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Некорректный курсор")
+    if cursor_sort != sort:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail="Курсор выдан для другой сортировки")
+    return values
+
+
+def keyset_filter(columns, values: list, descending: bool = False):
+    """Строки строго после ключа values в порядке columns (сравнение кортежей, как в индексе)."""
+    if descending:
+        return tuple_(*columns) < tuple_(*values)
+    return tuple_(*columns) > tuple_(*values)
@@ -0,0 +1,198 @@
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from passlib.context import CryptContext
+from sqlalchemy import text
+from settings import settings
+
+# Единый контекст хеширования паролей для всего приложения
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+# Размер пула и допустимая очередь задач хеширования.
+# bcrypt освобождает GIL во время вычисления, поэтому хватает пула потоков
+PASSWORD_HASH_WORKERS = settings.password_hash_workers
+PASSWORD_HASH_MAX_QUEUE = settings.password_hash_max_queue
+
+_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+_lock = threading.Lock()
+_pending = 0   # задачи в работе и в очереди
+_completed = 0
+_rejected = 0
+
+logger = logging.getLogger(__name__)
+
+# Стоимость bcrypt: либо фиксированная (BCRYPT_ROUNDS), либо подбирается один раз
+# так, чтобы одно хеширование укладывалось в BCRYPT_TARGET_MS, и сохраняется в БД.
+# BCRYPT_MIN_ROUNDS/BCRYPT_MAX_ROUNDS — границы подбора
+BCRYPT_ROUNDS = settings.bcrypt_rounds
+BCRYPT_TARGET_MS = settings.bcrypt_target_ms
+BCRYPT_MIN_ROUNDS = settings.bcrypt_min_rounds
+BCRYPT_MAX_ROUNDS = settings.bcrypt_max_rounds
+BCRYPT_CALIBRATE = settings.bcrypt_calibrate
+# Ключ в app_settings (миграция 8). Подобрать заново: удалить строку и перезапустить приложение
+BCRYPT_SETTING_KEY = "bcrypt_rounds"
+
+# Результат последней калибровки (отдаётся в метриках)
+calibration = {
+    "rounds": pwd_context.handler("bcrypt").default_rounds,
+    "source": "default",
+    "target_ms": BCRYPT_TARGET_MS,
+    "measured_ms": None,
+    "table": [],
+}
+
+
+class PasswordServiceBusy(Exception):
+    """Пул хеширования паролей переполнен, запрос нужно повторить позже."""
+
+
+async def _run(func, *args):
+    global _pending, _completed, _rejected
+    with _lock:
+        if _pending >= PASSWORD_HASH_WORKERS + PASSWORD_HASH_MAX_QUEUE:
+            _rejected += 1
+            raise PasswordServiceBusy("Сервис проверки паролей перегружен, попробуйте позже")
+        _pending += 1
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_executor, func, *args)
+    finally:
+        with _lock:
+            _pending -= 1
+            _completed += 1
+
+
+def measure_rounds(rounds: int) -> float:
+    """Время одного хеширования bcrypt с заданной стоимостью, в миллисекундах."""
+    handler = pwd_context.handler("bcrypt").using(rounds=rounds)
+    start = time.perf_counter()
+    handler.hash("calibration-password")
+    return (time.perf_counter() - start) * 1000
+
+
+def benchmark(min_rounds: int = BCRYPT_MIN_ROUNDS, max_rounds: int = BCRYPT_MAX_ROUNDS, target_ms: float = None):
+    """
+    Замеряет стоимости от min_rounds вверх. Если задан target_ms, останавливается
+    на первой стоимости, превысившей бюджет (каждый шаг вдвое дороже предыдущего).
+    """
+    table = []
+    for rounds in range(min_rounds, max_rounds + 1):
+        elapsed = measure_rounds(rounds)
+        table.append((rounds, elapsed))
+        if target_ms is not None and elapsed > target_ms:
+            break
+    return table
+
+
+def set_rounds(rounds: int):
+    # Устаревшими (перехеш при следующем входе) считаются хеши дешевле выбранной стоимости,
+    # например 12 при выбранных 13; более стойкие (12 при выбранных 11) остаются как есть
+    pwd_context.update(
+        bcrypt__default_rounds=rounds,
+        bcrypt__min_rounds=rounds,
+    )
+    calibration["rounds"] = rounds
+
+
+def stored_rounds(connection):
+    """Сохранённая стоимость bcrypt из app_settings или None."""
+    value = connection.execute(
+        text("SELECT value FROM app_settings WHERE key = :key"), {"key": BCRYPT_SETTING_KEY}
+    ).scalar()
+    return int(value) if value is not None else None
+
+
+def store_rounds(connection, rounds: int) -> int:
+    """
+    Сохраняет стоимость, если её ещё нет, и возвращает действующую: при одновременном
+    старте нескольких воркеров побеждает первая запись, остальные берут её.
+    """
+    connection.execute(text(
+        "INSERT INTO app_settings (key, value) VALUES (:key, :value) ON CONFLICT (key) DO NOTHING"
+    ), {"key": BCRYPT_SETTING_KEY, "value": str(rounds)})
+    return stored_rounds(connection)
+
+
+def calibrate(bind=None):
+    """
+    Выбирает стоимость bcrypt и применяет её к pwd_context: BCRYPT_ROUNDS, иначе сохранённая
+    в app_settings, иначе замер под бюджет с сохранением. Так все воркеры и перезапуски
+    используют одну стоимость. bind — sync Engine (по умолчанию database.engine).
+    """
+    if BCRYPT_ROUNDS:
+        calibration["source"] = "env"
+        set_rounds(int(BCRYPT_ROUNDS))
+    elif BCRYPT_CALIBRATE:
+        if bind is None:
+            from database import engine as bind
+        with bind.begin() as connection:
+            rounds = stored_rounds(connection)
+        if rounds is not None:
+            calibration["source"] = "stored"
+        else:
+            # Замер может идти секунды — без открытой транзакции и соединения из пула
+            table = benchmark(BCRYPT_MIN_ROUNDS, BCRYPT_MAX_ROUNDS, BCRYPT_TARGET_MS)
+            within_budget = [(r, ms) for r, ms in table if ms <= BCRYPT_TARGET_MS]
+            # Если даже минимальная стоимость не укладывается в бюджет, безопасность важнее
+            measured_rounds, measured = within_budget[-1] if within_budget else table[0]
+            calibration.update(measured_ms=round(measured, 1),
+                               table=[{"rounds": r, "ms": round(ms, 1)} for r, ms in table])
+            with bind.begin() as connection:
+                rounds = store_rounds(connection, measured_rounds)
+            calibration["source"] = "calibrated" if rounds == measured_rounds else "stored"
+        set_rounds(rounds)
+    logger.info(f"bcrypt: стоимость {calibration['rounds']} ({calibration['source']}, "
+                f"замер {calibration['measured_ms']} мс, бюджет {BCRYPT_TARGET_MS} мс); "
+                f"закрепить явно: BCRYPT_ROUNDS={calibration['rounds']}")
+    return calibration["rounds"]
+
+
+async def calibrate_async():
+    """Калибровка в пуле хеширования, чтобы не блокировать event loop при старте (после миграций)."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, calibrate)
+
+
+def hash_password_sync(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def verify_password_sync(plain_password: str, hashed_password: str) -> bool:
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+def verify_and_update_sync(plain_password: str, hashed_password: str):
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+
+async def hash_password(password: str) -> str:
+    """Хеширует пароль в пуле потоков, не блокируя event loop."""
+    return await _run(hash_password_sync, password)
+
+
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    """Проверяет пароль в пуле потоков, не блокируя event loop."""
+    return await _run(verify_password_sync, plain_password, hashed_password)
+
+
+async def verify_and_update(plain_password: str, hashed_password: str):
+    """
+    Проверяет пароль и, если хеш дешевле текущей стоимости, возвращает новый хеш.
+    Результат: (пароль верный, новый хеш или None).
+    """
+    return await _run(verify_and_update_sync, plain_password, hashed_password)
+
+
+def get_stats():
+    with _lock:
+        return {
+            "bcrypt": calibration,
+            "workers": PASSWORD_HASH_WORKERS,
+            "max_queue": PASSWORD_HASH_MAX_QUEUE,
+            "in_flight": min(_pending, PASSWORD_HASH_WORKERS),
+            "queue_depth": max(0, _pending - PASSWORD_HASH_WORKERS),
+            "completed": _completed,
+            "rejected": _rejected,
+        }
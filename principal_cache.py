@@ -0,0 +1,164 @@
+"""
+Кеши аутентификации: пользователи по id, декодированные claims по токену и окно
+чтения из основной БД после записи.
+
+Кеши живут в памяти одного процесса. Сброс (invalidate_user, invalidate_all_users)
+действует только в процессе, где изменились данные; другие процессы увидят изменения
+не позже чем через AUTH_CACHE_TTL секунд. Сейчас приложение запускается одним
+процессом uvicorn; при нескольких воркерах AUTH_CACHE_TTL — верхняя граница
+устаревания роли, имени и подтверждения email.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from settings import settings
+
+# Настройки кеша аутентифицированных пользователей
+AUTH_CACHE_TTL = settings.auth_cache_ttl  # секунды
+AUTH_CACHE_MAXSIZE = settings.auth_cache_maxsize
+AUTH_CACHE_ENABLED = settings.auth_cache_enabled
+
+
+class TTLCache:
+    """
+    Ограниченный LRU-кеш с временем жизни записей и счётчиками попаданий/промахов.
+    Потокобезопасен: синхронные обработчики FastAPI выполняются в пуле потоков.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            value, expires_at = item
+            if expires_at <= now:
+                del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl: float = None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key):
+        with self._lock:
+            if self._data.pop(key, None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+# Кеш пользователей по id из токена: хранит снимок полей, а не ORM-объект,
+# чтобы не делить один экземпляр между запросами и сессиями
+principal_cache = TTLCache(AUTH_CACHE_MAXSIZE, AUTH_CACHE_TTL)
+
+# Кеш декодированных claims по хешу токена (сам токен в памяти не храним)
+claims_cache = TTLCache(AUTH_CACHE_MAXSIZE, AUTH_CACHE_TTL)
+
+# Окно чтения из основной БД после записи (read-your-writes при лаге реплики) по id
+# пользователя: работает и для API-клиентов с Bearer-токеном без cookie
+primary_reads = TTLCache(AUTH_CACHE_MAXSIZE, settings.db_replica_sticky_seconds)
+
+# Поля пользователя, которые сохраняются в кеше
+PRINCIPAL_FIELDS = ("id", "username", "email", "role", "is_verified")
+
+
+def token_key(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def get_cached_claims(token: str):
+    if not AUTH_CACHE_ENABLED:
+        return None
+    return claims_cache.get(token_key(token))
+
+
+def cache_claims(token: str, payload: dict):
+    if not AUTH_CACHE_ENABLED:
+        return
+    # Claims не должны пережить срок действия самого токена
+    ttl = None
+    exp = payload.get("exp")
+    if exp is not None:
+        ttl = exp - time.time()
+    claims_cache.set(token_key(token), payload, ttl)
+
+
+def get_cached_principal(user_id):
+    if not AUTH_CACHE_ENABLED or user_id is None:
+        return None
+    return principal_cache.get(user_id)
+
+
+def cache_principal(user):
+    if not AUTH_CACHE_ENABLED or user.id is None:
+        return
+    principal_cache.set(user.id, {field: getattr(user, field, None) for field in PRINCIPAL_FIELDS})
+
+
+def invalidate_user(user_id):
+    """Сбрасывает закешированного пользователя после изменения его данных."""
+    principal_cache.pop(user_id)
+
+
+def invalidate_all_users():
+    """Сбрасывает всех закешированных пользователей (массовое удаление, пересоздание базы)."""
+    principal_cache.clear()
+
+
+def mark_primary_reads(user_id):
+    """После записи пользователя его чтения DB_REPLICA_STICKY_SECONDS секунд идут в основную БД."""
+    if user_id is not None:
+        primary_reads.set(user_id, True)
+
+
+def reads_primary(user_id) -> bool:
+    return user_id is not None and primary_reads.get(user_id) is not None
+
+
+def get_cache_stats():
+    return {
+        "enabled": AUTH_CACHE_ENABLED,
+        "principals": principal_cache.stats(),
+        "claims": claims_cache.stats(),
+        "primary_reads": primary_reads.stats(),
+    }
@@ -2,20 +2,16 @@ from fastapi import FastAPI, Request, Response, Depends, HTTPException, status
 import redis.asyncio as redis
 from fastapi_limiter import FastAPILimiter
 from fastapi_limiter.depends import RateLimiter
-import os
-from dotenv import load_dotenv
+from settings import settings
 import asyncio
 from typing import Optional
 
-# Загружаем переменные окружения
-load_dotenv()
-
 # Получаем URL Redis из переменных окружения
 # Для Render.com проверяем как REDIS_URL, так и RENDER_REDIS_URL
-REDIS_URL = os.getenv("REDIS_URL") or os.getenv("RENDER_REDIS_URL")
+REDIS_URL = settings.redis_url
 
 # Проверяем, настроено ли ограничение запросов или нет
-RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "True").lower() in ("true", "1", "t")
+RATE_LIMIT_ENABLED = settings.rate_limit_enabled
 
 # Флаг для проверки успешности подключения к Redis
 redis_connected = False
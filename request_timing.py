@@ -0,0 +1,196 @@
+"""
+Учёт SQL-запросов и времени по фазам в пределах одного HTTP-запроса.
+
+Хуки SQLAlchemy считают запросы и время в БД, middleware в main.py отдаёт итог
+в заголовке Server-Timing (db, auth, serialize, app) и X-DB-Queries и пишет
+предупреждение, если запрос превысил бюджет QUERY_BUDGET.
+"""
+import functools
+import inspect
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+from settings import settings
+
+logger = logging.getLogger(__name__)
+
+REQUEST_TIMING_ENABLED = settings.request_timing_enabled
+QUERY_BUDGET = settings.query_budget
+
+_current = ContextVar("request_timing", default=None)
+
+
+class RequestTiming:
+    """Счётчики одного запроса. Объект общий для всех задач и потоков запроса."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.phases = {}
+        self.endpoint_done = None
+
+    def add_phase(self, name: str, seconds: float):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def server_timing(self) -> str:
+        parts = [f'db;dur={self.db_time * 1000:.1f};desc="{self.queries} queries"']
+        for name, seconds in self.phases.items():
+            parts.append(f"{name};dur={seconds * 1000:.1f}")
+        parts.append(f"app;dur={(time.perf_counter() - self.start) * 1000:.1f}")
+        return ", ".join(parts)
+
+
+def current_timing():
+    return _current.get()
+
+
+@contextmanager
+def count_queries():
+    """
+    Считает запросы внутри блока (прямые вызовы crud, скрипты):
+
+        with count_queries() as timing:
+            await crud.get_contacts(db, user_id)
+        print(timing.queries)
+    """
+    timing = RequestTiming()
+    token = _current.set(timing)
+    try:
+        yield timing
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def assert_max_queries(max_queries: int, label: str = "блок"):
+    """Падает с AssertionError, если внутри блока выполнено больше max_queries запросов."""
+    with count_queries() as timing:
+        yield timing
+    if timing.queries > max_queries:
+        raise AssertionError(f"{label}: {timing.queries} SQL-запросов, допустимо не больше {max_queries}")
+
+
+def assert_response_queries(response, max_queries: int):
+    """То же для ответа HTTP-клиента (TestClient/httpx): число запросов берётся из X-DB-Queries."""
+    queries = int(response.headers["X-DB-Queries"])
+    if queries > max_queries:
+        request = response.request
+        raise AssertionError(f"{request.method} {request.url.path}: {queries} SQL-запросов, "
+                             f"допустимо не больше {max_queries}")
+    return queries
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault("request_timing_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    timing = _current.get()
+    if timing is None:
+        return
+    starts = conn.info.get("request_timing_start")
+    if starts:
+        timing.db_time += time.perf_counter() - starts.pop()
+    timing.queries += 1
+
+
+def track_queries(sync_engine):
+    """Вешает счётчики на движок (для AsyncEngine — на его sync_engine)."""
+    if not event.contains(sync_engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def timed_phase(name: str):
+    """
+    Декоратор зависимости/функции: её время попадает в Server-Timing под именем name.
+    Сигнатура сохраняется, так что FastAPI видит исходные параметры.
+    """
+
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    timing = _current.get()
+                    if timing is not None:
+                        timing.add_phase(name, time.perf_counter() - start)
+        else:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    timing = _current.get()
+                    if timing is not None:
+                        timing.add_phase(name, time.perf_counter() - start)
+        return wrapper
+
+    return decorator
+
+
+class TimedRoute(APIRoute):
+    """
+    Маршрут, который отмечает момент возврата из обработчика. Время от него до
+    готового Response (валидация response_model, jsonable_encoder, JSON) — фаза serialize.
+    """
+
+    def get_route_handler(self):
+        endpoint = self.dependant.call
+        if inspect.iscoroutinefunction(endpoint):
+            @functools.wraps(endpoint)
+            async def timed_endpoint(*args, **kwargs):
+                try:
+                    return await endpoint(*args, **kwargs)
+                finally:
+                    _mark_endpoint_done()
+        else:
+            @functools.wraps(endpoint)
+            def timed_endpoint(*args, **kwargs):
+                try:
+                    return endpoint(*args, **kwargs)
+                finally:
+                    _mark_endpoint_done()
+        self.dependant.call = timed_endpoint
+        handler = super().get_route_handler()
+
+        async def timed_handler(request):
+            response = await handler(request)
+            timing = _current.get()
+            if timing is not None and timing.endpoint_done is not None:
+                timing.add_phase("serialize", time.perf_counter() - timing.endpoint_done)
+            return response
+
+        return timed_handler
+
+
+def _mark_endpoint_done():
+    timing = _current.get()
+    if timing is not None:
+        timing.endpoint_done = time.perf_counter()
+
+
+async def request_timing_middleware(request, call_next):
+    if not REQUEST_TIMING_ENABLED:
+        return await call_next(request)
+    timing = RequestTiming()
+    token = _current.set(timing)
+    try:
+        response = await call_next(request)
+    finally:
+        _current.reset(token)
+    response.headers["Server-Timing"] = timing.server_timing()
+    response.headers["X-DB-Queries"] = str(timing.queries)
+    if QUERY_BUDGET and timing.queries > QUERY_BUDGET:
+        logger.warning(f"{request.method} {request.url.path}: {timing.queries} SQL-запросов "
+                       f"(бюджет {QUERY_BUDGET}), в БД {timing.db_time * 1000:.1f} мс")
+    return response
@@ -1,31 +1,38 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
-from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import extract, and_, or_
+from fastapi import APIRouter, Depends, File, HTTPException, Query, Request, UploadFile, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, text
+from sqlalchemy.exc import DBAPIError
 from typing import List, Optional
-from datetime import date, timedelta
+from datetime import date
 import logging
 import crud, models, schemas
-from database import SessionLocal
+from database import get_db, request_session_factory
 from models import Contact, User
-from schemas import Contact as ContactSchema, ContactCreate, ContactUpdate, UserWithContacts, UserWithBirthdays
+from schemas import (Contact as ContactSchema, ContactCreate, ContactUpdate, ContactSearchResult,
+                     ContactImportReport, ContactBatchFilter, ContactBatchUpdate, ContactBatchResult,
+                     PhoneLookupResult, UserWithContacts, UserWithBirthdays)
 # Используем обновлённые функции авторизации
-from auth import get_current_user, check_contact_access
+from auth import get_current_user, check_contact_access, contact_access_filter
+from request_timing import TimedRoute
+from pagination import encode_cursor, decode_cursor, keyset_filter
+from serialization import ContactFieldset, contact_fieldset, dump_contacts, json_response
+from settings import settings
+from utils_phone import normalize_phone_number
+import contacts_io
 
-router = APIRouter(tags=["Contacts"])
+router = APIRouter(tags=["Contacts"], route_class=TimedRoute)
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+FULLTEXT_SEARCH_TIMEOUT_MS = settings.fulltext_search_timeout_ms
+# SQLSTATE query_canceled: сработал statement_timeout
+QUERY_CANCELED = "57014"
 
 @router.post("/", response_model=ContactSchema)
 async def create_contact(
     request: Request,
     contact: ContactCreate, 
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     logging.info(f"[ROUTER] create_contact RAW: {contact}")
     
@@ -42,47 +49,165 @@ async def create_contact(
         target_user_id = current_user.id
     
     try:
-        return crud.create_contact(db, target_user_id, contact)
+        return await crud.create_contact(db, target_user_id, contact)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+@router.post("/import", response_model=ContactImportReport)
+async def import_contacts(
+    request: Request,
+    file: UploadFile = File(..., description="CSV или vCard (.vcf) в UTF-8"),
+    format: Optional[str] = Query(None, description="csv или vcard; по умолчанию — по расширению файла"),
+    user_id: Optional[int] = Query(None, description="Владелец контактов (только для админов), по умолчанию — вы"),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Массовый импорт контактов. Строки проверяются по тем же правилам, что и в POST /contacts/,
+    корректные создаются пачками в одной транзакции, по остальным возвращаются ошибки с номером строки.
+    """
+    # Владелец — как в create_contact: админ может указать любого пользователя
+    target_user_id = current_user.id
+    if current_user.role in ["superadmin", "admin"] and user_id is not None:
+        if await db.get(models.User, user_id) is None:
+            raise HTTPException(status_code=404, detail="User not found")
+        target_user_id = user_id
+    
+    try:
+        fmt = contacts_io.detect_format(format, file.filename, file.content_type)
+        report = await contacts_io.import_contacts(db, file.file, fmt, target_user_id)
+    except contacts_io.ImportFormatError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    logging.info(f"/contacts/import: {report['imported']} создано, {report['failed']} отклонено "
+                 f"для пользователя {target_user_id}")
+    return report
+
+@router.post("/batch/delete", response_model=ContactBatchResult)
+async def batch_delete_contacts(
+    request: Request,
+    selection: ContactBatchFilter,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Удаление многих контактов за один запрос: по списку ids и/или фильтру (search, user_id, group_id).
+    Чужие контакты (для обычного пользователя) не выбираются и попадают в missing_ids.
+    """
+    report = await crud.batch_delete_contacts(db, selection, contact_access_filter(current_user))
+    logging.info(f"/contacts/batch/delete: выбрано {report['matched']}, удалено {report.get('deleted', 0)} "
+                 f"пользователем {current_user.id}")
+    return report
+
+@router.post("/batch/update", response_model=ContactBatchResult)
+async def batch_update_contacts(
+    request: Request,
+    batch: ContactBatchUpdate,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Изменение многих контактов за один запрос: patch — общие значения полей,
+    add_group_ids / remove_group_ids — членство в группах. Выбор — как в /contacts/batch/delete.
+    """
+    report = await crud.batch_update_contacts(db, batch, contact_access_filter(current_user))
+    logging.info(f"/contacts/batch/update: выбрано {report['matched']}, изменено {report.get('updated', 0)} "
+                 f"пользователем {current_user.id}")
+    return report
+
+@router.get("/export", response_class=StreamingResponse)
+async def export_contacts(
+    request: Request,
+    format: str = Query("ndjson", description="ndjson, csv или vcard"),
+    user_id: Optional[int] = Query(None, description="Только контакты этого пользователя"),
+    fieldset: ContactFieldset = Depends(contact_fieldset),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Все доступные контакты одним файлом, по мере чтения из базы: NDJSON (по контакту
+    в строке, fields= и include= как у списка), CSV или vCard — в формате POST /contacts/import.
+    """
+    if format not in contacts_io.EXPORT_FORMATS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Неизвестный формат {format}, допустимые: {', '.join(contacts_io.EXPORT_FORMATS)}"
+        )
+    # Доступ — в самом запросе, как в поиске: чужие контакты не читаются
+    filters = [contact_access_filter(current_user)]
+    if user_id is not None:
+        filters.append(models.Contact.user_id == user_id)
+    filename = f"contacts.{contacts_io.EXPORT_EXTENSIONS[format]}"
+    return StreamingResponse(
+        contacts_io.export_contacts(request_session_factory(request), filters, format, fieldset),
+        media_type=contacts_io.EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
 @router.get("/grouped", response_model=List[UserWithContacts])
 async def read_contacts_grouped(
     request: Request,
     search: str = Query(None),
     sort: str = Query("asc"),
+    contacts_limit: int = Query(20, ge=1, le=100, description="Контактов на пользователя"),
+    users_limit: int = Query(50, ge=1, le=200, description="Пользователей на страницу"),
+    after_user_id: Optional[int] = Query(None, description="Следующая страница: пользователи с id больше этого"),
+    contacts_cursor: Optional[str] = Query(None, description="contacts_next_cursor пользователя: следующие его контакты"),
+    fieldset: ContactFieldset = Depends(contact_fieldset),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    # Определяем, кого возвращать
-    query_users = db.query(models.User)
-    
-    if current_user.role == "superadmin":
-        # Все пользователи для суперадмина
-        pass
-    elif current_user.role == "admin":
-        # Все пользователи для админа
-        pass
+    """
+    Контакты, сгруппированные по пользователям. Пользователи идут по id страницами по
+    users_limit (следующая — after_user_id=<id последнего>), у каждого — первые
+    contacts_limit контактов по имени. Поиск, сортировка и лимиты выполняются в SQL.
+    Если у пользователя есть ещё контакты, в contacts_next_cursor приходит курсор;
+    запрос с contacts_cursor (и теми же search, sort) вернёт только его группу со следующей страницей.
+    fields= и include= ограничивают поля и связи контактов (см. serialization.contact_fieldset).
+    """
+    sort = "desc" if sort == "desc" else "asc"
+    key = (models.Contact.first_name, models.Contact.id)
+    if sort == "desc":
+        order = (models.Contact.first_name.desc(), models.Contact.id.desc())
     else:
-        # Только свои контакты для обычного пользователя
-        query_users = query_users.filter(models.User.id == current_user.id)
+        order = (models.Contact.first_name.asc(), models.Contact.id.asc())
+    filters = [crud.contact_search_filter(search)] if search else []
+    # first_name нужен для курсора, user_id — для группировки
+    load_options = fieldset.load_options("first_name", "user_id")
+
+    # Определяем, кого возвращать: админам и суперадмину — всех, обычному пользователю — только себя
+    query_users = select(models.User).order_by(models.User.id)
+    if current_user.role not in ["superadmin", "admin"]:
+        query_users = query_users.where(models.User.id == current_user.id)
 
-    # Жадно грузим контакты
-    query_users = query_users.options(joinedload(models.User.contacts))
-    users = query_users.all()
+    if contacts_cursor:
+        # Следующая страница контактов одного пользователя
+        owner_id, first_name, contact_id = decode_cursor(contacts_cursor, sort, (int, str, int))
+        users = (await db.execute(query_users.where(models.User.id == owner_id))).scalars().all()
+        contacts_query = (
+            select(models.Contact)
+            .options(*load_options)
+            .where(models.Contact.user_id == owner_id,
+                   keyset_filter(key, [first_name, contact_id], sort == "desc"), *filters)
+            .order_by(*order)
+            .limit(contacts_limit + 1)
+        )
+        contacts_by_user = {owner_id: (await db.execute(contacts_query)).scalars().all()} if users else {}
+    else:
+        if after_user_id is not None:
+            query_users = query_users.where(models.User.id > after_user_id)
+        users = (await db.execute(query_users.limit(users_limit))).scalars().all()
+        # Лишний контакт на пользователя показывает, есть ли у него следующая страница
+        contacts_by_user = await crud.top_contacts_per_user(
+            db, [u.id for u in users], contacts_limit + 1, order, *filters, options=load_options
+        )
     logging.info(f"/contacts/grouped: found {len(users)} users for role {current_user.role}")
 
-    # Фильтрация и сортировка контактов на уровне Python
     result = []
     for u in users:
-        contacts = u.contacts
-        if search:
-            search_lc = search.lower()
-            contacts = [c for c in contacts if search_lc in (c.first_name or '').lower() or search_lc in (c.last_name or '').lower() or search_lc in (c.email or '').lower()]
-        if sort == "desc":
-            contacts = sorted(contacts, key=lambda c: (c.first_name or '').lower(), reverse=True)
-        else:
-            contacts = sorted(contacts, key=lambda c: (c.first_name or '').lower())
+        contacts = contacts_by_user.get(u.id, [])
+        next_cursor = None
+        if len(contacts) > contacts_limit:
+            contacts = contacts[:contacts_limit]
+            next_cursor = encode_cursor([u.id, contacts[-1].first_name, contacts[-1].id], sort)
         
         # Улучшенная проверка и исправление email перед сериализацией
         email = u.email
@@ -93,16 +218,18 @@ async def read_contacts_grouped(
             email = f"{safe_username}@example.com"
             logging.info(f"Исправлен email для пользователя {u.id} с '{u.email}' на '{email}'")
             
-        # Сериализуем ORM-объекты через pydantic
-        contacts_data = [schemas.Contact.model_validate(c, from_attributes=True) for c in contacts]
         try:
-            result.append(schemas.UserWithContacts(
+            # Через pydantic проверяется только сам пользователь; контакты сериализуются
+            # напрямую из ORM (serialization.dump_contacts)
+            user_data = schemas.UserWithContacts(
                 id=u.id,
                 username=u.username,
                 email=email,
                 role=u.role or "user",
-                contacts=contacts_data
-            ))
+                contacts_next_cursor=next_cursor
+            ).model_dump()
+            user_data["contacts"] = dump_contacts(contacts, fieldset)
+            result.append(user_data)
         except Exception as e:
             logging.error(f"Ошибка при создании UserWithContacts для пользователя {u.id}: {str(e)}")
             # Создаем гарантированно валидный email
@@ -115,18 +242,27 @@ async def read_contacts_grouped(
                 email=fallback_email,
                 role=u.role or "user",
                 contacts=[]
-            ))
-    return result
+            ).model_dump())
+    return json_response(result)
 
 @router.get("/grouped/birthdays", response_model=List[UserWithBirthdays])
 async def read_birthdays_grouped_by_users(
     request: Request,
+    contacts_limit: int = Query(20, ge=1, le=100, description="Контактов на пользователя"),
+    users_limit: int = Query(50, ge=1, le=200, description="Пользователей на страницу"),
+    after_user_id: Optional[int] = Query(None, description="Следующая страница: пользователи с id больше этого"),
+    contacts_cursor: Optional[str] = Query(None, description="contacts_next_cursor пользователя: следующие его контакты"),
+    fieldset: ContactFieldset = Depends(contact_fieldset),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Получение дней рождения, сгруппированных по пользователям.
     Только для администраторов и суперадминов.
+    Как и /contacts/grouped: пользователи с днями рождения контактов идут по id страницами
+    по users_limit (следующая — after_user_id=<id последнего>), у каждого — ближайшие
+    contacts_limit контактов; продолжение списка одного пользователя — по contacts_next_cursor.
+    Число запросов зависит только от размера страницы, а не от числа пользователей и контактов.
     """
     # Проверяем, что пользователь имеет права администратора
     if current_user.role not in ["superadmin", "admin"]:
@@ -135,44 +271,54 @@ async def read_birthdays_grouped_by_users(
             detail="Недостаточно прав для доступа к этому ресурсу"
         )
     
-    # Получаем всех пользователей
-    query_users = db.query(models.User)
-    users = query_users.all()
+    today = date.today()
+    order = crud.birthday_order(today)
+    # birthday_md нужен для курсора и признака «в ближайшие 7 дней», user_id — для группировки
+    load_options = fieldset.load_options("birthday_md", "user_id")
+    
+    # Только пользователи, у которых есть контакты с датой рождения (окно 12 месяцев — это все такие)
+    query_users = select(models.User).where(
+        select(models.Contact.id)
+        .where(models.Contact.user_id == models.User.id, crud.birthday_window(today, 365))
+        .exists()
+    ).order_by(models.User.id)
+    
+    if contacts_cursor:
+        # Следующая страница контактов одного пользователя
+        owner_id, *key = decode_cursor(contacts_cursor, "asc", (int, int, int, int))
+        users = (await db.execute(query_users.where(models.User.id == owner_id))).scalars().all()
+        contacts_query = (
+            select(models.Contact)
+            .options(*load_options)
+            .where(models.Contact.user_id == owner_id, crud.birthday_window(today, 365),
+                   keyset_filter(order, key))
+            .order_by(*order)
+            .limit(contacts_limit + 1)
+        )
+        contacts_by_user = {owner_id: (await db.execute(contacts_query)).scalars().all()} if users else {}
+    else:
+        if after_user_id is not None:
+            query_users = query_users.where(models.User.id > after_user_id)
+        users = (await db.execute(query_users.limit(users_limit))).scalars().all()
+        # Ближайшие первыми, с лимитом на пользователя в SQL (row_number по user_id);
+        # лишний контакт показывает, есть ли у пользователя следующая страница
+        contacts_by_user = await crud.top_contacts_per_user(
+            db, [u.id for u in users], contacts_limit + 1, order,
+            crud.birthday_window(today, 365), options=load_options
+        )
     
     result = []
-    today = date.today()
-    in_seven_days = today + timedelta(days=7)
-    today_md = today.month * 100 + today.day
-    in_seven_days_md = in_seven_days.month * 100 + in_seven_days.day
     
     for user in users:
-        # Дни рождения в ближайшие 7 дней
-        next7_query = db.query(models.Contact).filter(
-            models.Contact.user_id == user.id,
-            models.Contact.birthday.isnot(None)
-        )
-        
-        if today_md <= in_seven_days_md:
-            next7_contacts = next7_query.filter(
-                birthday_md_expr().between(today_md, in_seven_days_md)
-            ).all()
-        else:
-            next7_contacts = next7_query.filter(
-                or_(
-                    birthday_md_expr().between(today_md, 1231),
-                    birthday_md_expr().between(101, in_seven_days_md)
-                )
-            ).all()
-        
-        # Дни рождения в ближайшие 12 месяцев
-        next12_contacts = db.query(models.Contact).filter(
-            models.Contact.user_id == user.id,
-            models.Contact.birthday.isnot(None),
-            birthday_md_expr() >= today_md
-        ).order_by(
-            extract('month', models.Contact.birthday),
-            extract('day', models.Contact.birthday)
-        ).all()
+        next12_contacts = contacts_by_user.get(user.id, [])
+        next_cursor = None
+        if len(next12_contacts) > contacts_limit:
+            next12_contacts = next12_contacts[:contacts_limit]
+            last = next12_contacts[-1]
+            wrapped = 1 if last.birthday_md < crud.month_day(today) else 0
+            next_cursor = encode_cursor([user.id, wrapped, last.birthday_md, last.id], "asc")
+        # Ближайшие 7 дней — начало того же списка
+        next7_contacts = [c for c in next12_contacts if crud.in_birthday_window(c.birthday_md, today, 7)]
         
         # Не добавляем пользователей без контактов с днями рождения
         if next7_contacts or next12_contacts:
@@ -185,18 +331,17 @@ async def read_birthdays_grouped_by_users(
                 logging.info(f"Исправлен email для пользователя {user.id} с '{user.email}' на '{email}'")
             
             try:
-                # Сериализуем контакты
-                next7_data = [schemas.Contact.model_validate(c, from_attributes=True) for c in next7_contacts]
-                next12_data = [schemas.Contact.model_validate(c, from_attributes=True) for c in next12_contacts]
-                
-                result.append(schemas.UserWithBirthdays(
+                # Через pydantic проверяется только сам пользователь, контакты — напрямую из ORM
+                user_data = schemas.UserWithBirthdays(
                     id=user.id,
                     username=user.username,
                     email=email,
                     role=user.role or "user",
-                    contacts_next7days=next7_data,
-                    contacts_next12months=next12_data
-                ))
+                    contacts_next_cursor=next_cursor
+                ).model_dump()
+                user_data["contacts_next7days"] = dump_contacts(next7_contacts, fieldset)
+                user_data["contacts_next12months"] = dump_contacts(next12_contacts, fieldset)
+                result.append(user_data)
             except Exception as e:
                 logging.error(f"Ошибка при создании UserWithBirthdays для пользователя {user.id}: {str(e)}")
                 # Создаем гарантированно валидный email
@@ -211,11 +356,23 @@ async def read_birthdays_grouped_by_users(
                     role=user.role or "user",
                     contacts_next7days=[],
                     contacts_next12months=[]
-                ))
+                ).model_dump())
     
-    return result
+    return json_response(result)
 
-@router.get("/", response_model=List[ContactSchema])
+# Курсор следующей страницы отдаётся в заголовке, тело остаётся списком контактов
+NEXT_CURSOR_RESPONSES = {
+    200: {
+        "headers": {
+            "X-Next-Cursor": {
+                "description": "Курсор следующей страницы для cursor=; нет заголовка — страница последняя",
+                "schema": {"type": "string"},
+            }
+        }
+    }
+}
+
+@router.get("/", response_model=List[ContactSchema], responses=NEXT_CURSOR_RESPONSES)
 async def read_contacts(
     request: Request,
     skip: int = 0,
@@ -223,125 +380,186 @@ async def read_contacts(
     search: str = Query(None),
     sort: str = Query("asc"),
     user_id: Optional[int] = Query(None),
+    cursor: Optional[str] = Query(None, description="Курсор следующей страницы из заголовка X-Next-Cursor"),
+    fieldset: ContactFieldset = Depends(contact_fieldset),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    query = db.query(models.Contact)
+    """
+    Список контактов по имени. Постранично — через skip/limit или курсором:
+    если за страницей есть ещё контакты, в заголовке X-Next-Cursor приходит курсор,
+    который передаётся в cursor= вместе с теми же sort, search и user_id (skip при этом не нужен).
+    fields= и include= ограничивают загружаемые и отдаваемые поля и связи, например
+    fields=first_name,last_name,email,birthday&include=avatars — один запрос на связь вместо четырёх.
+    """
+    # first_name нужен для курсора, даже если его нет в fields
+    query = select(models.Contact).options(*fieldset.load_options("first_name"))
     
     # Если не указан user_id и это супер-админ — показываем все контакты
     if user_id is not None:
-        query = query.filter(models.Contact.user_id == user_id)
+        query = query.where(models.Contact.user_id == user_id)
     elif current_user.role != "superadmin":
         # Обычный пользователь — только свои контакты
-        query = query.filter(models.Contact.user_id == current_user.id)
+        query = query.where(models.Contact.user_id == current_user.id)
     
     # superadmin без user_id — все контакты
     if search:
-        search_pattern = f"%{search}%"
-        query = query.filter(
-            (models.Contact.first_name.ilike(search_pattern)) |
-            (models.Contact.last_name.ilike(search_pattern)) |
-            (models.Contact.email.ilike(search_pattern))
-        )
+        query = query.where(crud.contact_search_filter(search))
     
+    # id — детерминированный порядок при одинаковых именах; сортировка идёт по индексу (user_id, first_name, id)
+    sort = "desc" if sort == "desc" else "asc"
+    key = (models.Contact.first_name, models.Contact.id)
     if sort == "desc":
-        query = query.order_by(models.Contact.first_name.desc())
+        query = query.order_by(models.Contact.first_name.desc(), models.Contact.id.desc())
     else:
-        query = query.order_by(models.Contact.first_name.asc())
-    
-    return query.offset(skip).limit(limit).all()
+        query = query.order_by(models.Contact.first_name.asc(), models.Contact.id.asc())
+
+    if cursor:
+        query = query.where(keyset_filter(key, decode_cursor(cursor, sort, (str, int)), sort == "desc"))
+    else:
+        query = query.offset(skip)
+
+    # Лишняя строка показывает, есть ли следующая страница
+    contacts = (await db.execute(query.limit(limit + 1))).scalars().all()
+    headers = {}
+    if len(contacts) > limit:
+        contacts = contacts[:limit]
+        last = contacts[-1]
+        headers["X-Next-Cursor"] = encode_cursor([last.first_name, last.id], sort)
+    return json_response(dump_contacts(contacts, fieldset), headers=headers)
 
 @router.get("/search/", response_model=List[ContactSchema])
 async def search_contacts(
     request: Request,
     query: str, 
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=500),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    results = crud.search_contacts(db, query)
-    # Фильтруем результаты по доступу пользователя
-    if current_user.role not in ["superadmin", "admin"]:
-        results = [contact for contact in results if contact.user_id == current_user.id]
+    """Поиск подстроки по имени, фамилии и email; страницы по имени, доступ — по правилам check_contact_access."""
+    return await crud.search_contacts(db, query, contact_access_filter(current_user), skip, limit)
+
+@router.get("/fulltext", response_model=List[ContactSearchResult])
+async def fulltext_search_contacts(
+    request: Request,
+    q: str = Query(..., min_length=1, max_length=200),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=100),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Полнотекстовый поиск по имени, фамилии, email, телефонам и extra_info.
+    Результаты упорядочены по релевантности, доступ — по правилам check_contact_access.
+    """
+    # Предел времени действует до конца транзакции запроса, т.е. только на сам поиск
+    await db.execute(text(f"SET LOCAL statement_timeout = {FULLTEXT_SEARCH_TIMEOUT_MS}"))
+    try:
+        rows = await crud.fulltext_search_contacts(db, q, contact_access_filter(current_user), skip, limit)
+    except DBAPIError as e:
+        if getattr(e.orig, "pgcode", None) == QUERY_CANCELED:
+            logging.warning(f"/contacts/fulltext: поиск '{q}' превысил {FULLTEXT_SEARCH_TIMEOUT_MS} мс")
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Поиск занял слишком много времени, уточните запрос"
+            )
+        raise
+    results = []
+    for contact, rank in rows:
+        hit = ContactSearchResult.model_validate(contact, from_attributes=True)
+        hit.rank = rank
+        results.append(hit)
     return results
 
+@router.get("/by-phone/{number}", response_model=List[PhoneLookupResult])
+async def find_contacts_by_phone(
+    request: Request,
+    number: str,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Кто звонит: контакты с этим номером в любом написании (+, пробелы, скобки, дефисы, 00)."""
+    if not normalize_phone_number(number):
+        raise HTTPException(status_code=400, detail="Номер должен содержать цифры")
+    rows = await crud.find_contacts_by_phone(db, number, contact_access_filter(current_user))
+    return [
+        PhoneLookupResult(contact_id=row.id, user_id=row.user_id, first_name=row.first_name,
+                          last_name=row.last_name, email=row.email, number=row.number, label=row.label)
+        for row in rows
+    ]
+
 @router.get("/birthdays/", response_model=List[ContactSchema])
 async def get_upcoming_birthdays(
     request: Request,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=500),
+    fieldset: ContactFieldset = Depends(contact_fieldset),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    results = crud.contacts_with_upcoming_birthdays(db)
-    # Фильтруем результаты по доступу пользователя
-    if current_user.role not in ["superadmin", "admin"]:
-        results = [contact for contact in results if contact.user_id == current_user.id]
-    return results
-
-def birthday_md_expr():
-    return extract('month', models.Contact.birthday) * 100 + extract('day', models.Contact.birthday)
+    """Дни рождения в ближайшие 7 дней, ближайшие первыми; доступ — по правилам check_contact_access."""
+    results = await crud.contacts_with_upcoming_birthdays(
+        db, contact_access_filter(current_user), skip, limit, fieldset.load_options()
+    )
+    return json_response(dump_contacts(results, fieldset))
 
 @router.get("/birthdays/next7days", response_model=List[ContactSchema])
 async def get_upcoming_birthdays_next7days(
     request: Request,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=500),
+    fieldset: ContactFieldset = Depends(contact_fieldset),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     today = date.today()
-    in_seven_days = today + timedelta(days=7)
-    today_md = today.month * 100 + today.day
-    in_seven_days_md = in_seven_days.month * 100 + in_seven_days.day
 
-    query = db.query(models.Contact).filter(models.Contact.birthday.isnot(None))
+    query = select(models.Contact).options(*fieldset.load_options()).where(crud.birthday_window(today, 7))
     
     # Ограничиваем доступ для обычных пользователей
     if current_user.role not in ["superadmin", "admin"]:
-        query = query.filter(models.Contact.user_id == current_user.id)
+        query = query.where(models.Contact.user_id == current_user.id)
 
-    if today_md <= in_seven_days_md:
-        contacts = query.filter(
-            birthday_md_expr().between(today_md, in_seven_days_md)
-        ).all()
-    else:
-        contacts = query.filter(
-            or_(
-                birthday_md_expr().between(today_md, 1231),
-                birthday_md_expr().between(101, in_seven_days_md)
-            )
-        ).all()
-    return contacts
+    # Постранично, как /birthdays/: объём ответа и число запросов не растут с числом контактов
+    query = query.order_by(*crud.birthday_order(today)).offset(skip).limit(limit)
+    contacts = (await db.execute(query)).scalars().all()
+    return json_response(dump_contacts(contacts, fieldset))
 
 @router.get("/birthdays/next12months", response_model=List[ContactSchema])
 async def get_birthdays_next_12_months(
     request: Request,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=500),
+    fieldset: ContactFieldset = Depends(contact_fieldset),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     today = date.today()
-    today_md = today.month * 100 + today.day
     
-    query = db.query(models.Contact).filter(
-        models.Contact.birthday.isnot(None),
-        birthday_md_expr() >= today_md
+    # Весь год вперёд от сегодняшнего дня: после 31 декабря идут дни рождения с начала года
+    query = select(models.Contact).options(*fieldset.load_options()).where(
+        crud.birthday_window(today, 365)
     )
     
     # Ограничиваем доступ для обычных пользователей
     if current_user.role not in ["superadmin", "admin"]:
-        query = query.filter(models.Contact.user_id == current_user.id)
+        query = query.where(models.Contact.user_id == current_user.id)
         
-    contacts = query.order_by(
-        extract('month', models.Contact.birthday),
-        extract('day', models.Contact.birthday)
-    ).all()
+    # Так же постранично
+    query = query.order_by(*crud.birthday_order(today)).offset(skip).limit(limit)
+    contacts = (await db.execute(query)).scalars().all()
     
-    return contacts
+    return json_response(dump_contacts(contacts, fieldset))
 
 @router.get("/{contact_id}", response_model=ContactSchema)
 async def read_contact(
     request: Request,
     contact_id: int, 
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    db_contact = crud.get_contact(db, contact_id)
+    db_contact = await crud.get_contact(db, contact_id)
     if db_contact is None:
         raise HTTPException(status_code=404, detail="Contact not found")
         
@@ -360,10 +578,10 @@ async def update_contact(
     contact_id: int, 
     contact: ContactUpdate, 
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     # Проверяем существование контакта
-    existing_contact = crud.get_contact(db, contact_id)
+    existing_contact = await crud.get_contact(db, contact_id)
     if not existing_contact:
         raise HTTPException(status_code=404, detail="Contact not found")
         
@@ -375,7 +593,7 @@ async def update_contact(
         )
     
     logging.info(f"[ROUTER] update_contact RAW: {contact}")
-    db_contact = crud.update_contact(db, contact_id, contact)
+    db_contact = await crud.update_contact(db, contact_id, contact)
     return db_contact
 
 @router.delete("/{contact_id}", response_model=ContactSchema)
@@ -383,10 +601,10 @@ async def delete_contact(
     request: Request,
     contact_id: int, 
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     # Проверяем существование контакта
-    existing_contact = crud.get_contact(db, contact_id)
+    existing_contact = await crud.get_contact(db, contact_id)
     if not existing_contact:
         raise HTTPException(status_code=404, detail="Contact not found")
         
@@ -397,5 +615,5 @@ async def delete_contact(
             detail="Not enough permissions to delete this contact"
         )
         
-    db_contact = crud.delete_contact(db, contact_id)
+    db_contact = await crud.delete_contact(db, contact_id)
     return db_contact
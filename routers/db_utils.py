@@ -2,25 +2,32 @@ from fastapi import APIRouter, HTTPException, Request, Depends, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.exc import OperationalError
 from sqlalchemy import inspect, text
-from database import engine, SessionLocal, is_docker_environment, is_render_environment
-import models
-from faker import Faker
-import psycopg2
-import os
+from database import engine, SessionLocal, replica_engine, ReplicaSyncSessionLocal, is_docker_environment, is_render_environment
+from migrations import upgrade
+from request_timing import TimedRoute
+from utils_phone import normalize_phone_number
+from settings import settings
+from principal_cache import invalidate_user, invalidate_all_users
 import re
 from urllib.parse import urlparse
 from typing import Optional
+from functools import lru_cache
 
 # Создаем специальную схему OAuth2, которая не вызывает ошибку при отсутствии токена
 optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/token", auto_error=False)
 
 # Удаляем префикс "/db", так как он уже указан в main.py при подключении роутера
-router = APIRouter(tags=["Database Utils"])
-faker = Faker()
+router = APIRouter(tags=["Database Utils"], route_class=TimedRoute)
+
+# Faker нужен только для /db/fill-fake, поэтому импортируем и создаём его при первом вызове
+@lru_cache(maxsize=None)
+def get_faker():
+    from faker import Faker
+    return Faker()
 
 # Функция для получения параметров подключения к базе данных
 def get_db_params():
-    database_url = os.getenv("DATABASE_URL")
+    database_url = settings.database_url
     
     if database_url:
         # Исправляем URL для совместимости
@@ -47,17 +54,17 @@ def get_db_params():
             }
     
     # Второй приоритет: отдельные переменные окружения
-    db_name = os.getenv('DB_NAME', 'contacts_db')
-    db_user = os.getenv('DB_USER', 'postgres')
-    db_password = os.getenv('DB_PASSWORD', 'postgres')
+    db_name = settings.db_name or 'contacts_db'
+    db_user = settings.db_user or 'postgres'
+    db_password = settings.db_password or 'postgres'
     
     # Определяем host в зависимости от окружения
     if is_docker_environment():
-        db_host = os.getenv('DB_HOST', 'db')  # 'db' - для Docker
+        db_host = settings.db_host or 'db'  # 'db' - для Docker
     else:
-        db_host = os.getenv('DB_HOST', 'localhost')  # 'localhost' - для локальной разработки
+        db_host = settings.db_host or 'localhost'  # 'localhost' - для локальной разработки
         
-    db_port = os.getenv('DB_PORT', '5432')
+    db_port = settings.db_port
     
     return {
         'host': db_host,
@@ -85,7 +92,7 @@ def db_init():
         tables = inspector.get_table_names()
         if tables:
             return {"status": "exists", "message": "Таблиці вже створені."}
-        models.Base.metadata.create_all(bind=engine)
+        upgrade(engine)
         return {"status": "created", "message": "Таблиці успішно створені."}
     except OperationalError:
         raise HTTPException(status_code=500, detail="Немає підключення до бази даних.")
@@ -96,7 +103,7 @@ def db_fill_fake(n: int = 10, request: Request = None):
         db = SessionLocal()
         inspector = inspect(engine)
         if not inspector.get_table_names():
-            models.Base.metadata.create_all(bind=engine)
+            upgrade(engine)
         from models import Contact, PhoneNumber, User
         import random
         
@@ -164,6 +171,7 @@ def db_fill_fake(n: int = 10, request: Request = None):
             
         # Создаем контакты с полученным user_id
         import logging
+        faker = get_faker()
         for _ in range(n):
             first_name = faker.first_name() or "John"
             last_name = faker.last_name() or "Doe"
@@ -187,6 +195,7 @@ def db_fill_fake(n: int = 10, request: Request = None):
                     cleaned_number = '+380' + faker.msisdn()[:9]
                 pn = PhoneNumber(
                     number=cleaned_number,
+                    normalized_number=normalize_phone_number(cleaned_number),
                     label=random.choice(["home", "work", "mobile"]),
                     contact_id=contact.id
                 )
@@ -264,6 +273,11 @@ def db_clear(request: Request = None):
             return {"status": "error", "message": "Необхідна авторизація для видалення контактів."}
             
         db.commit()
+        # Данные пользователей в кеше аутентификации перечитываются из базы
+        if is_admin:
+            invalidate_all_users()
+        else:
+            invalidate_user(user_id)
         return {"status": "ok", "message": msg}
     except OperationalError:
         raise HTTPException(status_code=500, detail="Немає підключення до бази даних.")
@@ -277,13 +291,14 @@ def db_clear(request: Request = None):
 # Обновляем endpoint, чтобы он работал даже без авторизации
 @router.get("/check-state")
 def db_check_state(token: Optional[str] = Depends(optional_oauth2_scheme)):
+    # Только чтение — считаем на реплике (без неё replica_engine совпадает с engine)
     try:
-        inspector = inspect(engine)
+        inspector = inspect(replica_engine)
         tables = inspector.get_table_names()
         if not tables:
             return {"status": "no_tables", "message": "База існує, контактів 0 (тобто немає, створіть контакти)"}
         # Проверяем количество контактов
-        db = SessionLocal()
+        db = ReplicaSyncSessionLocal()
         try:
             count = db.execute(text("SELECT COUNT(*) FROM contacts")).scalar()
             if count == 0:
@@ -298,6 +313,7 @@ def db_check_state(token: Optional[str] = Depends(optional_oauth2_scheme)):
 
 @router.post("/create-db")
 def create_database(request: Request):
+    import psycopg2
     # Получаем параметры для подключения к базе данных
     params = get_db_params()
     
@@ -344,6 +360,7 @@ def create_database(request: Request):
 
 @router.post("/drop-db")
 def drop_database(request: Request):
+    import psycopg2
     # Получаем параметры подключения
     params = get_db_params()
     
@@ -376,6 +393,8 @@ def drop_database(request: Request):
         cur.execute(f"DROP DATABASE {params['db_name']}")
         cur.close()
         conn.close()
+        # Пользователей больше нет — их токены не должны проходить по кешу
+        invalidate_all_users()
         return {"status": "dropped", "message": f"База даних '{params['db_name']}' видалена."}
     except psycopg2.OperationalError as e:
         error_msg = str(e)
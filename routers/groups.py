@@ -1,43 +1,37 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
 import crud, models, schemas
-from database import SessionLocal
+from database import get_db
+from request_timing import TimedRoute
 
-router = APIRouter(prefix="/groups", tags=["Groups"])
-
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+router = APIRouter(prefix="/groups", tags=["Groups"], route_class=TimedRoute)
 
 @router.post("/", response_model=schemas.Group)
-def create_group(group: schemas.GroupCreate, db: Session = Depends(get_db)):
-    return crud.create_group(db, group)
+async def create_group(group: schemas.GroupCreate, db: AsyncSession = Depends(get_db)):
+    return await crud.create_group(db, group)
 
 @router.get("/", response_model=List[schemas.Group])
-def read_groups(db: Session = Depends(get_db)):
-    return crud.get_groups(db)
+async def read_groups(db: AsyncSession = Depends(get_db)):
+    return await crud.get_groups(db)
 
 @router.get("/{group_id}", response_model=schemas.Group)
-def read_group(group_id: int, db: Session = Depends(get_db)):
-    db_group = crud.get_group(db, group_id)
+async def read_group(group_id: int, db: AsyncSession = Depends(get_db)):
+    db_group = await crud.get_group(db, group_id)
     if db_group is None:
         raise HTTPException(status_code=404, detail="Group not found")
     return db_group
 
 @router.put("/{group_id}", response_model=schemas.Group)
-def update_group(group_id: int, group: schemas.GroupCreate, db: Session = Depends(get_db)):
-    db_group = crud.update_group(db, group_id, group)
+async def update_group(group_id: int, group: schemas.GroupCreate, db: AsyncSession = Depends(get_db)):
+    db_group = await crud.update_group(db, group_id, group)
     if db_group is None:
         raise HTTPException(status_code=404, detail="Group not found")
     return db_group
 
 @router.delete("/{group_id}", response_model=schemas.Group)
-def delete_group(group_id: int, db: Session = Depends(get_db)):
-    db_group = crud.delete_group(db, group_id)
+async def delete_group(group_id: int, db: AsyncSession = Depends(get_db)):
+    db_group = await crud.delete_group(db, group_id)
     if db_group is None:
         raise HTTPException(status_code=404, detail="Group not found")
     return db_group
@@ -0,0 +1,54 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from models import User
+from auth import get_current_user
+from request_timing import TimedRoute
+from principal_cache import get_cache_stats
+import password_service
+from database import engine, async_engine, replica_engine, replica_async_engine, REPLICA_DATABASE_URL, DB_PGBOUNCER, DB_POOL_PRE_PING
+from db_metrics import sync_pool_metrics, async_pool_metrics, replica_sync_pool_metrics, replica_async_pool_metrics
+
+router = APIRouter(prefix="/metrics", tags=["Metrics"], route_class=TimedRoute)
+
+# Метрики доступны только администраторам и суперадминам
+def require_admin(current_user: User = Depends(get_current_user)):
+    if current_user.role not in ["superadmin", "admin"]:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Недостаточно прав для доступа к этому ресурсу"
+        )
+    return current_user
+
+@router.get("/auth-cache")
+async def auth_cache_metrics(current_user: User = Depends(require_admin)):
+    """
+    Счётчики кеша аутентификации: попадания, промахи, вытеснения.
+    Каждое попадание в кеш пользователей — сэкономленный запрос к БД.
+    """
+    return get_cache_stats()
+
+@router.get("/password-hashing")
+async def password_hashing_metrics(current_user: User = Depends(require_admin)):
+    """
+    Состояние пула хеширования паролей: задачи в работе, глубина очереди, отказы.
+    """
+    return password_service.get_stats()
+
+@router.get("/db-pool")
+async def db_pool_metrics(current_user: User = Depends(require_admin)):
+    """
+    Состояние пулов соединений: занятые и overflow-соединения, ожидание свободного
+    соединения и перцентили латентности checkout.
+    """
+    data = {
+        "pgbouncer": DB_PGBOUNCER,
+        "pre_ping": DB_POOL_PRE_PING,
+        "async": async_pool_metrics.snapshot(async_engine.pool),
+        "sync": sync_pool_metrics.snapshot(engine.pool),
+        "replica": None,
+    }
+    if REPLICA_DATABASE_URL:
+        data["replica"] = {
+            "async": replica_async_pool_metrics.snapshot(replica_async_engine.pool),
+            "sync": replica_sync_pool_metrics.snapshot(replica_engine.pool),
+        }
+    return data
@@ -1,6 +1,7 @@
 from fastapi import APIRouter, Depends, HTTPException, Request, Response, File, UploadFile, Form
-from sqlalchemy.orm import Session
-from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from sqlalchemy import select, update
 from datetime import timedelta, datetime
 from typing import Optional, List
 
@@ -11,14 +12,17 @@ from schemas import UserResponse
 from utils_cloudinary import upload_image, delete_image
 # Импортируем функцию ограничения запросов
 from rate_limiter import check_rate_limit_me
+from principal_cache import invalidate_user
+from request_timing import TimedRoute
 
 router = APIRouter(
     prefix="/users",
     tags=["users"],
+    route_class=TimedRoute,
 )
 
 @router.get("/me", response_model=UserResponse, dependencies=[Depends(check_rate_limit_me)])
-async def get_current_user_info(request: Request, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+async def get_current_user_info(request: Request, current_user: User = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
     """
     Получить информацию о текущем авторизованном пользователе
     Ограничение: 5 запросов в минуту
@@ -27,11 +31,11 @@ async def get_current_user_info(request: Request, current_user: User = Depends(g
     avatar_url = None
     
     # Получаем пользователя с активной сессией
-    user_with_session = db.query(User).filter(User.id == current_user.id).first()
+    user_with_session = (await db.execute(select(User).where(User.id == current_user.id))).scalars().first()
     
     if user_with_session:
         # Загружаем аватары пользователя (если есть)
-        avatars = db.query(UserAvatar).filter(UserAvatar.user_id == user_with_session.id).all()
+        avatars = (await db.execute(select(UserAvatar).where(UserAvatar.user_id == user_with_session.id))).scalars().all()
         
         if avatars:
             # Ищем основной аватар со статусом approved
@@ -71,7 +75,7 @@ async def update_username(
     response: Response,
     username_data: dict,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Обновить имя пользователя
@@ -82,19 +86,20 @@ async def update_username(
     new_username = username_data["username"]
     
     # Проверка, не занято ли имя пользователя
-    existing_user = db.query(User).filter(User.username == new_username, User.id != current_user.id).first()
+    existing_user = (await db.execute(select(User).where(User.username == new_username, User.id != current_user.id))).scalars().first()
     if existing_user:
         raise HTTPException(status_code=400, detail="Username already taken")
     
     # Получаем пользователя из текущей сессии для обновления
-    user_to_update = db.query(User).filter(User.id == current_user.id).first()
+    user_to_update = (await db.execute(select(User).where(User.id == current_user.id))).scalars().first()
     if not user_to_update:
         raise HTTPException(status_code=404, detail="User not found")
     
     # Обновляем имя пользователя
     user_to_update.username = new_username
-    db.commit()
-    db.refresh(user_to_update)
+    await db.commit()
+    await db.refresh(user_to_update)
+    invalidate_user(user_to_update.id)
     
     # Создаем новый токен с обновленным именем пользователя
     access_token_expires = timedelta(minutes=60 * 24 * 7)  # 7 дней
@@ -119,7 +124,7 @@ async def update_password(
     request: Request,
     password_data: dict,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Обновить пароль пользователя
@@ -128,17 +133,18 @@ async def update_password(
         raise HTTPException(status_code=400, detail="Current password and new password are required")
     
     # Получаем пользователя из текущей сессии для обновления
-    user_to_update = db.query(User).filter(User.id == current_user.id).first()
+    user_to_update = (await db.execute(select(User).where(User.id == current_user.id))).scalars().first()
     if not user_to_update:
         raise HTTPException(status_code=404, detail="User not found")
     
     # Проверка текущего пароля
-    if not user_to_update.verify_password(password_data["current_password"]):
+    if not await user_to_update.verify_password(password_data["current_password"]):
         raise HTTPException(status_code=400, detail="Current password is incorrect")
     
     # Обновляем пароль
-    user_to_update.hashed_password = User.get_password_hash(password_data["new_password"])
-    db.commit()
+    user_to_update.hashed_password = await User.get_password_hash(password_data["new_password"])
+    await db.commit()
+    invalidate_user(user_to_update.id)
     
     return {"message": "Password updated successfully"}
 
@@ -146,7 +152,7 @@ async def update_password(
 async def reset_password(
     request: Request,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Инициировать процесс сброса пароля
@@ -155,7 +161,7 @@ async def reset_password(
     # Для упрощения в тестовой версии просто возвращаем ответ об успехе
     
     # Получаем пользователя из текущей сессии
-    user_to_reset = db.query(User).filter(User.id == current_user.id).first()
+    user_to_reset = (await db.execute(select(User).where(User.id == current_user.id))).scalars().first()
     if not user_to_reset:
         raise HTTPException(status_code=404, detail="User not found")
     
@@ -169,12 +175,12 @@ async def reset_password(
 async def get_user_avatars(
     request: Request,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Получить список всех аватаров пользователя
     """
-    avatars = db.query(UserAvatar).filter(UserAvatar.user_id == current_user.id).all()
+    avatars = (await db.execute(select(UserAvatar).where(UserAvatar.user_id == current_user.id))).scalars().all()
     
     return [
         {
@@ -192,7 +198,7 @@ async def upload_user_avatar(
     request: Request,
     file: UploadFile = File(...),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Загрузить новый аватар пользователя
@@ -219,18 +225,18 @@ async def upload_user_avatar(
         )
         
         # Проверяем, есть ли у пользователя основной аватар
-        has_main = db.query(UserAvatar).filter(
+        has_main = (await db.execute(select(UserAvatar).where(
             UserAvatar.user_id == current_user.id,
             UserAvatar.is_main == 1
-        ).first() is not None
+        ))).scalars().first() is not None
 
         # Если это первый аватар, делаем его основным
         if not has_main:
             new_avatar.is_main = 1
         
         db.add(new_avatar)
-        db.commit()
-        db.refresh(new_avatar)
+        await db.commit()
+        await db.refresh(new_avatar)
         
         return {
             "id": new_avatar.id,
@@ -249,16 +255,16 @@ async def set_avatar_as_main(
     request: Request,
     avatar_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Установить аватар как основной
     """
     # Проверяем, существует ли аватар и принадлежит ли он пользователю
-    avatar = db.query(UserAvatar).filter(
+    avatar = (await db.execute(select(UserAvatar).where(
         UserAvatar.id == avatar_id,
         UserAvatar.user_id == current_user.id
-    ).first()
+    ))).scalars().first()
     
     if not avatar:
         raise HTTPException(status_code=404, detail="Avatar not found or not owned by user")
@@ -267,13 +273,13 @@ async def set_avatar_as_main(
         raise HTTPException(status_code=400, detail="Avatar is not approved")
     
     # Сначала снимаем флаг основного аватара со всех аватаров пользователя
-    db.query(UserAvatar).filter(
+    await db.execute(update(UserAvatar).where(
         UserAvatar.user_id == current_user.id
-    ).update({"is_main": 0})
+    ).values(is_main=0))
     
     # Устанавливаем текущий аватар как основной
     avatar.is_main = 1
-    db.commit()
+    await db.commit()
     
     return {"message": "Avatar set as main successfully"}
 
@@ -282,16 +288,17 @@ async def delete_user_avatar(
     request: Request,
     avatar_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Удалить аватар пользователя
     """
     # Проверяем, существует ли аватар и принадлежит ли он пользователю
-    avatar = db.query(UserAvatar).filter(
+    # Сообщения по аватару грузим сразу: они удаляются каскадом
+    avatar = (await db.execute(select(UserAvatar).options(selectinload(UserAvatar.messages)).where(
         UserAvatar.id == avatar_id,
         UserAvatar.user_id == current_user.id
-    ).first()
+    ))).scalars().first()
     
     if not avatar:
         raise HTTPException(status_code=404, detail="Avatar not found or not owned by user")
@@ -304,18 +311,18 @@ async def delete_user_avatar(
         delete_image(avatar.cloudinary_public_id)
     
     # Удаляем из базы данных
-    db.delete(avatar)
-    db.commit()
+    await db.delete(avatar)
+    await db.commit()
     
     # Если удаленный аватар был основным, устанавливаем следующий доступный как основной
     if was_main:
-        next_avatar = db.query(UserAvatar).filter(
+        next_avatar = (await db.execute(select(UserAvatar).where(
             UserAvatar.user_id == current_user.id,
             UserAvatar.is_approved == 1
-        ).first()
+        ))).scalars().first()
         
         if next_avatar:
             next_avatar.is_main = 1
-            db.commit()
+            await db.commit()
     
     return {"message": "Avatar deleted successfully"}
\ No newline at end of file
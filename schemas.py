@@ -1,13 +1,14 @@
 from typing import List, Optional
 from datetime import date, datetime
-from pydantic import BaseModel, EmailStr, Field, constr, validator
+from pydantic import BaseModel, ConfigDict, EmailStr, Field, constr, field_validator, model_validator
 import re
 
 class PhoneNumberBase(BaseModel):
     number: constr(strip_whitespace=True, min_length=2, max_length=32)  
     label: Optional[str] = Field(default=None, description="Label: any string or None")
 
-    @validator('number')
+    @field_validator('number')
+    @classmethod
     def validate_number(cls, v):
         pattern = r'^[0-9\-+() ]+$'
         if not re.match(pattern, v):
@@ -19,24 +20,21 @@ class PhoneNumberCreate(PhoneNumberBase):
 
 class PhoneNumber(PhoneNumberBase):
     id: int
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 class Avatar(BaseModel):
     id: int
     file_path: Optional[str]
     is_main: int = 0
     show: int = 1
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 class Photo(BaseModel):
     id: int
     file_path: Optional[str]
     is_main: int = 0
     show: int = 1
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 class GroupBase(BaseModel):
     name: str
@@ -46,8 +44,7 @@ class GroupCreate(GroupBase):
 
 class Group(GroupBase):
     id: int
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 class ContactBase(BaseModel):
     first_name: str
@@ -71,8 +68,78 @@ class Contact(ContactBase):
     avatars: List[Avatar] = []
     photos: List[Photo] = []
     groups: List[Group] = []
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
+
+class ContactSearchResult(Contact):
+    # Релевантность ts_rank_cd: чем больше, тем выше в выдаче
+    rank: float = 0.0
+
+class PhoneLookupResult(BaseModel):
+    """Контакт, найденный по номеру телефона (обратный поиск звонящего)."""
+    contact_id: int
+    user_id: int
+    first_name: str
+    last_name: Optional[str] = None
+    email: str
+    number: str
+    label: Optional[str] = None
+
+class ContactImportError(BaseModel):
+    row: int  # Строка CSV (с заголовком) или номер карточки vCard
+    error: str
+
+class ContactImportReport(BaseModel):
+    """Итог POST /contacts/import: сколько создано, сколько строк отклонено и почему."""
+    imported: int
+    failed: int
+    errors: List[ContactImportError] = []
+
+# Пакетные операции: id не больше этого числа за раз (фильтр — без ограничения)
+BATCH_MAX_IDS = 10000
+
+class ContactBatchFilter(BaseModel):
+    """Какие контакты затрагивает пакетная операция. Условия объединяются через AND, нужно хотя бы одно."""
+    ids: Optional[List[int]] = Field(default=None, max_length=BATCH_MAX_IDS)
+    search: Optional[str] = Field(default=None, description="Подстрока имени, фамилии или email, как в /contacts/search/")
+    user_id: Optional[int] = None
+    group_id: Optional[int] = None
+
+    @model_validator(mode="after")
+    def require_condition(self):
+        # Пустой фильтр затронул бы все доступные контакты — так не бывает случайно
+        if self.ids is None and not self.search and self.user_id is None and self.group_id is None:
+            raise ValueError("Specify ids or at least one of search, user_id, group_id")
+        return self
+
+class ContactBatchPatch(BaseModel):
+    """Значения полей для всех выбранных контактов; не переданные поля не меняются."""
+    first_name: Optional[str] = None
+    last_name: Optional[str] = None
+    email: Optional[EmailStr] = None
+    birthday: Optional[date] = None
+    extra_info: Optional[str] = None
+
+    @field_validator("first_name", "email", "birthday")
+    @classmethod
+    def not_null(cls, v):
+        # Вызывается только для переданных значений: обязательные поля нельзя обнулить
+        if v is None:
+            raise ValueError("Field cannot be null")
+        return v
+
+class ContactBatchUpdate(ContactBatchFilter):
+    patch: Optional[ContactBatchPatch] = None
+    add_group_ids: List[int] = []
+    remove_group_ids: List[int] = []
+
+class ContactBatchResult(BaseModel):
+    """Итог пакетной операции. missing_ids — переданные id, которых нет или к которым нет доступа."""
+    matched: int
+    updated: int = 0
+    deleted: int = 0
+    groups_added: int = 0
+    groups_removed: int = 0
+    missing_ids: List[int] = []
 
 # Добавляю класс UserResponse для эндпоинта /users/me
 class UserResponse(BaseModel):
@@ -84,8 +151,7 @@ class UserResponse(BaseModel):
     created_at: Optional[datetime] = None
     updated_at: Optional[datetime] = None
     
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 class UserWithContacts(BaseModel):
     id: int
@@ -93,8 +159,9 @@ class UserWithContacts(BaseModel):
     email: EmailStr
     role: str
     contacts: List[Contact] = []
-    class Config:
-        orm_mode = True
+    # Курсор следующей страницы контактов этого пользователя (параметр contacts_cursor в /contacts/grouped)
+    contacts_next_cursor: Optional[str] = None
+    model_config = ConfigDict(from_attributes=True)
 
 class UserWithBirthdays(BaseModel):
     """
@@ -108,6 +175,7 @@ class UserWithBirthdays(BaseModel):
     role: Optional[str] = "user"
     contacts_next7days: List[Contact] = []  # Контакты с ДР в ближайшие 7 дней
     contacts_next12months: List[Contact] = []  # Контакты с ДР в ближайшие 12 месяцев
+    # Курсор следующей страницы contacts_next12months (параметр contacts_cursor в /contacts/grouped/birthdays)
+    contacts_next_cursor: Optional[str] = None
     
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
@@ -0,0 +1,119 @@
+"""
+Проверка маршрутизации запросов между основной БД и репликой.
+
+Сервер должен быть запущен с REPLICA_DATABASE_URL (например, docker-compose.replica.yml).
+Скрипт смотрит на заголовок X-DB-Route и проверяет, что:
+  1. GET без недавних записей читает с реплики;
+  2. после записи GET того же клиента идёт в основную БД и видит изменения;
+  3. по истечении окна DB_REPLICA_STICKY_SECONDS чтение возвращается на реплику.
+
+Клиент ходит только с Bearer-токеном, без cookie: окно после записи должно
+держаться по пользователю, как у API-клиентов без cookie jar.
+
+    python scripts/check_db_routing.py --url http://localhost:8000 --username user --password pass
+"""
+import argparse
+import json
+import sys
+import time
+from urllib.error import HTTPError
+from urllib.parse import urlencode
+from urllib.request import Request, urlopen
+
+
+class Response:
+    def __init__(self, status_code, headers, body):
+        self.status_code = status_code
+        self.headers = headers
+        self.body = body
+
+    def json(self):
+        return json.loads(self.body) if self.body else {}
+
+
+class Client:
+    """Минимальный HTTP-клиент на urllib (без cookie: каждый запрос сам по себе)."""
+
+    def __init__(self, base_url, timeout=30):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+
+    def request(self, method, path, headers=None, data=None, json_body=None):
+        headers = dict(headers or {})
+        body = None
+        if data is not None:
+            body = urlencode(data).encode()
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        elif json_body is not None:
+            body = json.dumps(json_body).encode()
+            headers["Content-Type"] = "application/json"
+        request = Request(self.base_url + path, data=body, headers=headers, method=method)
+        try:
+            with urlopen(request, timeout=self.timeout) as response:
+                return Response(response.status, response.headers, response.read())
+        except HTTPError as error:
+            return Response(error.code, error.headers, error.read())
+
+    def get(self, path, headers=None):
+        return self.request("GET", path, headers)
+
+    def post(self, path, headers=None, data=None, json=None):
+        return self.request("POST", path, headers, data=data, json_body=json)
+
+    def delete(self, path, headers=None):
+        return self.request("DELETE", path, headers)
+
+
+def expect(title, response, route):
+    actual = response.headers.get("X-DB-Route")
+    ok = actual == route and response.status_code < 400
+    print(f"[{'OK' if ok else 'FAIL'}] {title}: HTTP {response.status_code}, X-DB-Route={actual} (ожидалось {route})")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Проверка маршрутизации чтения на реплику")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--username", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--sticky-seconds", type=float, default=5)
+    args = parser.parse_args()
+
+    results = []
+    client = Client(args.url)
+    response = client.post("/token", data={"username": args.username, "password": args.password})
+    if response.status_code >= 400:
+        sys.exit(f"Не удалось войти: HTTP {response.status_code} {response.body.decode(errors='replace')}")
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    response = client.get("/users/me", headers=headers)
+    results.append(expect("GET /users/me без записей", response, "replica"))
+    user_id = response.json()["id"]
+    results.append(expect("GET /contacts/ без записей", client.get("/contacts/", headers=headers), "replica"))
+
+    response = client.post("/contacts/", headers=headers, json={
+        "first_name": "Replica",
+        "last_name": "Check",
+        "email": f"replica-check-{int(time.time() * 1000)}@example.com",
+        "birthday": "1990-01-01",
+        "user_id": user_id,
+        "phone_numbers": [],
+    })
+    results.append(expect("POST /contacts/", response, "primary"))
+    contact_id = response.json().get("id")
+
+    results.append(expect("GET только что созданного контакта",
+                          client.get(f"/contacts/{contact_id}", headers=headers), "primary"))
+
+    time.sleep(args.sticky_seconds + 1)
+    results.append(expect("GET после окна read-your-writes",
+                          client.get("/contacts/", headers=headers), "replica"))
+
+    results.append(expect("DELETE тестового контакта",
+                          client.delete(f"/contacts/{contact_id}", headers=headers), "primary"))
+
+    sys.exit(0 if all(results) else 1)
+
+
+if __name__ == "__main__":
+    main()
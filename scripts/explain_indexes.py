@@ -0,0 +1,244 @@
+"""
+Проверка, что горячие запросы используют индексы (EXPLAIN на засеянных данных).
+
+В одной транзакции создаются тестовые пользователи, контакты, телефоны, аватары,
+фото и группы (generate_series), выполняется ANALYZE, затем для каждого запроса
+берётся план EXPLAIN (FORMAT JSON) и проверяется, что в нём есть ожидаемый индекс.
+В конце транзакция откатывается — данные в базе не остаются.
+Если какой-то запрос не использует индекс, скрипт завершается с кодом 1.
+На маленьком наборе данных планировщик вправе предпочесть Seq Scan, поэтому
+по умолчанию засевается около 100 тысяч контактов.
+
+    python migrate.py                       # индексы создаются миграцией 2
+    python scripts/explain_indexes.py
+    python scripts/explain_indexes.py --users 500 --contacts 1000 --verbose
+"""
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text
+from database import engine
+
+SEED_SQL = [
+    # Пользователи с заведомо уникальными именами, чтобы не пересечься с реальными
+    """
+    INSERT INTO users (username, email, hashed_password, role, is_verified)
+    SELECT 'explain_user_' || g, 'explain_user_' || g || '@example.com', 'x', 'user', true
+    FROM generate_series(1, :users) AS g
+    """,
+    """
+    INSERT INTO contacts (user_id, first_name, last_name, email, birthday)
+    SELECT u.id, 'Name' || (g % 997), 'Last' || g, 'c' || u.id || '_' || g || '@example.com',
+           DATE '1970-01-01' + (g * 37 % 20000)
+    FROM users u CROSS JOIN generate_series(1, :contacts) AS g
+    WHERE u.username LIKE 'explain\\_user\\_%'
+    """,
+    """
+    INSERT INTO phone_numbers (contact_id, number, normalized_number, label)
+    SELECT c.id, '+1555' || c.id, '1555' || c.id, 'mobile'
+    FROM contacts c JOIN users u ON u.id = c.user_id
+    WHERE u.username LIKE 'explain\\_user\\_%'
+    """,
+    """
+    INSERT INTO avatars (contact_id, file_path, is_main, show)
+    SELECT c.id, 'avatars/' || c.id || '.png', 1, 1
+    FROM contacts c JOIN users u ON u.id = c.user_id
+    WHERE u.username LIKE 'explain\\_user\\_%' AND c.id % 3 = 0
+    """,
+    """
+    INSERT INTO photos (contact_id, file_path)
+    SELECT c.id, 'photos/' || c.id || '.png'
+    FROM contacts c JOIN users u ON u.id = c.user_id
+    WHERE u.username LIKE 'explain\\_user\\_%' AND c.id % 5 = 0
+    """,
+    """
+    INSERT INTO groups (name)
+    SELECT 'explain_group_' || g FROM generate_series(1, 50) AS g
+    """,
+    """
+    INSERT INTO contact_group (contact_id, group_id)
+    SELECT c.id, gr.id
+    FROM contacts c
+    JOIN users u ON u.id = c.user_id
+    JOIN groups gr ON gr.name = 'explain_group_' || (c.id % 50 + 1)
+    WHERE u.username LIKE 'explain\\_user\\_%'
+    """,
+]
+
+ANALYZE_TABLES = ["users", "contacts", "phone_numbers", "avatars", "photos", "groups", "contact_group"]
+
+# (описание, SQL, ожидаемый индекс). :user_id, :contact_ids, :group_id подставляются после засева
+HOT_QUERIES = [
+    (
+        "Список контактов пользователя по имени (read_contacts)",
+        "SELECT * FROM contacts WHERE user_id = :user_id ORDER BY first_name, id LIMIT 100",
+        "ix_contacts_user_id_first_name_id",
+    ),
+    (
+        "Список контактов пользователя по имени, desc",
+        "SELECT * FROM contacts WHERE user_id = :user_id ORDER BY first_name DESC, id DESC LIMIT 100",
+        "ix_contacts_user_id_first_name_id",
+    ),
+    (
+        "Следующая страница по курсору (keyset)",
+        "SELECT * FROM contacts WHERE user_id = :user_id AND (first_name, id) > ('Name5', 0) "
+        "ORDER BY first_name, id LIMIT 101",
+        "ix_contacts_user_id_first_name_id",
+    ),
+    (
+        "Все контакты по имени (суперадмин)",
+        "SELECT * FROM contacts ORDER BY first_name, id LIMIT 100",
+        "ix_contacts_first_name_id",
+    ),
+    (
+        "Телефоны контактов страницы (selectinload)",
+        "SELECT * FROM phone_numbers WHERE contact_id = ANY(:contact_ids)",
+        "ix_phone_numbers_contact_id",
+    ),
+    (
+        "Аватары контактов страницы (selectinload)",
+        "SELECT * FROM avatars WHERE contact_id = ANY(:contact_ids)",
+        "ix_avatars_contact_id",
+    ),
+    (
+        "Фото контактов страницы (selectinload)",
+        "SELECT * FROM photos WHERE contact_id = ANY(:contact_ids)",
+        "ix_photos_contact_id",
+    ),
+    (
+        "Контакты группы (обратная сторона contact_group)",
+        "SELECT contact_id FROM contact_group WHERE group_id = :group_id",
+        "ix_contact_group_group_id_contact_id",
+    ),
+    (
+        "Дни рождения пользователя на неделю (next7days)",
+        "SELECT * FROM contacts WHERE user_id = :user_id AND birthday_md BETWEEN 610 AND 617",
+        "ix_contacts_user_id_birthday_md",
+    ),
+    (
+        "Дни рождения пользователя через Новый год",
+        "SELECT * FROM contacts WHERE user_id = :user_id AND (birthday_md >= 1228 OR birthday_md <= 104)",
+        "ix_contacts_user_id_birthday_md",
+    ),
+    (
+        "Дни рождения всех контактов на неделю (админ)",
+        "SELECT * FROM contacts WHERE birthday_md BETWEEN 610 AND 617",
+        "ix_contacts_birthday_md",
+    ),
+    (
+        "Полнотекстовый поиск (/contacts/fulltext)",
+        "SELECT * FROM contacts WHERE search_vector @@ to_tsquery('simple', 'last12:*')",
+        "ix_contacts_search_vector",
+    ),
+    (
+        "Контакт по номеру телефона (/contacts/by-phone)",
+        "SELECT c.id, c.first_name, p.number FROM contacts c JOIN phone_numbers p ON p.contact_id = c.id "
+        "WHERE p.normalized_number = '15551000'",
+        "ix_phone_numbers_normalized_number",
+    ),
+]
+
+# На маленьких таблицах без данных планировщик законно выбирает Seq Scan,
+# поэтому для них проверяем только, что индекс вообще пригоден для запроса
+SMALL_TABLE_QUERIES = [
+    (
+        "Аватары пользователя",
+        "SELECT * FROM user_avatars WHERE user_id = :user_id",
+        "ix_user_avatars_user_id",
+    ),
+    (
+        "Запросы на смену аватара от пользователя",
+        "SELECT * FROM avatar_request_messages WHERE user_id = :user_id",
+        "ix_avatar_request_messages_user_id",
+    ),
+    (
+        "Запросы по аватару",
+        "SELECT * FROM avatar_request_messages WHERE avatar_id = :user_id",
+        "ix_avatar_request_messages_avatar_id",
+    ),
+    (
+        "Сброс пароля пользователя",
+        "SELECT * FROM password_resets WHERE user_id = :user_id",
+        "ix_password_resets_user_id",
+    ),
+]
+
+
+def plan_indexes(plan: dict) -> set:
+    """Имена индексов из узлов плана (рекурсивно)."""
+    names = set()
+    if "Index Name" in plan:
+        names.add(plan["Index Name"])
+    for child in plan.get("Plans", []):
+        names |= plan_indexes(child)
+    return names
+
+
+def explain(connection, sql: str, params: dict) -> dict:
+    row = connection.execute(text(f"EXPLAIN (FORMAT JSON) {sql}"), params).scalar()
+    if isinstance(row, str):
+        row = json.loads(row)
+    return row[0]["Plan"]
+
+
+def check(connection, queries, params, verbose):
+    failures = []
+    for description, sql, index_name in queries:
+        plan = explain(connection, sql, params)
+        used = plan_indexes(plan)
+        ok = index_name in used
+        print(f"[{'OK' if ok else 'FAIL'}]   {description}: {plan['Node Type']}, индексы {sorted(used) or '-'}")
+        if verbose or not ok:
+            print(json.dumps(plan, indent=2, ensure_ascii=False))
+        if not ok:
+            failures.append(description)
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Проверка использования индексов горячими запросами")
+    parser.add_argument("--users", type=int, default=200, help="сколько тестовых пользователей создать")
+    parser.add_argument("--contacts", type=int, default=500, help="контактов на пользователя")
+    parser.add_argument("--verbose", action="store_true", help="печатать планы целиком")
+    args = parser.parse_args()
+
+    failures = []
+    with engine.connect() as connection:
+        transaction = connection.begin()
+        try:
+            for sql in SEED_SQL:
+                connection.execute(text(sql), {"users": args.users, "contacts": args.contacts})
+            for table in ANALYZE_TABLES:
+                connection.execute(text(f"ANALYZE {table}"))
+
+            user_id = connection.execute(text(
+                "SELECT id FROM users WHERE username = 'explain_user_1'"
+            )).scalar()
+            contact_ids = connection.execute(text(
+                "SELECT id FROM contacts WHERE user_id = :user_id ORDER BY first_name, id LIMIT 100"
+            ), {"user_id": user_id}).scalars().all()
+            group_id = connection.execute(text(
+                "SELECT id FROM groups WHERE name = 'explain_group_1'"
+            )).scalar()
+            params = {"user_id": user_id, "contact_ids": contact_ids, "group_id": group_id}
+
+            total = connection.execute(text("SELECT count(*) FROM contacts")).scalar()
+            print(f"Засеяно: {args.users} пользователей, {total} контактов всего\n")
+
+            failures += check(connection, HOT_QUERIES, params, args.verbose)
+            connection.execute(text("SET LOCAL enable_seqscan = off"))
+            failures += check(connection, SMALL_TABLE_QUERIES, params, args.verbose)
+        finally:
+            transaction.rollback()
+
+    if failures:
+        print(f"\nБез индекса: {len(failures)} запрос(ов)")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Разбивка времени импорта приложения по модулям (python -X importtime).
+
+Импорт main выполняется в отдельном процессе, чтобы замер не искажали уже
+загруженные модули. Показывает самые дорогие модули по собственному и
+накопленному времени и сводку по пакетам верхнего уровня.
+
+    python scripts/profile_startup.py                # импорт main
+    python scripts/profile_startup.py --top 40
+    python scripts/profile_startup.py --module routers.db_utils
+    python scripts/profile_startup.py --raw importtime.log   # сохранить сырой вывод
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_importtime(module: str):
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True,
+    )
+    wall = time.perf_counter() - start
+    if result.returncode != 0:
+        sys.stderr.write(result.stderr[-4000:])
+        sys.exit(result.returncode)
+    return result.stderr, wall
+
+
+def parse(output: str):
+    """Строки вида 'import time: self [us] | cumulative | name' -> [(name, self_us, cumulative_us)]."""
+    rows = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((name.rstrip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+def print_table(title, rows, top):
+    print(f"\n{title}")
+    for name, self_us, cumulative_us in rows[:top]:
+        print(f"  {self_us / 1000:8.1f} мс  {cumulative_us / 1000:8.1f} мс  {name}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Профиль времени импорта приложения")
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--top", type=int, default=25)
+    parser.add_argument("--raw", help="файл для сырого вывода -X importtime")
+    args = parser.parse_args()
+
+    output, wall = run_importtime(args.module)
+    if args.raw:
+        with open(args.raw, "w") as f:
+            f.write(output)
+
+    rows = parse(output)
+    total_us = next((cumulative for name, _, cumulative in rows if name.strip() == args.module), 0)
+    print(f"import {args.module}: {total_us / 1000:.1f} мс, процесс целиком {wall * 1000:.0f} мс, модулей {len(rows)}")
+    print("  (собственное / накопленное время)")
+
+    print_table("Самые дорогие модули (собственное время):", sorted(rows, key=lambda r: -r[1]), args.top)
+    # Накопленное время показываем только для модулей, импортированных напрямую (первый уровень вложенности)
+    direct = [r for r in rows if len(r[0]) - len(r[0].lstrip()) <= 3]
+    print_table("Верхний уровень (накопленное время):", sorted(direct, key=lambda r: -r[2]), args.top)
+
+    packages = defaultdict(int)
+    for name, self_us, _ in rows:
+        packages[name.strip().split(".")[0]] += self_us
+    print("\nПо пакетам (сумма собственного времени):")
+    for package, self_us in sorted(packages.items(), key=lambda p: -p[1])[:args.top]:
+        print(f"  {self_us / 1000:8.1f} мс  {package}")
+
+
+if __name__ == "__main__":
+    main()
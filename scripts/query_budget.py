@@ -0,0 +1,185 @@
+"""
+Проверка бюджета SQL-запросов по эндпоинтам (защита от N+1).
+
+Приложение поднимается в процессе через TestClient, каждый эндпоинт вызывается
+дважды (первый вызов прогревает кеш авторизации), число запросов берётся из
+заголовка X-DB-Queries. Если эндпоинт превысил бюджет, скрипт завершается с кодом 1.
+
+Автоматически скрипт нигде не запускается: CI в репозитории нет, и шаг нужно
+подключить вручную. Ему нужен живой PostgreSQL (DATABASE_URL) с тестовыми контактами
+(без них бюджеты проверяются на пустых выборках); схему и суперадмина создаёт
+старт приложения внутри TestClient.
+
+    python scripts/query_budget.py --username admin --password secret
+
+По умолчанию используется суперадмин из SUPERADMIN_USERNAME/SUPERADMIN_PASSWORD:
+ему доступны все эндпоинты, включая сгруппированные по пользователям.
+
+После первого прохода засеваются --scale тестовых пользователей (по умолчанию 300)
+по два контакта (дни рождения в ближайшую неделю) и проход повторяется: число
+запросов каждого эндпоинта с бюджетом не должно измениться. Засеянных контактов
+по умолчанию больше 500 — размера пачки, которой selectinload подгружает связи, так что
+эндпоинт без лимита в SQL на этом проходе выдаст лишние запросы. Тестовые данные
+удаляются в конце; --scale 0 — только первый проход.
+
+    python scripts/query_budget.py --scale 1000
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+from database import engine
+from settings import settings
+from request_timing import assert_response_queries
+
+# Бюджет не зависит от объёма данных: число запросов должно быть постоянным.
+# Связи контактов грузятся selectinload — по запросу на связь (4) для всей выборки.
+# {contact_id} — первый контакт из /contacts/ того же пользователя
+# None — бюджет не задан, число только выводится
+ENDPOINT_BUDGETS = [
+    ("/contacts/", 5),
+    ("/contacts/?search=a", 5),
+    # fields=/include= — только нужные колонки и связи: без связей один запрос
+    ("/contacts/?fields=first_name,last_name,email,birthday&include=", 1),
+    ("/contacts/?fields=first_name,last_name,email,birthday&include=avatars", 2),
+    ("/contacts/search/?query=a", 5),
+    ("/contacts/fulltext?q=a", 6),
+    ("/contacts/by-phone/380501234567", 2),
+    ("/contacts/grouped", 6),
+    ("/contacts/grouped?fields=first_name,email&include=", 2),
+    ("/contacts/grouped/birthdays", 6),
+    ("/contacts/birthdays/", 5),
+    ("/contacts/birthdays/next7days", 5),
+    ("/contacts/birthdays/next12months", 5),
+    ("/contacts/{contact_id}", 5),
+    ("/groups/groups/", 1),
+    ("/users/me", 2),
+    ("/users/avatars", 2),
+]
+
+SCALE_USER = "query_budget_user_"
+# По два контакта на пользователя: 600 контактов — больше одной пачки selectinload (500 ключей)
+SCALE_USERS = 300
+
+SCALE_SEED_SQL = [
+    """
+    INSERT INTO users (username, email, hashed_password, role, is_verified)
+    SELECT :prefix || g, :prefix || g || '@example.com', 'x', 'user', true
+    FROM generate_series(1, :users) AS g
+    """,
+    """
+    INSERT INTO contacts (user_id, first_name, last_name, email, birthday)
+    SELECT u.id, 'Budget' || g, 'User' || u.id, 'b' || u.id || '_' || g || '@example.com',
+           CURRENT_DATE - interval '30 years' + g * interval '3 days'
+    FROM users u CROSS JOIN generate_series(0, 1) AS g
+    WHERE u.username LIKE :pattern
+    """,
+    """
+    INSERT INTO phone_numbers (contact_id, number, normalized_number, label)
+    SELECT c.id, '+1555' || c.id, '1555' || c.id, 'mobile'
+    FROM contacts c JOIN users u ON u.id = c.user_id
+    WHERE u.username LIKE :pattern
+    """,
+]
+
+SCALE_CLEANUP_SQL = [
+    "DELETE FROM phone_numbers WHERE contact_id IN "
+    "(SELECT c.id FROM contacts c JOIN users u ON u.id = c.user_id WHERE u.username LIKE :pattern)",
+    "DELETE FROM contacts WHERE user_id IN (SELECT id FROM users WHERE username LIKE :pattern)",
+    "DELETE FROM users WHERE username LIKE :pattern",
+]
+
+
+def scale_params(users: int) -> dict:
+    return {"prefix": SCALE_USER, "pattern": SCALE_USER.replace("_", "\\_") + "%", "users": users}
+
+
+def run_sql(statements, params):
+    with engine.begin() as connection:
+        for sql in statements:
+            connection.execute(text(sql), params)
+
+
+def measure(client, headers, contact_id) -> dict:
+    """Число запросов по эндпоинтам; None — эндпоинт недоступен этому пользователю."""
+    counts = {}
+    for path, _ in ENDPOINT_BUDGETS:
+        url = path.format(contact_id=contact_id)
+        client.get(url, headers=headers)
+        response = client.get(url, headers=headers)
+        counts[path] = (response, int(response.headers.get("X-DB-Queries", -1))) \
+            if response.status_code < 400 else None
+    return counts
+
+
+def check_budgets(counts) -> list:
+    failures = []
+    for path, budget in ENDPOINT_BUDGETS:
+        if counts[path] is None:
+            print(f"[SKIP] {path}")
+            continue
+        response, queries = counts[path]
+        if budget is None:
+            print(f"[INFO] {path}: {queries} запросов (бюджет не задан)")
+            continue
+        try:
+            assert_response_queries(response, budget)
+            print(f"[OK]   {path}: {queries} запросов (бюджет {budget})")
+        except AssertionError as e:
+            print(f"[FAIL] {e}")
+            failures.append(path)
+    return failures
+
+
+def check_constant(before, after) -> list:
+    failures = []
+    for path, budget in ENDPOINT_BUDGETS:
+        if budget is None or before[path] is None or after[path] is None:
+            continue
+        queries_before, queries_after = before[path][1], after[path][1]
+        ok = queries_before == queries_after
+        print(f"[{'OK' if ok else 'FAIL'}]   {path}: {queries_before} -> {queries_after} запросов")
+        if not ok:
+            failures.append(path)
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Проверка бюджета SQL-запросов по эндпоинтам")
+    parser.add_argument("--username", default=settings.superadmin_username)
+    parser.add_argument("--password", default=settings.superadmin_password)
+    parser.add_argument("--scale", type=int, default=SCALE_USERS,
+                        help="засеять столько пользователей и проверить, что число запросов не растёт")
+    args = parser.parse_args()
+
+    from main import app
+
+    with TestClient(app) as client:
+        response = client.post("/token", data={"username": args.username, "password": args.password})
+        response.raise_for_status()
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+        contacts = client.get("/contacts/?limit=1", headers=headers).json()
+        contact_id = contacts[0]["id"] if contacts else 0
+
+        before = measure(client, headers, contact_id)
+        failures = check_budgets(before)
+
+        if args.scale:
+            params = scale_params(args.scale)
+            try:
+                run_sql(SCALE_SEED_SQL, params)
+                print(f"\nЗасеяно {args.scale} пользователей по 2 контакта, повторный проход:")
+                failures += check_constant(before, measure(client, headers, contact_id))
+            finally:
+                run_sql(SCALE_CLEANUP_SQL, params)
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Настройки приложения из переменных окружения.
+
+.env читается один раз при импорте, объект settings создаётся один раз,
+остальные модули берут значения из него, а не из os.getenv.
+"""
+import os
+from functools import lru_cache
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.lower() in ("true", "1", "t")
+
+
+# Проверка, запущено ли приложение на Render.com
+@lru_cache(maxsize=None)
+def is_render_environment():
+    return os.environ.get('RENDER') == 'true' or os.environ.get('RENDER_EXTERNAL_HOSTNAME') is not None
+
+
+# Проверка, запущено ли приложение в Docker. Результат кешируется:
+# окружение за время жизни процесса не меняется, а /proc читать на каждый вызов незачем
+@lru_cache(maxsize=None)
+def is_docker_environment():
+    # Несколько способов определения Docker-контейнера
+    # 1. Проверяем наличие файла /.dockerenv, который есть в Docker контейнерах
+    docker_env = os.path.exists("/.dockerenv")
+
+    # 2. Проверяем переменную окружения, которую можем сами установить в Dockerfile или docker-compose
+    docker_env_var = os.environ.get('DOCKER_ENV') == 'true'
+
+    # 3. Проверяем, является ли hostname контейнерным ID (обычно короткий хеш)
+    try:
+        with open('/proc/self/cgroup', 'r') as f:
+            docker_cgroup = any('docker' in line for line in f)
+    except:
+        docker_cgroup = False
+
+    # 4. Проверяем наличие переменной окружения DB_HOST=db (типичная для docker-compose)
+    docker_db_host = os.environ.get('DB_HOST') == 'db'
+
+    # Используем один из этих методов
+    return docker_env or docker_env_var or docker_cgroup or docker_db_host
+
+
+class Settings:
+    def __init__(self):
+        deployed = is_render_environment() or is_docker_environment()
+
+        # ---- JWT и сессии ----
+        self.secret_key = os.getenv("SECRET_KEY", "default_secret_key")
+
+        # ---- Суперадмин ----
+        self.superadmin_username = os.getenv("SUPERADMIN_USERNAME")
+        self.superadmin_password = os.getenv("SUPERADMIN_PASSWORD")
+        self.super_admin_email = os.getenv("SUPER_ADMIN_EMAIL")
+        self.superadmin_email = os.getenv("SUPERADMIN_EMAIL")
+
+        # ---- Подключение к БД ----
+        # Без значений по умолчанию: они зависят от окружения (Docker, Render, локально)
+        # и подставляются в database.get_database_url
+        self.database_url = os.getenv("DATABASE_URL")
+        self.render_database_url = os.getenv("RENDER_DATABASE_URL")
+        self.db_name = os.getenv("DB_NAME")
+        self.db_user = os.getenv("DB_USER")
+        self.db_password = os.getenv("DB_PASSWORD")
+        self.db_host = os.getenv("DB_HOST")
+        self.db_port = os.getenv("DB_PORT", "5432")
+        self.render_external_hostname = os.getenv("RENDER_EXTERNAL_HOSTNAME")
+
+        # ---- Пул соединений ----
+        self.db_pool_size = int(os.getenv("DB_POOL_SIZE", "5"))
+        self.db_max_overflow = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+        self.db_pool_timeout = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+        self.db_pool_recycle = int(os.getenv("DB_POOL_RECYCLE", "3600"))
+        self.db_pool_pre_ping = env_bool("DB_POOL_PRE_PING", True)
+        self.db_pgbouncer = env_bool("DB_PGBOUNCER", False)
+
+        # ---- Реплика ----
+        self.replica_database_url = os.getenv("REPLICA_DATABASE_URL")
+        self.db_replica_sticky_seconds = float(os.getenv("DB_REPLICA_STICKY_SECONDS", "5"))
+
+        # ---- Миграции и старт ----
+        self.migrate_on_startup = env_bool("MIGRATE_ON_STARTUP", True)
+        self.db_connect_retries = int(os.getenv("DB_CONNECT_RETRIES", "10" if deployed else "5"))
+        self.db_connect_backoff = float(os.getenv("DB_CONNECT_BACKOFF", "0.5"))
+        self.db_connect_backoff_max = float(os.getenv("DB_CONNECT_BACKOFF_MAX", "5"))
+
+        # ---- Учёт запросов: Server-Timing и бюджет SQL-запросов на HTTP-запрос (0 — без проверки) ----
+        self.request_timing_enabled = env_bool("REQUEST_TIMING_ENABLED", True)
+        self.query_budget = int(os.getenv("QUERY_BUDGET", "20"))
+
+        # ---- Поиск ----
+        # Предел времени полнотекстового поиска (statement_timeout), мс
+        self.fulltext_search_timeout_ms = int(os.getenv("FULLTEXT_SEARCH_TIMEOUT_MS", "2000"))
+
+        # ---- Кеш аутентификации ----
+        self.auth_cache_ttl = int(os.getenv("AUTH_CACHE_TTL", "60"))
+        self.auth_cache_maxsize = int(os.getenv("AUTH_CACHE_MAXSIZE", "1024"))
+        self.auth_cache_enabled = env_bool("AUTH_CACHE_ENABLED", True)
+
+        # ---- Хеширование паролей ----
+        self.password_hash_workers = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+        self.password_hash_max_queue = int(os.getenv("PASSWORD_HASH_MAX_QUEUE", "32"))
+        self.bcrypt_rounds = os.getenv("BCRYPT_ROUNDS")
+        self.bcrypt_target_ms = float(os.getenv("BCRYPT_TARGET_MS", "250"))
+        self.bcrypt_min_rounds = int(os.getenv("BCRYPT_MIN_ROUNDS", "10"))
+        self.bcrypt_max_rounds = int(os.getenv("BCRYPT_MAX_ROUNDS", "14"))
+        self.bcrypt_calibrate = env_bool("BCRYPT_CALIBRATE", True)
+
+        # ---- Redis и rate limiting ----
+        # Для Render.com проверяем как REDIS_URL, так и RENDER_REDIS_URL
+        self.redis_url = os.getenv("REDIS_URL") or os.getenv("RENDER_REDIS_URL")
+        self.rate_limit_enabled = env_bool("RATE_LIMIT_ENABLED", True)
+
+        # ---- Email ----
+        self.email_host = os.getenv("EMAIL_HOST")
+        self.email_port = int(os.getenv("EMAIL_PORT") or 0)
+        self.email_host_user = os.getenv("EMAIL_HOST_USER")
+        self.email_host_password = os.getenv("EMAIL_HOST_PASSWORD")
+
+        # ---- Cloudinary ----
+        self.cloudinary_cloud_name = os.getenv("CLOUDINARY_CLOUD_NAME")
+        self.cloudinary_api_key = os.getenv("CLOUDINARY_API_KEY")
+        self.cloudinary_api_secret = os.getenv("CLOUDINARY_API_SECRET")
+
+
+@lru_cache(maxsize=None)
+def get_settings() -> Settings:
+    return Settings()
+
+
+settings = get_settings()
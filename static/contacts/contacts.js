@@ -92,6 +92,20 @@ let expandedContactId = null; // id индивидуально раскрыто
 let birthdayMode = false; // глобальный режим дней рождений
 let contactsCache = []; // Глобальный кэш контактов
 
+// /contacts/grouped отдаёт пользователей и их контакты страницами
+const GROUPED_USERS_LIMIT = 50;
+const GROUPED_CONTACTS_LIMIT = 20;
+let groupedUsersHasMore = false; // последняя страница пользователей была полной — есть ещё
+
+function groupedContactsUrl(extraParams = {}) {
+  const search = document.getElementById('contact-search')?.value || '';
+  const params = {users_limit: GROUPED_USERS_LIMIT, contacts_limit: GROUPED_CONTACTS_LIMIT, ...extraParams};
+  if (search) params.search = search;
+  if (alphaSortDir) params.sort = alphaSortDir;
+  return '/contacts/grouped?' + Object.entries(params)
+    .map(([key, value]) => key + '=' + encodeURIComponent(value)).join('&');
+}
+
 // --- Перемикач вигляду контактів ---
 document.addEventListener('DOMContentLoaded', function() {
   // Храним последнюю нажатую кнопку режима для предотвращения повторных запросов
@@ -344,12 +358,14 @@ async function fetchContacts() {
       return [];
     }
   } else {
-    // Для админа и супер-админа — новый endpoint
-    const url = '/contacts/grouped' + (params.length ? '?' + params.join('&') : '');
+    // Для админа и супер-админа — новый endpoint (первая страница пользователей)
+    const url = groupedContactsUrl();
     try {
       console.log('Выполняется запрос для админа/суперадмина:', url);
       // Используем authorizedFetch для отправки JWT-токена
-      return await authorizedFetch(url);
+      const groups = await authorizedFetch(url);
+      groupedUsersHasMore = Array.isArray(groups) && groups.length === GROUPED_USERS_LIMIT;
+      return groups;
     } catch (error) {
       console.error('Ошибка при запросе контактов для админа/суперадмина:', error, 'userRole =', userRole);
       // Если запрос к групповому эндпоинту не удался, попробуем обычный эндпоинт как запасной вариант
@@ -448,8 +464,14 @@ async function renderContacts() {
           html += '<div style="margin-left:1em;opacity:0.7">— Контактів немає —</div>';
         }
         
-        html += `</div>
-        </div><hr style="margin:14px 0;opacity:0.2">`;
+        html += `</div>`;
+        if (user.contacts_next_cursor) {
+          html += `<button class="load-more-contacts-btn" data-user-id="${user.id}" data-cursor="${user.contacts_next_cursor}">Показати ще</button>`;
+        }
+        html += `</div><hr style="margin:14px 0;opacity:0.2">`;
+      }
+      if (groupedUsersHasMore) {
+        html += '<button class="load-more-users-btn">Показати більше користувачів</button>';
       }
     }
     list.innerHTML = html;
@@ -1369,3 +1391,31 @@ document.addEventListener('DOMContentLoaded', function() {
 // Экспортируем функции для использования в других модулях
 window.resetContactsUI = resetContactsUI;
 window.fetchAndRenderContacts = fetchAndRenderContacts;
+
+// Догрузка страниц /contacts/grouped: контакты одного пользователя и следующие пользователи
+document.addEventListener('click', async function(e) {
+  const moreContactsBtn = e.target.closest('.load-more-contacts-btn');
+  const moreUsersBtn = e.target.closest('.load-more-users-btn');
+  if (!moreContactsBtn && !moreUsersBtn) return;
+  (moreContactsBtn || moreUsersBtn).disabled = true;
+  try {
+    if (moreContactsBtn) {
+      const page = await authorizedFetch(groupedContactsUrl({contacts_cursor: moreContactsBtn.dataset.cursor}));
+      const group = Array.isArray(page) ? page[0] : null;
+      const user = contactsCache.find(u => String(u.id) === moreContactsBtn.dataset.userId);
+      if (group && user) {
+        user.contacts = (user.contacts || []).concat(group.contacts);
+        user.contacts_next_cursor = group.contacts_next_cursor;
+      }
+    } else {
+      const lastUser = contactsCache[contactsCache.length - 1];
+      const page = await authorizedFetch(groupedContactsUrl({after_user_id: lastUser ? lastUser.id : 0}));
+      const groups = Array.isArray(page) ? page : [];
+      contactsCache = contactsCache.concat(groups);
+      groupedUsersHasMore = groups.length === GROUPED_USERS_LIMIT;
+    }
+  } catch (error) {
+    console.error('Ошибка при догрузке контактов:', error);
+  }
+  renderContacts();
+});
@@ -1,18 +1,21 @@
-import os
-import cloudinary
-import cloudinary.uploader
-from cloudinary.utils import cloudinary_url
-from dotenv import load_dotenv
+from functools import lru_cache
+from settings import settings
 
-# Завантажуємо змінні середовища з .env файлу
-load_dotenv()
+# SDK Cloudinary импортируется и настраивается при первой операции с аватарами,
+# а не при старте приложения
+@lru_cache(maxsize=None)
+def get_cloudinary():
+    import cloudinary
+    import cloudinary.uploader
+    import cloudinary.utils
 
-# Конфигурация Cloudinary
-cloudinary.config(
-    cloud_name=os.getenv('CLOUDINARY_CLOUD_NAME'),
-    api_key=os.getenv('CLOUDINARY_API_KEY'),
-    api_secret=os.getenv('CLOUDINARY_API_SECRET')
-)
+    # Конфигурация Cloudinary
+    cloudinary.config(
+        cloud_name=settings.cloudinary_cloud_name,
+        api_key=settings.cloudinary_api_key,
+        api_secret=settings.cloudinary_api_secret
+    )
+    return cloudinary
 
 def upload_image(file, folder="avatars"):
     """
@@ -22,7 +25,7 @@ def upload_image(file, folder="avatars"):
     :return: URL загруженного изображения и public_id
     """
     try:
-        result = cloudinary.uploader.upload(
+        result = get_cloudinary().uploader.upload(
             file,
             folder=folder,
             overwrite=True,
@@ -42,7 +45,7 @@ def delete_image(public_id):
     :return: результат видалення
     """
     try:
-        result = cloudinary.uploader.destroy(public_id)
+        result = get_cloudinary().uploader.destroy(public_id)
         return result
     except Exception as e:
         print(f"Error deleting from cloudinary: {e}")
@@ -56,7 +59,7 @@ def generate_url(public_id, **options):
     :return: URL изображения
     """
     try:
-        url, options = cloudinary_url(public_id, **options)
+        url, options = get_cloudinary().utils.cloudinary_url(public_id, **options)
         return url
     except Exception as e:
         print(f"Error generating cloudinary URL: {e}")
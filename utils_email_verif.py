@@ -1,27 +1,31 @@
-import os
-import aiosmtplib
 from email.message import EmailMessage
+from settings import settings
+
+async def send_message(msg: EmailMessage):
+    # aiosmtplib подгружается только при отправке письма, а не при старте приложения
+    import aiosmtplib
+    await aiosmtplib.send(
+        msg,
+        hostname=settings.email_host,
+        port=settings.email_port,
+        username=settings.email_host_user,
+        password=settings.email_host_password,
+        start_tls=True
+    )
 
 async def send_verification_email(to_email: str, code: str):
     msg = EmailMessage()
-    msg['From'] = os.getenv("EMAIL_HOST_USER")
+    msg['From'] = settings.email_host_user
     msg['To'] = to_email
     msg['Subject'] = "Код підтвердження реєстрації"
     msg.set_content(f"Ваш код підтвердження: {code}")
 
-    await aiosmtplib.send(
-        msg,
-        hostname=os.getenv("EMAIL_HOST"),
-        port=int(os.getenv("EMAIL_PORT")),
-        username=os.getenv("EMAIL_HOST_USER"),
-        password=os.getenv("EMAIL_HOST_PASSWORD"),
-        start_tls=True
-    )
+    await send_message(msg)
 
 # Добавляем новую функцию для отправки ссылки сброса пароля
 async def send_password_reset_email(to_email: str, reset_url: str, username: str = ""):
     msg = EmailMessage()
-    msg['From'] = os.getenv("EMAIL_HOST_USER")
+    msg['From'] = settings.email_host_user
     msg['To'] = to_email
     msg['Subject'] = "Скидання пароля для вашого облікового запису"
     
@@ -53,11 +57,4 @@ async def send_password_reset_email(to_email: str, reset_url: str, username: str
     msg.add_alternative(html_content, subtype='html')
 
     # Отправляем email
-    await aiosmtplib.send(
-        msg,
-        hostname=os.getenv("EMAIL_HOST"),
-        port=int(os.getenv("EMAIL_PORT")),
-        username=os.getenv("EMAIL_HOST_USER"),
-        password=os.getenv("EMAIL_HOST_PASSWORD"),
-        start_tls=True
-    )
+    await send_message(msg)
@@ -0,0 +1,15 @@
+import re
+
+# Нормализованный номер — только цифры в международном формате без "+" (E.164 без знака):
+# "+38 (050) 123-45-67" -> "380501234567", "0049 30 1234567" -> "49301234567".
+# Номер без кода страны остаётся как набран: код по нему не восстановить.
+# То же правило в SQL — для пакетного заполнения в миграции
+NORMALIZE_PHONE_SQL = "regexp_replace(regexp_replace({column}, '[^0-9]+', '', 'g'), '^00', '')"
+
+
+def normalize_phone_number(number: str) -> str:
+    digits = re.sub(r"[^0-9]+", "", number or "")
+    # Международный префикс 00 эквивалентен "+"
+    if digits.startswith("00"):
+        digits = digits[2:]
+    return digits